@@ -1,8 +1,10 @@
 import argparse
 from classes.dbnqa_dataset import DBNQADataset
+from common.question_correction import SymSpellCorrector
 
 def main(args: argparse.Namespace) -> None:
-    processed_dataset = DBNQADataset(args.nl, args.sparql, subset=args.subset)
+    spell_corrector = SymSpellCorrector.from_file(args.lexicon) if args.lexicon else None
+    processed_dataset = DBNQADataset(args.nl, args.sparql, subset=args.subset, spell_corrector=spell_corrector)
     processed_dataset.save(f'{args.out_dir}/dataset.json')
 
 if __name__ == "__main__":
@@ -21,6 +23,9 @@ if __name__ == "__main__":
     parser.add_argument("--subset", type=int, default=None,
                         help="create a subset of size N")
 
+    parser.add_argument("--lexicon", type=str, default=None,
+                        help="optional path to a lexicon file (one 'word count' per line) used to correct unseen typos in questions")
+
 
     args = parser.parse_args()
 
@@ -9,15 +9,17 @@ from typer import Option
 from classes.dataset import Dataset
 from classes.entry import Entry
 
-from common.consts import GET_RESOURCES_INTERM_SPARQL_RE, GET_RESOURCES_PURE_SPARQL_RE, RE_TEMPLATE_EXCLUDE_SPECIFIC_RESOURCES
+from common.consts import GET_RESOURCES_PURE_SPARQL_RE, RE_TEMPLATE_EXCLUDE_SPECIFIC_RESOURCES
 from common.interm_sparql_to_pure_sparql import interm_sparql_to_pure_sparql
+from common.question_correction import SymSpellCorrector
 from common.re_callbacks import escape_uri_for_regex, replace_resource_with_uri
+from common.resource_lexer import findall_interm_sparql_resources
 
 
 class DBNQADataset(Dataset):
 
-    def __init__(self, nl_data_path: str, sparql_data_path: str, subset: Optional[int] = None, train_ratio: float = 0.8, valid_ratio: float = 0.1, test_ratio: float = 0.1):
-        super().__init__(train_ratio, valid_ratio, test_ratio)
+    def __init__(self, nl_data_path: str, sparql_data_path: str, subset: Optional[int] = None, train_ratio: float = 0.8, valid_ratio: float = 0.1, test_ratio: float = 0.1, spell_corrector: Optional[SymSpellCorrector] = None):
+        super().__init__(train_ratio, valid_ratio, test_ratio, spell_corrector)
         self.nl_data_path = nl_data_path
         self.sparql_data_path = sparql_data_path
 
@@ -66,13 +68,11 @@ class DBNQADataset(Dataset):
     def generate_uri_interm_sparql(self, interm_sparql: str, pure_sparql: str) -> str:
         entities_pure_sparql = GET_RESOURCES_PURE_SPARQL_RE.findall(
             pure_sparql)
-        entities_interm_sparql = GET_RESOURCES_INTERM_SPARQL_RE.findall(
+        entities_interm_sparql = findall_interm_sparql_resources(
             interm_sparql)
 
         assert len(entities_pure_sparql) == len(entities_interm_sparql)
 
-        entities_interm_sparql = [parts[0] for parts in entities_interm_sparql]
-
         interm_sparql_all = interm_sparql
 
         for pure, interm in zip(entities_pure_sparql, entities_interm_sparql):
@@ -86,7 +86,7 @@ class DBNQADataset(Dataset):
     def complete_dataset(self) -> None:
         for entry in tqdm(self.entries):
             entry.question.question = self.correct_question(
-                entry.get_from_original_data('question'))
+                entry.get_from_original_data('question'), entry.get_from_original_data('interm_sparql'))
             entry.query.interm_sparql = self.correct_interm_sparql(
                 entry.get_from_original_data('interm_sparql'))
             entry.query.pure_sparql = interm_sparql_to_pure_sparql(
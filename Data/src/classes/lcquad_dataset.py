@@ -5,6 +5,7 @@ from common.consts import GET_RESOURCES_PURE_SPARQL_RE, RE_TEMPLATE_EXCLUDE_SPEC
 from common.utils import reduce_uri
 from classes.dataset import Dataset
 from classes.entry import Entry, Flags, Query, Question
+from common.question_correction import SymSpellCorrector
 from common.re_callbacks import escape_uri_for_regex, convert_to_interm_sparql_except_resources, encode_resources_in_interm_sparql, lowercase_except_resources, encode_resources_in_pure_sparql, replace_resource_with_uri
 
 def correct_resources_tags(resources_tags: List[str], template_id: Union[str, int], n_resources: int) -> List[str]:
@@ -58,8 +59,8 @@ class LCQUADDataset(Dataset):
     RE_ONLY_RESOURCES = re.compile("(<.*?>)", flags=re.IGNORECASE)
 
     # Replacement flags order: (dbr, dbp, dbc, dbo)
-    def __init__(self, train_data_path: Optional[str] = None, test_data_path: Optional[str] = None): # uri_replacement_flags: Tuple[bool, bool, bool, bool] = (False, False, False, False)):
-        super().__init__()
+    def __init__(self, train_data_path: Optional[str] = None, test_data_path: Optional[str] = None, spell_corrector: Optional[SymSpellCorrector] = None): # uri_replacement_flags: Tuple[bool, bool, bool, bool] = (False, False, False, False)):
+        super().__init__(spell_corrector=spell_corrector)
         self.train_data_path = train_data_path
         self.test_data_path = test_data_path
         # self.uri_replacement_flags = uri_replacement_flags
@@ -186,7 +187,7 @@ class LCQUADDataset(Dataset):
 
     def _get_untagged_question(self, entry: Entry) -> str:
         question = self.correct_question(
-            entry.get_from_original_data('lcquad', 'intermediary_question'))
+            entry.get_from_original_data('lcquad', 'intermediary_question'), entry.get_from_original_data('lcquad', 'sparql_query'))
 
         question = question.replace("'s", " 's ")
         question = question.replace(",", " , ")
@@ -200,7 +201,7 @@ class LCQUADDataset(Dataset):
 
     def _tag_templated_question(self, entry: Entry, template, repl_flags: Flags) -> str:
         question = self.correct_question(
-                entry.get_from_original_data('lcquad', 'intermediary_question'))
+                entry.get_from_original_data('lcquad', 'intermediary_question'), entry.get_from_original_data('lcquad', 'sparql_query'))
     
         if entry.template_id == 2:
             question = re.sub('(what|who) (is|are) the <(.*?)> of (.*?) \?', r"\1 \2 the <\3> of <\4> ?", question)
@@ -268,7 +269,7 @@ class LCQUADDataset(Dataset):
         for entry in self.entries:
             entry.template_id = self.correct_template_id(int(entry.template_id))
             entry.question.question = self.correct_question(
-                entry.get_from_original_data('lcquad','corrected_question'))
+                entry.get_from_original_data('lcquad','corrected_question'), entry.get_from_original_data('lcquad','sparql_query'))
             entry.query.pure_sparql = self.generate_pure_sparql(
                 entry.get_from_original_data('lcquad','sparql_query'))
 
@@ -6,12 +6,13 @@ from classes.entry import Entry, Flags
 from classes.dataset import Dataset
 from common.consts import FIND_RESOURCES_BTW_ANGLE_BRACKETS_RE
 from common.interm_sparql_to_pure_sparql import interm_sparql_to_pure_sparql
+from common.question_correction import SymSpellCorrector
 from common.re_callbacks import insert_resources
 
 
 class MonumentDataset(Dataset):
-    def __init__(self, nl_data_path: Optional[str] = None, sparql_data_path: Optional[str] = None, templates_path: Optional[str] = None, assign_templates: bool = True):
-        super().__init__()
+    def __init__(self, nl_data_path: Optional[str] = None, sparql_data_path: Optional[str] = None, templates_path: Optional[str] = None, assign_templates: bool = True, spell_corrector: Optional[SymSpellCorrector] = None):
+        super().__init__(spell_corrector=spell_corrector)
         if nl_data_path is not None and sparql_data_path is not None:
             self.load(nl_data_path=nl_data_path,
                       sparql_data_path=sparql_data_path, templates_path=templates_path)
@@ -181,7 +182,7 @@ class MonumentDataset(Dataset):
     def correct_dataset(self) -> None:
         for entry in self.entries:
             entry.question.question = self.correct_question(
-                entry.get_from_original_data('question'))
+                entry.get_from_original_data('question'), entry.get_from_original_data('interm_sparql'))
             entry.query.interm_sparql = self.correct_interm_sparql(
                 entry.get_from_original_data('interm_sparql'))
             entry.query.pure_sparql = interm_sparql_to_pure_sparql(
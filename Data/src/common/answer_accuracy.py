@@ -4,202 +4,492 @@
 
 import argparse
 import json
-from typing import Dict, List
-from torchtext.data.metrics import bleu_score
-
-from tqdm import tqdm
-from common.interm_sparql_to_pure_sparql import escape_query, interm_sparql_to_pure_sparql
-from common.query_dbpedia import query_dbpedia
-
-from Levenshtein import distance as levenshtein_distance
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from common.bleu import BleuStats
+from common.cassette import Cassette, open_cassette
+from common.evaluation_metrics import EvaluationMetrics, StageTimings, write_csv
+from common.interm_sparql_to_pure_sparql import PURE_SPARQL_DECODER, escape_many, escape_query, interm_sparql_to_pure_sparql
+from common.kb_edit_distance import KBInterner, entry_edit_distance, entry_edit_distances, similarity
+from common.query_cache import DEFAULT_CACHE_PATH, QueryCache, open_cache, temporary_cache
+from common.query_dbpedia import print_cache_stats, query_dbpedia_many
+from common.query_executor import QueryResult
+from common.query_metrics import QueryMetrics
+from common.query_retry import is_transient
+from common.report_stream import iter_chunks, iter_report
+from common.result_fingerprint import fingerprint_result, get_fingerprint
+from common.shared_results import SharedResults
+from common.sparql_canonicalizer import canonicalize_sparql
+from common.triple_store import TripleStore
+
+# entries of a report translated and queried at a time
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def clean_pure_sparql(pure_sparql: str) -> str:
+    pure_sparql = pure_sparql.replace(' var_b ', ' ?b ')
+    pure_sparql = pure_sparql.replace('<', '')
+    return pure_sparql.replace('>', '')
 
 
 def generate_pure_sparql(interm_sparql: str) -> str:
     pure_sparql: str = interm_sparql_to_pure_sparql(interm_sparql)
     pure_sparql = escape_query(pure_sparql)
-    pure_sparql = pure_sparql.replace(' var_b ', ' ?b ')
-    pure_sparql = pure_sparql.replace('<', '')
-    return pure_sparql.replace('>', '')
+    return clean_pure_sparql(pure_sparql)
+
+
+def generate_pure_sparql_many(interm_sparql: List[str]) -> List[str]:
+    pure_sparql = escape_many(PURE_SPARQL_DECODER.convert_many(interm_sparql))
+    return [clean_pure_sparql(q) for q in pure_sparql]
 
 
 def generate_pure_sparql_for_report(partial_report: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    pure_trg = generate_pure_sparql_many([entry['trg'] for entry in partial_report])
+    pure_predicted = generate_pure_sparql_many([entry['predicted'] for entry in partial_report])
 
-    for id in range(len(partial_report)):
-        partial_report[id]['pure_trg'] = generate_pure_sparql(partial_report[id]['trg'])
-        partial_report[id]['pure_predicted']= generate_pure_sparql(partial_report[id]['predicted'])
+    for entry, trg, predicted in zip(partial_report, pure_trg, pure_predicted):
+        entry['pure_trg'] = trg
+        entry['pure_predicted'] = predicted
 
     return partial_report
 
 
-def query_dbpedia_for_report(complete_report: List[Dict[str, str]], predicted=False) -> List[Dict[str, str]]:
-    dbpedia_key = 'predicted' if predicted else 'trg'
-    pure_sparql_key = 'pure_predicted' if predicted else 'pure_trg'
-
-    for entry in tqdm(complete_report):
-        try:
-            dbpedia_data = entry.get('dbpedia', {'predicted': {}, 'trg': {}})
-            dbpedia_data[dbpedia_key]['query_result'] = query_dbpedia(entry[pure_sparql_key])
-            dbpedia_data[dbpedia_key]['is_error'] = False
-            entry['dbpedia'] = dbpedia_data
-
-        except Exception as error:
+def query_dbpedia_for_report(complete_report: List[Dict[str, Any]], predicted=False, cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+                             concurrency: int = 8, rate: Optional[float] = None, timeout: float = 60.0,
+                             local_store: Optional[TripleStore] = None, cassette: Optional[Cassette] = None,
+                             batch: bool = False, retries: int = 3) -> List[Dict[str, Any]]:
+    return query_dbpedia_for_report_sides(complete_report, [predicted], cache_path, concurrency, rate, timeout, local_store, cassette,
+                                          batch, retries)
+
+
+# endpoints under which the results and the errors of the previous chunks are kept, the errors as their message
+SEEN_RESULTS = 'seen'
+SEEN_ERRORS = 'seen_errors'
+
+
+def remember_seen(seen: QueryCache, canonical_query: str, result: QueryResult) -> None:
+    # the transient failures are not kept, the query is sent again
+    if not isinstance(result, Exception):
+        seen.put(canonical_query, SEEN_RESULTS, result)
+    elif not is_transient(result):
+        seen.put(canonical_query, SEEN_ERRORS, {'message': result.args[0] if result.args else str(result)})
+
+
+def recall_seen(seen: QueryCache, canonical_query: str) -> Optional[QueryResult]:
+    result = seen.get(canonical_query, SEEN_RESULTS)
+    if result is not None:
+        return result
+    error = seen.get(canonical_query, SEEN_ERRORS)
+    return RuntimeError(error['message']) if error is not None else None
+
+
+def query_dbpedia_for_report_sides(complete_report: List[Dict[str, Any]], sides: List[bool], cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+                                   concurrency: int = 8, rate: Optional[float] = None, timeout: float = 60.0,
+                                   local_store: Optional[TripleStore] = None, cassette: Optional[Cassette] = None,
+                                   batch: bool = False, retries: int = 3, metrics: Optional[QueryMetrics] = None,
+                                   shared: Optional[SharedResults] = None, timings: Optional[StageTimings] = None,
+                                   seen: Optional[QueryCache] = None, reader: Hashable = None) -> List[Dict[str, Any]]:
+    # sides lists the predicted flags to query, each distinct canonical query of these sides is only sent once and its
+    # result is given to every entry that uses it (a prediction equivalent to its target, a target shared by entries)
+    # A query that still failed for a transient reason after its retries is marked is_transient, it is an error of the
+    # endpoint and not of the model. With timings, the time spent on the gold and on the predicted queries is added to it.
+    # seen holds the results of the canonical queries of the previous calls (the previous chunks of a report run without
+    # cache), they are not sent again and the results of this call are added to it, except the transient failures.
+    # reader is the report the shared results are read for, as registered in shared
+    cache = open_cache(cache_path) if local_store is None else None
+
+    canonical_queries = {predicted: [canonicalize_sparql(entry['pure_predicted' if predicted else 'pure_trg']) for entry in complete_report]
+                         for predicted in sides}
+    usages = [(entry, 'predicted' if predicted else 'trg', canonical_query)
+              for predicted in sides for entry, canonical_query in zip(complete_report, canonical_queries[predicted])]
+
+    distinct_queries: Dict[str, int] = {}
+    queries: List[str] = []
+    template_ids = []
+    first_sides = []
+    for entry, dbpedia_key, canonical_query in usages:
+        if canonical_query not in distinct_queries:
+            distinct_queries[canonical_query] = len(queries)
+            queries.append(entry['pure_' + dbpedia_key])
+            template_ids.append(entry.get('template_id'))
+            first_sides.append(dbpedia_key == 'predicted')
+
+    print(f"{len(queries)} distinct queries for {len(usages)} results, {len(usages) - len(queries)} calls saved")
+    if True in canonical_queries and False in canonical_queries:
+        n_structural = len([entry for entry, predicted, trg in zip(complete_report, canonical_queries[True], canonical_queries[False])
+                            if predicted == trg and entry['pure_predicted'] != entry['pure_trg']])
+        print(f"{n_structural} predictions are written differently from their target but structurally equal to it")
+
+    results: List[QueryResult] = [RuntimeError("query not run")] * len(queries)
+    known = []
+    for canonical_query, i in distinct_queries.items():
+        seen_result = recall_seen(seen, canonical_query) if seen is not None else None
+        if seen_result is not None:
+            results[i] = seen_result
+            known.append(canonical_query)
+    if known:
+        print(f"{len(known)} queries answered by the previous chunks")
+
+    # with shared results, the gold queries already sent (or being sent) for another report are not sent again
+    claimed: List[Hashable] = []
+    waited: List[Hashable] = []
+    shared_indices: Dict[Hashable, int] = {}
+    if shared is not None:
+        gold_queries = set(canonical_queries.get(False, []))
+        shared_indices = {q: i for q, i in distinct_queries.items() if q in gold_queries and q not in known}
+        claimed, waited = shared.claim(reader, shared_indices)
+        # the gold queries answered by the previous chunks (as predictions) are not read from the other reports
+        shared.release(reader, gold_queries.intersection(known))
+    not_sent = set(waited).union(known)
+    published = set()
+
+    try:
+        # the queries are sent side by side, each with the side that used it first, so that the time spent on the gold
+        # queries and on the predicted ones can be told apart
+        for predicted in sides:
+            with timings.stage('predicted_queries' if predicted else 'gold_queries') if timings is not None else nullcontext():
+                sent = [i for canonical_query, i in distinct_queries.items()
+                        if first_sides[i] == predicted and canonical_query not in not_sent]
+                if sent:
+                    sent_results = query_dbpedia_many([queries[i] for i in sent], cache=cache, concurrency=concurrency, rate=rate,
+                                                      timeout=timeout, local_store=local_store, cassette=cassette, batch=batch,
+                                                      template_ids=[template_ids[i] for i in sent], retries=retries, metrics=metrics)
+                    for i, result in zip(sent, sent_results):
+                        results[i] = result
+
+                if shared is not None:
+                    for key in claimed:
+                        if first_sides[shared_indices[key]] == predicted:
+                            shared.publish(reader, key, results[shared_indices[key]])
+                            published.add(key)
+                    for key in waited:
+                        if first_sides[shared_indices[key]] == predicted:
+                            results[shared_indices[key]] = shared.wait(reader, key)
+    finally:
+        # the workers waiting for the claimed queries get an error if they could not be run
+        if shared is not None:
+            for key in claimed:
+                if key not in published:
+                    shared.publish(reader, key, results[shared_indices[key]])
+
+    if shared is not None:
+        print(f"{len(waited)} gold queries answered by the evaluation of another report")
+
+    if seen is not None:
+        for canonical_query, i in distinct_queries.items():
+            if canonical_query not in known:
+                remember_seen(seen, canonical_query, results[i])
+
+    fingerprints = [None if isinstance(result, Exception) else fingerprint_result(result) for result in results]
+
+    for entry, dbpedia_key, canonical_query in usages:
+        result = results[distinct_queries[canonical_query]]
+        dbpedia_data = entry.get('dbpedia', {'predicted': {}, 'trg': {}})
+        dbpedia_data[dbpedia_key].pop('fingerprint', None)
+
+        if isinstance(result, Exception):
             print(f"[ERROR] at query id {entry['id']}:")
-            print(error)
-            dbpedia_data = entry.get('dbpedia', {'predicted': {}, 'trg': {}})
-            dbpedia_data[dbpedia_key]['query_result'] = error.args[0]
+            print(result)
+            dbpedia_data[dbpedia_key]['query_result'] = result.args[0] if result.args else str(result)
             dbpedia_data[dbpedia_key]['is_error'] = True
-            entry['dbpedia'] = dbpedia_data
+            dbpedia_data[dbpedia_key]['is_transient'] = is_transient(result)
+        else:
+            dbpedia_data[dbpedia_key]['query_result'] = result
+            dbpedia_data[dbpedia_key]['fingerprint'] = fingerprints[distinct_queries[canonical_query]]
+            dbpedia_data[dbpedia_key]['is_error'] = False
+            dbpedia_data[dbpedia_key]['is_transient'] = False
+
+        entry['dbpedia'] = dbpedia_data
 
+    print_cache_stats(cache)
     return complete_report
 
 
-def get_template_metrics(report: List[Dict]):
-    templates_metrics: Dict = {}
+# share of the entries of each outcome of answer_outcome, in the order they are printed
+ANSWER_METRICS = {'percent_error_predicted': 'error_predicted', 'percent_error_ground_truth': 'error_ground_truth',
+                  'percent_unanswered': 'unanswered', 'answer_accuracy': 'correct'}
+
+
+def raw_metrics(count: int, exact_word_match_count: int, bleu: BleuStats, edit_distance: int, edit_length: int,
+                outcomes: Optional[Counter]) -> Dict:
+    # the metrics of a set of entries as numbers, outcomes counts the answer_outcome of the entries if they were queried
+    raw = {'count': count, 'exact_word_match_count': exact_word_match_count, 'exact_word_match': exact_word_match_count / count,
+           'bleu_score': bleu.score(), 'levenshtein': similarity(edit_distance, edit_length), 'edit_distance': edit_distance,
+           'edit_length': edit_length}
+
+    if outcomes is not None:
+        for outcome in ('correct', 'wrong', 'error_predicted', 'error_ground_truth', 'unanswered'):
+            raw[f'{outcome}_count'] = outcomes[outcome]
+        for key, outcome in ANSWER_METRICS.items():
+            raw[key] = outcomes[outcome] / count
+    return raw
+
+
+class TemplateAccumulator:
+    # metrics per template gathered in a single pass over the report, each entry only updates the bucket of its template
+    def __init__(self):
+        self.n_entries = 0
+        self.has_dbpedia = False
+        self.buckets: Dict = {}
+        self.interner = KBInterner()
+
+    def add(self, entry: Dict, bleu: Optional[Tuple[BleuStats, BleuStats]] = None, edit: Optional[Tuple[int, int]] = None) -> None:
+        # bleu and edit are the bleu stats and the kb element edit distance of the entry if already computed, as for
+        # ReportAccumulator
+        if self.n_entries == 0:
+            self.has_dbpedia = 'dbpedia' in entry
+        self.n_entries += 1
+
+        bucket = self.buckets.get(entry['template_id'])
+        if bucket is None:
+            bucket = {'count': 0, 'exact_word_match': 0, 'bleu': BleuStats(), 'outcomes': Counter(), 'edit_distance': 0,
+                      'edit_length': 0}
+            self.buckets[entry['template_id']] = bucket
+
+        bucket['count'] += 1
+        if entry['correct']:
+            bucket['exact_word_match'] += 1
 
-    for entry in report:
-        t_id = entry['template_id']
+        bucket['bleu'] += (bleu if bleu is not None else entry_bleu_stats(entry))[0]
 
-        template_info = templates_metrics.get(t_id, {'count': 0, 'exact_word_match': 0})
-        template_info['count'] += 1
-        if entry['correct']:
-            template_info['exact_word_match'] += 1
+        edit = edit if edit is not None else entry_edit_distance(entry, self.interner)
+        bucket['edit_distance'] += edit[0]
+        bucket['edit_length'] += edit[1]
 
-        templates_metrics[t_id] = template_info
+        if self.has_dbpedia:
+            bucket['outcomes'][answer_outcome(entry['dbpedia']['predicted'], entry['dbpedia']['trg'])] += 1
 
-    # exact word match accuracy
-    for t_id in templates_metrics:
-        templates_metrics[t_id]['exact_word_match'] = f"{templates_metrics[t_id]['exact_word_match'] / templates_metrics[t_id]['count']:.0%}"
+    def raw(self) -> Dict:
+        return {t_id: raw_metrics(bucket['count'], bucket['exact_word_match'], bucket['bleu'], bucket['edit_distance'],
+                                  bucket['edit_length'], bucket['outcomes'] if self.has_dbpedia else None)
+                for t_id, bucket in self.buckets.items()}
 
-    # bleu score
-    for t_id in templates_metrics:
-        predicted = [entry['predicted'].split() for entry in report if entry['template_id'] == t_id]
-        trg = [[entry['trg'].split()] for entry in report if entry['template_id'] == t_id]
-        templates_metrics[t_id]['bleu_score'] = f"{bleu_score(predicted, trg):.0%}"
+    def metrics(self) -> Dict:
+        templates_metrics: Dict = {}
 
-    # answer accuracy
-    if 'dbpedia' in report[0]:
-        for t_id in templates_metrics:
-            answers = [(entry['dbpedia']['predicted'], entry['dbpedia']['trg']) for entry in report if entry['template_id'] == t_id]
-            error_predicted_count = 0
-            error_ground_truth_count = 0
-            correct_answer_count = 0
+        for t_id, raw in self.raw().items():
+            template_info = {'count': raw['count'],
+                             'exact_word_match': f"{raw['exact_word_match']:.0%}",
+                             'bleu_score': f"{raw['bleu_score']:.0%}",
+                             'levenshtein': f"{raw['levenshtein']:.0%}"}
 
-            for a in answers:
-                if a[0]['is_error']:
-                    error_predicted_count += 1
-                elif a[1]['is_error']:
-                    error_ground_truth_count += 1
-                elif a[0]['query_result'] == a[1]['query_result']:
-                    correct_answer_count += 1
+            if self.has_dbpedia:
+                for key in ANSWER_METRICS:
+                    template_info[key] = f"{raw[key]:.0%}"
 
-            n_template_entries = templates_metrics[t_id]['count']
+            templates_metrics[t_id] = template_info
 
-            templates_metrics[t_id]['percent_error_predicted'] = f"{error_predicted_count/n_template_entries:.0%}"
-            templates_metrics[t_id]['percent_error_ground_truth'] = f"{error_ground_truth_count/n_template_entries:.0%}"
-            templates_metrics[t_id]['answer_accuracy'] = f"{correct_answer_count/n_template_entries:.0%}"
-    else:
-        print("No info available on answer accuracy")
+        if not self.has_dbpedia:
+            print("No info available on answer accuracy")
 
-    return templates_metrics
+        return templates_metrics
 
 
-def get_full_report_metrics(report: List[Dict]):
-    report_metrics = {}
-    # exact word match
-    exact_word_match_count = len([entry for entry in report if entry['correct']])
-    report_metrics['exact_word_match'] = f"{exact_word_match_count / len(report):.0%}"
-
-    # percentage empty requets
-
-    # bleu score
-    predicted = [entry['predicted'].replace(':', '_').split() for entry in report]
-    trg = [[entry['trg'].replace(':', '_').split()] for entry in report]
-
-    report_metrics['bleu_score'] = f"{bleu_score(predicted, trg)}"
-
-    # answer accuracy
-    if 'dbpedia' in report[0]:
-        answers = [(entry['dbpedia']['predicted'], entry['dbpedia']['trg']) for entry in report]
-        error_predicted_count = 0
-        error_ground_truth_count = 0
-        correct_answer_count = 0
-        count_empty = 0
-
-        for a in answers:
-            if a[0]['is_error']:
-                error_predicted_count += 1
-            elif a[1]['is_error']:
-                error_ground_truth_count += 1
-            elif a[0] == a[1]:
-                correct_answer_count += 1
-
-            # if not a[1]['is_error'] and ('boolean' in a[1]['query_result'] and not a[1]['query_result']['boolean'] \
-            #     or a[1]['query_result']['results']['bindings'] == []):
-            #     count_empty += 1
-
-        # report_metrics['percent_expected_empties'] = f"{count_empty/len(report)}"
-        report_metrics['percent_error_predicted'] = f"{error_predicted_count/len(report)}"
-        report_metrics['percent_error_ground_truth'] = f"{error_ground_truth_count/len(report)}"
-        report_metrics['answer_accuracy'] = f"{correct_answer_count/len(report)}"
-        
-    else:
-        print("No info available on answer accuracy")
-
-    # entity accuracy
-    symbols = list('abcdefghijklmnopqrstuvxyz0123456789')
-    total_dist = 0
-    total_len = 0
-    for entry in report:
-        tags = ['dbr', 'dbc', 'dbp', 'dbo']
-        ground_truth = [w for w in entry['trg'].split() if w[:3] in tags]
-        pred = [w for w in entry['predicted'].split() if w[:3] in tags]
-
-        all = list(set(ground_truth + pred))
-
-        if len(all) > len(symbols):
-            raise ValueError('Not enough symbols to encode all entities, extend symbols!')
-
-        encoding_dict = dict(zip(all, symbols))
-        ref_str = ''.join([encoding_dict[w] for w in ground_truth])
-        pred_str = ''.join([encoding_dict[w] for w in pred])
-
-        # https://stackoverflow.com/a/68145930
-        total_dist = total_dist + levenshtein_distance(ref_str, pred_str)
-        total_len = total_len + len(ref_str) + len(pred_str)
-        # not sure if this makes sense lol
+def get_template_metrics(report: List[Dict]):
+    accumulator = TemplateAccumulator()
+    for entry, edit in zip(report, entry_edit_distances(report, accumulator.interner)):
+        accumulator.add(entry, edit=edit)
+    return accumulator.metrics()
+
+
+def entry_bleu_stats(entry: Dict) -> Tuple[BleuStats, BleuStats]:
+    # n-gram stats of the entry for the bleu of its template and for the bleu of the full report, whose tokens have their
+    # ':' replaced by '_'. The n-grams are only counted again for the full report if the entry has a ':'
+    predicted = entry['predicted'].split()
+    trg = entry['trg'].split()
+    template_stats = BleuStats.of_entry(predicted, [trg])
+
+    if ':' not in entry['predicted'] and ':' not in entry['trg']:
+        return template_stats, template_stats
+    return template_stats, BleuStats.of_entry([t.replace(':', '_') for t in predicted], [[t.replace(':', '_') for t in trg]])
+
+
+def answer_outcome(predicted: Dict, trg: Dict) -> str:
+    # timeouts and unavailability of the endpoint are not errors of the model, see query_dbpedia_for_report_sides
+    if predicted.get('is_transient', False) or trg.get('is_transient', False):
+        return 'unanswered'
+    if predicted['is_error']:
+        return 'error_predicted'
+    if trg['is_error']:
+        return 'error_ground_truth'
+    return 'correct' if get_fingerprint(predicted) == get_fingerprint(trg) else 'wrong'
+
+
+class ReportAccumulator:
+    # metrics of the full report updated one entry at a time, so that the entries do not have to stay in memory
+    def __init__(self):
+        self.n_entries = 0
+        self.exact_word_match_count = 0
+        self.has_dbpedia = False
+        self.outcomes: Counter = Counter()
+        self.total_dist = 0
+        self.total_len = 0
+        self.bleu = BleuStats()
+        self.interner = KBInterner()
+
+    def add(self, entry: Dict, bleu: Optional[Tuple[BleuStats, BleuStats]] = None, edit: Optional[Tuple[int, int]] = None) -> None:
+        # bleu and edit are the results of entry_bleu_stats(entry) and entry_edit_distance(entry) if already computed
+        if self.n_entries == 0:
+            self.has_dbpedia = 'dbpedia' in entry
+        self.n_entries += 1
+
+        if entry['correct']:
+            self.exact_word_match_count += 1
 
-    report_metrics['levenshtein'] = str((total_len - total_dist) / total_len)
-    return report_metrics
+        self.bleu += (bleu if bleu is not None else entry_bleu_stats(entry))[1]
 
+        if self.has_dbpedia:
+            self.outcomes[answer_outcome(entry['dbpedia']['predicted'], entry['dbpedia']['trg'])] += 1
 
-def generate_report(error_report_path: str, run_template_metrics: bool, run_dbpedia: bool) -> List[Dict]:
-    with open(error_report_path, 'r', encoding='utf-8') as f:
-        report = json.load(f)
+        dist, length = edit if edit is not None else entry_edit_distance(entry, self.interner)
+        self.total_dist += dist
+        self.total_len += length
+        # not sure if this makes sense lol
+
+    def raw(self) -> Dict:
+        return raw_metrics(self.n_entries, self.exact_word_match_count, self.bleu, self.total_dist, self.total_len,
+                           self.outcomes if self.has_dbpedia else None)
+
+    def metrics(self) -> Dict[str, str]:
+        raw = self.raw()
+        report_metrics = {}
 
-    complete_report = generate_pure_sparql_for_report(report)
-    print(len(complete_report))
+        report_metrics['exact_word_match'] = f"{raw['exact_word_match']:.0%}"
+        report_metrics['bleu_score'] = f"{raw['bleu_score']}"
 
-    if run_dbpedia:
-        print("QUERYING DBPEDIA FOR EXPECTED RESULT...")
-        complete_report = query_dbpedia_for_report(complete_report, predicted=False)
-        print("QUERYING DBPEDIA FOR PREDICTED RESULT...")
-        complete_report = query_dbpedia_for_report(complete_report, predicted=True)
+        if self.has_dbpedia:
+            for key in ANSWER_METRICS:
+                report_metrics[key] = f"{raw[key]}"
+        else:
+            print("No info available on answer accuracy")
 
-    full_report_metrics = get_full_report_metrics(complete_report)
+        report_metrics['levenshtein'] = str(raw['levenshtein'])
+        return report_metrics
 
-    print('FULL REPORT:')
-    for key, val in full_report_metrics.items():
-        print(f'\t{key}: {val}')
 
-    if run_template_metrics:
-        template_metrics = get_template_metrics(complete_report)
-        print('\nTEMPLATES REPORT:')
+def get_full_report_metrics(report: List[Dict]):
+    accumulator = ReportAccumulator()
+    for entry, edit in zip(report, entry_edit_distances(report, accumulator.interner)):
+        accumulator.add(entry, edit=edit)
+    return accumulator.metrics()
+
+
+def gold_query_keys(error_report_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Set[str]:
+    # canonical forms of the gold queries of a report, the keys of its gold results in SharedResults
+    keys: Set[str] = set()
+    for chunk in iter_chunks(iter_report(error_report_path), chunk_size):
+        keys.update(canonicalize_sparql(q) for q in generate_pure_sparql_many([entry['trg'] for entry in chunk]))
+    return keys
+
+
+def summarize_entry(entry: Dict) -> Dict:
+    # the entry without its queries and their results, enough for the template metrics and the comparison of reports
+    summary = {key: value for key, value in entry.items() if key not in ('pure_trg', 'pure_predicted', 'dbpedia')}
+    if 'dbpedia' in entry:
+        for side in entry['dbpedia'].values():
+            get_fingerprint(side)
+        summary['dbpedia'] = {key: {k: v for k, v in side.items() if k != 'query_result'} for key, side in entry['dbpedia'].items()}
+    return summary
+
+
+def generate_report(error_report_path: str, run_template_metrics: bool, run_dbpedia: bool, cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+                    concurrency: int = 8, local_store: Optional[TripleStore] = None, cassette: Optional[Cassette] = None,
+                    batch: bool = False, timeout: float = 60.0, retries: int = 3, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    out_path: Optional[str] = None, shared: Optional[SharedResults] = None,
+                    keep_summaries: bool = False) -> Tuple[List[Dict], EvaluationMetrics]:
+    # The report (json array or json lines) is read chunk_size entries at a time, each chunk is translated, queried and
+    # added to the metrics before the next one is read. The entries with their pure queries and dbpedia results are
+    # written to out_path (<report>_enriched.jsonl by default) instead of being kept. With keep_summaries, the summaries
+    # of the entries (for compare_reports), without queries nor results, are returned, otherwise the list is empty.
+    # The queries shared by two chunks are only sent once, found in the cache or without cache in the results of the
+    # previous chunks, the gold queries shared with the other reports evaluated in parallel once with shared.
+    # The metrics as numbers and the time taken by each stage are returned and written to <report>_metrics.json and
+    # <report>_metrics.csv. The latency, size, cache status and error of each dbpedia query are written per template to
+    # <report>_query_metrics.json
+    report_name = os.path.splitext(error_report_path)[0]
+    out_path = out_path if out_path is not None else f'{report_name}_enriched.jsonl'
+
+    evaluation = EvaluationMetrics(error_report_path)
+    timings = evaluation.timings
+    metrics = QueryMetrics() if run_dbpedia and local_store is None else None
+    accumulator = ReportAccumulator()
+    template_accumulator = TemplateAccumulator() if run_template_metrics else None
+    summaries = []
+    # the results of the previous chunks are kept on disk when the cache does not keep them
+    keep_seen = run_dbpedia and (cache_path is None or local_store is not None)
+
+    with temporary_cache() if keep_seen else nullcontext() as seen, open(out_path, 'w', encoding='utf-8') as out:
+        chunks = iter_chunks(iter_report(error_report_path), chunk_size)
+        while True:
+            with timings.stage('read'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+
+            with timings.stage('pure_sparql'):
+                chunk = generate_pure_sparql_for_report(chunk)
+
+            if run_dbpedia:
+                print(f"QUERYING DBPEDIA FOR EXPECTED AND PREDICTED RESULTS OF ENTRIES {accumulator.n_entries} TO "
+                      f"{accumulator.n_entries + len(chunk)}...")
+                chunk = query_dbpedia_for_report_sides(chunk, [False, True], cache_path=cache_path, concurrency=concurrency,
+                                                       timeout=timeout, local_store=local_store, cassette=cassette, batch=batch,
+                                                       retries=retries, metrics=metrics, shared=shared, timings=timings,
+                                                       seen=seen, reader=error_report_path)
+
+            with timings.stage('bleu'):
+                bleus = [entry_bleu_stats(entry) for entry in chunk]
+            with timings.stage('edit_distance'):
+                edits = entry_edit_distances(chunk, accumulator.interner)
+
+            with timings.stage('report_metrics'):
+                for entry, bleu, edit in zip(chunk, bleus, edits):
+                    entry['levenshtein'] = similarity(*edit)
+                    accumulator.add(entry, bleu, edit)
+
+            if template_accumulator is not None:
+                with timings.stage('template_metrics'):
+                    for entry, bleu, edit in zip(chunk, bleus, edits):
+                        template_accumulator.add(entry, bleu, edit)
+
+            with timings.stage('write'):
+                for entry in chunk:
+                    out.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    if keep_summaries:
+                        summaries.append(summarize_entry(entry))
+
+    print(f"{accumulator.n_entries} entries with their queries and results written to {out_path}")
+
+    with timings.stage('report_metrics'):
+        evaluation.full = accumulator.raw()
+    full_report_metrics = accumulator.metrics()
+
+    # printed at once so that the reports evaluated in parallel do not mix their lines
+    lines = [f'FULL REPORT {error_report_path}:'] + [f'\t{key}: {val}' for key, val in full_report_metrics.items()]
+
+    if template_accumulator is not None:
+        with timings.stage('template_metrics'):
+            evaluation.templates = template_accumulator.raw()
+        template_metrics = template_accumulator.metrics()
+        lines.append('\nTEMPLATES REPORT:')
         for t_id in template_metrics:
-            print(f'\tfor template {t_id}:')
-            for key, val in template_metrics[t_id].items():
-                print(f'\t\t{key}: {val}')
+            lines.append(f'\tfor template {t_id}:')
+            lines.extend(f'\t\t{key}: {val}' for key, val in template_metrics[t_id].items())
+    print('\n'.join(lines))
 
-    return complete_report
+    if metrics is not None:
+        metrics.dump(f'{report_name}_query_metrics.json')
+
+    evaluation.finish()
+    evaluation.print_timings()
+    evaluation.write_json(f'{report_name}_metrics.json')
+    evaluation.write_csv(f'{report_name}_metrics.csv')
+
+    return summaries, evaluation
 
 
 def compare_reports(main_report: List[Dict], compared_report: List[Dict]):
@@ -222,30 +512,158 @@ def compare_reports(main_report: List[Dict], compared_report: List[Dict]):
         for key, val in switched_templates.items():
             print(f'\t{key}: {val}')
 
-def main(error_report_path: str, error_report_path_to_compare: str, run_template_metrics: bool = False, run_dbpedia: bool = False) -> None:
-    main_report = generate_report(error_report_path, run_template_metrics, run_dbpedia)
-
-    if error_report_path_to_compare is not None:
-        compare_report = generate_report(error_report_path_to_compare, run_template_metrics, run_dbpedia)
-
-        compare_reports(main_report, compare_report)
+def compare_many_reports(names: List[str], reports: List[List[Dict]]) -> None:
+    # Exact word match and answer accuracy of each template in each report side by side, the entries that only some
+    # reports got right, then for each report after the first the templates of the entries it lost (as compare_reports)
+    columns: Dict = {}
+    correct_ids = []
+    for name, report in zip(names, reports):
+        correct_ids.append({entry['id'] for entry in report if entry['correct']})
+        for entry in report:
+            for t_id in ('all', entry['template_id']):
+                column = columns.setdefault(t_id, {}).setdefault(name, Counter())
+                column['count'] += 1
+                column['exact_word_match'] += entry['correct']
+                if 'dbpedia' in entry:
+                    column['answered'] += 1
+                    column['correct_answer'] += answer_outcome(entry['dbpedia']['predicted'], entry['dbpedia']['trg']) == 'correct'
+
+    def cell(column: Optional[Counter]) -> str:
+        if column is None:
+            return '-'
+        answer = f"{column['correct_answer'] / column['answered']:.0%}" if column['answered'] else '-'
+        return f"{column['exact_word_match'] / column['count']:.0%} / {answer}"
+
+    width = max(len('100% / 100%'), *(len(name) for name in names)) + 2
+    lines = ['REPORTS COMPARISON (exact word match / answer accuracy):', f"\t{'template':<10}" + ''.join(f'{n:>{width}}' for n in names)]
+    for t_id, template_columns in columns.items():
+        lines.append(f"\t{str(t_id):<10}" + ''.join(f'{cell(template_columns.get(n)):>{width}}' for n in names))
+
+    all_correct = set.intersection(*correct_ids)
+    any_correct = set.union(*correct_ids)
+    lines.append(f'\n\t{len(all_correct)} entries exactly matched by all the reports, {len(any_correct - all_correct)} by only some')
+    for name, ids in zip(names, correct_ids):
+        others = set.union(set(), *(other for other in correct_ids if other is not ids))
+        lines.append(f'\t{name}: {len(ids - others)} entries only exactly matched by this report')
+    print('\n'.join(lines))
+
+    for name, report in zip(names[1:], reports[1:]):
+        print(f'\n{names[0]} -> {name}')
+        compare_reports(reports[0], report)
+
+
+def main(error_report_paths: List[str], run_template_metrics: bool = False, run_dbpedia: bool = False,
+         cache_path: Optional[str] = DEFAULT_CACHE_PATH, concurrency: int = 8, local_store_paths: Optional[List[str]] = None,
+         cassette: Optional[Cassette] = None, batch: bool = False, timeout: float = 60.0, retries: int = 3,
+         chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = 1, metrics_csv_path: Optional[str] = None,
+         cache_ttl: Optional[float] = None, cache_max_entries: Optional[int] = None) -> None:
+    # The reports (a model sweep on the same test set...) are evaluated by workers threads at a time, sharing the dumps loaded
+    # once, the cache and the results of their gold queries. Each worker sends at most concurrency // workers queries at
+    # a time so that dbpedia gets the same load as with a single report. The metrics of all the reports are also written
+    # to metrics_csv_path if given. The cache is opened here with its ttl and max_entries, the reports reuse it. The
+    # summaries of the entries are only kept when there are reports to compare.
+    local_store = TripleStore.from_files(local_store_paths) if local_store_paths and run_dbpedia else None
+    open_cache(cache_path, cache_ttl, cache_max_entries)
+
+    workers = min(workers, len(error_report_paths))
+    shared = SharedResults() if run_dbpedia and len(error_report_paths) > 1 else None
+
+    def evaluate(path: str) -> Tuple[List[Dict], EvaluationMetrics]:
+        return generate_report(path, run_template_metrics, run_dbpedia, cache_path, max(concurrency // workers, 1), local_store, cassette,
+                               batch, timeout, retries, chunk_size, shared=shared, keep_summaries=len(error_report_paths) > 1)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if shared is not None:
+            # every report tells which gold queries it needs before any is sent, so that a result is dropped as soon as
+            # the last report needing it got it
+            for path, keys in zip(error_report_paths, pool.map(lambda path: gold_query_keys(path, chunk_size), error_report_paths)):
+                shared.register(path, keys)
+        reports, evaluations = zip(*pool.map(evaluate, error_report_paths))
+
+    if metrics_csv_path is not None:
+        write_csv(list(evaluations), metrics_csv_path)
+        print(f"Metrics of {len(evaluations)} reports written to {metrics_csv_path}")
+
+    if shared is not None:
+        print(f"{shared.reused} gold query results shared between the reports")
+
+    if len(reports) == 2:
+        compare_reports(reports[0], reports[1])
+    elif len(reports) > 2:
+        names = [os.path.basename(os.path.dirname(os.path.abspath(path))) or path for path in error_report_paths]
+        compare_many_reports(names if len(set(names)) == len(names) else error_report_paths, list(reports))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Calculate accuracy of test set")
 
-    parser.add_argument("--in", dest='in_file', type=str, default="reports/lcquad_split-lcquad_data-model_transformer/error_report.json",
-                        help="path to the json file containing the generated error report")
+    parser.add_argument("--in", dest='in_file', type=str, nargs='+', default=["reports/lcquad_split-lcquad_data-model_transformer/error_report.json"],
+                        help="path(s) to the json (or json lines) file(s) containing the generated error report(s), several reports are compared "
+                             "side by side per template. The metrics and stage timings of a report are written to <report>_metrics.json "
+                             "and <report>_metrics.csv")
 
     parser.add_argument("--in2", dest='in_file_2', type=str, default=None,
                         help="path to the json file containing the generated error report, optional to compare metrics before and after copy")
 
     parser.add_argument("--dbpedia", action='store_true', default=False,
-                    help="set to true if you want to query dbpedia (answer accuracy metric")
+                    help="set to true if you want to query dbpedia (answer accuracy metric). Each distinct query is sent once, predictions "
+                         "structurally equal to their target reuse its result, and the latency, size, cache status and error of every "
+                         "query are written per template to <report>_query_metrics.json")
 
     parser.add_argument("--template", action='store_true', default=False,
                     help="set to true if you want the accuracy per template")
 
+    parser.add_argument("--cache", type=str, default=DEFAULT_CACHE_PATH,
+                    help="path to the sqlite file caching the dbpedia query results")
+
+    parser.add_argument("--no_cache", action='store_true', default=False,
+                    help="set to true to always query dbpedia without reading or writing the cache")
+
+    parser.add_argument("--cache_ttl", type=float, default=None,
+                    help="if set, seconds after which a cached result is expired and the query sent again")
+
+    parser.add_argument("--cache_max_entries", type=int, default=None,
+                    help="if set, maximum number of results in the cache, the least recently used ones are removed")
+
+    parser.add_argument("--concurrency", type=int, default=8,
+                    help="maximum number of queries sent to dbpedia at the same time")
+
+    parser.add_argument("--local_store", type=str, nargs='+', default=None,
+                    help="n-triples/turtle dump(s) to load in an in-memory triple store queried instead of dbpedia")
+
+    parser.add_argument("--record", type=str, default=None,
+                    help="if set, path to a gzipped cassette where every query sent to dbpedia and its answer are recorded")
+
+    parser.add_argument("--replay", type=str, default=None,
+                    help="if set, path to a cassette recorded with --record that answers the queries instead of dbpedia")
+
+    parser.add_argument("--replay_latency", type=float, default=None,
+                    help="seconds a replayed query takes, the recorded durations by default")
+
+    parser.add_argument("--batch", action='store_true', default=False,
+                    help="pack the queries of a template that only differ by their resources in VALUES queries")
+
+    parser.add_argument("--timeout", type=float, default=60.0,
+                    help="seconds after which a dbpedia query is considered failed")
+
+    parser.add_argument("--retries", type=int, default=3,
+                    help="number of times a query failing for a transient reason (timeout, 503...) is sent again")
+
+    parser.add_argument("--chunk_size", type=int, default=DEFAULT_CHUNK_SIZE,
+                    help="number of entries of the report translated and queried at a time, the entries with their queries and results "
+                         "are written to <report>_enriched.jsonl instead of being kept in memory")
+
+    parser.add_argument("--workers", type=int, default=1,
+                    help="number of reports evaluated at the same time, sharing the cache and the results of the gold queries")
+
+    parser.add_argument("--metrics_csv", type=str, default=None,
+                    help="if set, path to a csv file where the metrics and stage timings of all the reports are written")
 
     args = parser.parse_args()
-    main(args.in_file, args.in_file_2, args.template, args.dbpedia)
\ No newline at end of file
+    cassette = open_cassette(args.record, args.replay, args.replay_latency)
+    in_files = args.in_file + ([args.in_file_2] if args.in_file_2 is not None else [])
+    main(in_files, args.template, args.dbpedia, None if args.no_cache else args.cache, args.concurrency, args.local_store, cassette,
+         args.batch, args.timeout, args.retries, args.chunk_size, args.workers,
+         args.metrics_csv, args.cache_ttl, args.cache_max_entries)
+    if cassette is not None:
+        cassette.close()
\ No newline at end of file
@@ -0,0 +1,161 @@
+# corpus bleu computed like torchtext.data.metrics.bleu_score, from n-gram statistics counted once per entry and
+# summed per corpus, so that the bleu of the full report and of each template share the same counts
+
+import argparse
+from collections import Counter
+import math
+import struct
+import time
+from typing import Hashable, List, Optional, Sequence, Tuple
+
+from common.report_stream import iter_report
+
+MAX_N = 4
+
+
+def _float32(x: float) -> float:
+    # torchtext computes the precisions and their geometric mean on float32 tensors, rounding each step to float32
+    # gives the same numbers, up to the last bit of the float32 log and exp of torch that are not always correctly rounded
+    rounded: float = struct.unpack('f', struct.pack('f', x))[0]
+    return rounded
+
+
+def ngram_counts(tokens: Sequence[str], max_n: int = MAX_N) -> Counter:
+    counts: Counter = Counter()
+    for n in range(1, max_n + 1):
+        counts.update(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return counts
+
+
+class BleuStats:
+    # clipped[n - 1] is the number of n-grams of the candidates found in their references, totals[n - 1] the number of
+    # n-grams of the candidates. The stats of a corpus are the sum of the stats of its entries, in any order
+    def __init__(self, max_n: int = MAX_N):
+        self.max_n = max_n
+        self.clipped = [0] * max_n
+        self.totals = [0] * max_n
+        self.candidate_len = 0
+        self.refs_len = 0
+
+    @classmethod
+    def of_entry(cls, candidate: Sequence[str], references: Sequence[Sequence[str]], max_n: int = MAX_N) -> 'BleuStats':
+        stats = cls(max_n)
+        stats.candidate_len = len(candidate)
+        # the length of the reference closest in length to the candidate
+        stats.refs_len = min((len(ref) for ref in references), key=lambda length: abs(len(candidate) - length))
+
+        reference_counts = ngram_counts(references[0], max_n)
+        for ref in references[1:]:
+            reference_counts |= ngram_counts(ref, max_n)
+
+        for ngram, count in (ngram_counts(candidate, max_n) & reference_counts).items():
+            stats.clipped[len(ngram) - 1] += count
+        stats.totals = [max(len(candidate) - i, 0) for i in range(max_n)]
+        return stats
+
+    def __iadd__(self, other: 'BleuStats') -> 'BleuStats':
+        if other.max_n != self.max_n:
+            raise ValueError(f"Cannot add bleu stats of {other.max_n}-grams to stats of {self.max_n}-grams")
+        self.clipped = [a + b for a, b in zip(self.clipped, other.clipped)]
+        self.totals = [a + b for a, b in zip(self.totals, other.totals)]
+        self.candidate_len += other.candidate_len
+        self.refs_len += other.refs_len
+        return self
+
+    def __add__(self, other: 'BleuStats') -> 'BleuStats':
+        stats = BleuStats(self.max_n)
+        stats += self
+        stats += other
+        return stats
+
+    def __radd__(self, other: int) -> 'BleuStats':
+        # sum() of a list of stats starts from 0
+        if other != 0:
+            return NotImplemented
+        return self + BleuStats(self.max_n)
+
+    def score(self, weights: Optional[Sequence[float]] = None) -> float:
+        weights = weights if weights is not None else [1 / self.max_n] * self.max_n
+        if len(weights) != self.max_n:
+            raise ValueError(f"Expected {self.max_n} weights, got {len(weights)}")
+
+        if min(self.clipped) == 0:
+            return 0.0
+
+        log_mean = 0.0
+        for clipped, total, weight in zip(self.clipped, self.totals, weights):
+            precision = _float32(clipped / total)
+            log_mean = _float32(log_mean + _float32(_float32(weight) * _float32(math.log(precision))))
+        score = _float32(math.exp(log_mean))
+
+        brevity_penalty = math.exp(min(1 - self.refs_len / self.candidate_len, 0))
+        return brevity_penalty * score
+
+
+def bleu_score(candidate_corpus: Sequence[Sequence[str]], references_corpus: Sequence[Sequence[Sequence[str]]],
+               max_n: int = MAX_N, weights: Optional[Sequence[float]] = None) -> float:
+    # same arguments as torchtext.data.metrics.bleu_score
+    if len(candidate_corpus) != len(references_corpus):
+        raise ValueError("The candidate and reference corpora must have the same length")
+
+    stats = BleuStats(max_n)
+    for candidate, references in zip(candidate_corpus, references_corpus):
+        stats += BleuStats.of_entry(candidate, references, max_n)
+    return stats.score(weights)
+
+
+def benchmark(report_path: str, repeat: int) -> None:
+    # bleu of the full report and of each template, from torchtext (if installed) recounting the n-grams of every
+    # corpus and from the stats of each entry counted once
+    report = list(iter_report(report_path))
+    candidates = [entry['predicted'].split() for entry in report]
+    references = [[entry['trg'].split()] for entry in report]
+    templates: List[Hashable] = [entry.get('template_id') for entry in report]
+    print(f"{len(report)} entries, {len(set(templates))} templates")
+
+    def native() -> Tuple[float, List[float]]:
+        per_template: dict = {}
+        for candidate, refs, t_id in zip(candidates, references, templates):
+            per_template.setdefault(t_id, BleuStats())
+            per_template[t_id] += BleuStats.of_entry(candidate, refs)
+        return sum(per_template.values()).score(), [stats.score() for stats in per_template.values()]
+
+    def recount(score) -> Tuple[float, List[float]]:
+        buckets = list(dict.fromkeys(templates))
+        return score(candidates, references), [score([c for c, t in zip(candidates, templates) if t == t_id],
+                                                     [r for r, t in zip(references, templates) if t == t_id])
+                                               for t_id in buckets]
+
+    runs = [('native', native)]
+    start = time.perf_counter()
+    try:
+        from torchtext.data.metrics import bleu_score as torchtext_bleu_score
+        print(f"\ttorchtext imported in {time.perf_counter() - start:.2f}s")
+        runs.append(('torchtext', lambda: recount(torchtext_bleu_score)))
+    except ImportError:
+        print("\ttorchtext is not installed, only the native bleu is timed")
+
+    scores = {}
+    for name, run in runs:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            scores[name] = run()
+        print(f"\t{name}: {(time.perf_counter() - start) / repeat:.3f}s, bleu {scores[name][0]}")
+
+    if 'torchtext' in scores:
+        differences = [abs(a - b) for a, b in zip([scores['native'][0]] + scores['native'][1],
+                                                   [scores['torchtext'][0]] + scores['torchtext'][1])]
+        print(f"\tlargest difference with torchtext over the full report and the templates: {max(differences)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the bleu of a report and of its templates, and compare it with torchtext if installed.")
+
+    parser.add_argument("--in", dest='in_file', type=str, default="reports/lcquad_split-lcquad_data-model_transformer/error_report.json",
+                        help="path to the json (or json lines) file containing the generated error report")
+
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of times the scores are computed")
+
+    args = parser.parse_args()
+    benchmark(args.in_file, args.repeat)
@@ -0,0 +1,118 @@
+# record/replay of the traffic to a sparql endpoint, so that runs can be reproduced and benchmarked without network
+
+import gzip
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from common.query_cache import normalize_query
+from common.query_retry import HTTPError
+
+CASSETTE_MODES = ('record', 'replay')
+
+# errors raised again with their type when replayed, the others are replayed as RuntimeError
+REPLAYED_ERRORS = {'TimeoutError': TimeoutError, 'RuntimeError': RuntimeError, 'ConnectionError': ConnectionError}
+
+
+class Cassette:
+    # A gzipped JSONL file with a line per distinct query: the normalized query, the endpoint, the result or the error
+    # it raised (with its status for http errors), and the seconds it took. In record mode every query goes to the
+    # endpoint and its outcome is written, an existing file is overwritten. In replay mode no query is sent, the
+    # recorded outcome is given back after latency seconds, or after the recorded duration if latency is None.
+    def __init__(self, path: str, mode: str, latency: Optional[float] = None):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode {mode}, expected one of {CASSETTE_MODES}")
+
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+
+        self.interactions: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.file = None
+
+        if mode == 'replay':
+            self._load()
+        else:
+            self.file = gzip.open(path, 'wt', encoding='utf-8')
+
+    def _load(self) -> None:
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    interaction = json.loads(line)
+                    self.interactions[interaction['query']] = interaction
+            except (EOFError, json.JSONDecodeError):
+                # the recording was interrupted, the complete lines before are kept
+                print(f"{self.path} is truncated, replaying its first {len(self.interactions)} queries")
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    def play(self, query: str, send: Optional[Callable[[str], Dict[Any, Any]]], endpoint: str = '') -> Dict[Any, Any]:
+        # send runs the query on the endpoint, it is only called in record mode
+        key = normalize_query(query)
+
+        if not self.recording:
+            interaction = self.interactions.get(key)
+            if interaction is None:
+                raise LookupError(f"Query not recorded in {self.path}: {key}")
+
+            time.sleep(self.latency if self.latency is not None else interaction['elapsed'])
+            if 'status' in interaction:
+                raise HTTPError(interaction['status'], interaction['message'])
+            if 'error' in interaction:
+                raise REPLAYED_ERRORS.get(interaction['error'], RuntimeError)(interaction['message'])
+            result: Dict[Any, Any] = interaction['result']
+            return result
+
+        if send is None:
+            raise ValueError("A cassette needs a way to send the queries to record them")
+
+        start = time.perf_counter()
+        try:
+            result = send(query)
+        except HTTPError as error:
+            self._record({'query': key, 'endpoint': endpoint, 'error': 'HTTPError', 'status': error.status, 'message': error.body},
+                         start)
+            raise
+        except Exception as error:
+            self._record({'query': key, 'endpoint': endpoint, 'error': type(error).__name__, 'message': str(error)}, start)
+            raise
+
+        self._record({'query': key, 'endpoint': endpoint, 'result': result}, start)
+        return result
+
+    def _record(self, interaction: Dict[str, Any], start: float) -> None:
+        interaction['elapsed'] = round(time.perf_counter() - start, 4)
+        with self.lock:
+            # a query is recorded once, unless it failed and a retry answered it (the last line of a query wins)
+            recorded = self.interactions.get(interaction['query'])
+            if self.file is None or (recorded is not None and ('error' not in recorded or 'error' in interaction)):
+                return
+            self.interactions[interaction['query']] = interaction
+            self.file.write(json.dumps(interaction, ensure_ascii=False) + '\n')
+
+    def __len__(self) -> int:
+        return len(self.interactions)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def open_cassette(record_path: Optional[str] = None, replay_path: Optional[str] = None,
+                  latency: Optional[float] = None) -> Optional[Cassette]:
+    # cassette of the --record/--replay arguments of the scripts, None when neither is set
+    if record_path is not None and replay_path is not None:
+        raise ValueError("Cannot record and replay a cassette at the same time")
+
+    if record_path is not None:
+        return Cassette(record_path, 'record')
+    if replay_path is not None:
+        return Cassette(replay_path, 'replay', latency)
+    return None
@@ -33,6 +33,53 @@ REPLACEMENTS = [
 ]
 
 
+# Known typos in natural language questions, applied in order by Dataset.correct_question (['typo', 'correction'])
+QUESTION_REPLACEMENTS = [
+    ['wasthe', 'was the'],
+    ['monthyl', 'monthly'],
+    ['grevais', 'gervais'],
+    ['joesph', 'joseph'],
+    ['palce', 'place'],
+    ['whihc', 'which'],
+    ['whci', 'which'],
+    [' od ', ' of '],
+    ['emplyer', 'employer'],
+    ['ispychess', 'is pychess'],
+    ['compnay', 'company'],
+    ['comapny', 'company'],
+    ['genere', 'genre'],
+    ['palce', 'place'],
+    ['herny ford', 'henry ford'],
+    [' aldo ', ' also '],
+    [' aldo ', ' also '],
+    [' form ', ' from '],
+    [' of from ', ' of form '],
+    [' awrds ', ' awards '],
+    [' awardwinners ', ' award winners '],
+    [' castillo ', ' callisto'],
+    [' castillo ', ' callisto'],
+    ['rishkiesh', 'rishikesh'],
+    ['kriminalpolizie', 'kriminalpolizei'],
+    ['willian', 'william'],
+    ['ehtics', 'ethics'],
+    ['terrotory', 'territory'],
+    ['snaman', 'sandman'],
+    ['neverwher', 'neverwhere'],
+    ['hopoer', 'hooper'],
+    ['ho0lder', 'holder'],
+    ['marvo', 'mavro'],
+    ['micheal', 'michael'],
+    ['brandenton', 'bradenton'],
+    ['fraiser', 'frasier'],
+    [' firt ', ' first '],
+    [' asnorth ', ' as north '],
+    [' electoin ', ' election '],
+    ['\\"', ' \\" '],
+    ['< ', ''],
+    ['http://dbpedia.org/resource/werner_heisenberg', '']
+]
+
+
 URI_SHORTENERS = [
     {
         'match': 'http://dbpedia.org/ontology/',
@@ -233,4 +280,29 @@ ENDS_EXCEPTIONS_NOT_REPLACE = ['dept.', 'bros.', 'litt.', 'corp.', 'gent.']
 ENDS_EXCEPTIONS_REPLACE = ['hop.']
 
 # Sparql explicit type for rdf:type, should not be counted as a resource
-SPARQL_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
\ No newline at end of file
+SPARQL_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+# Namespaces shortened to their prefix by the sparql canonicalizer, longest first so that dbc: wins over dbr:
+SPARQL_NAMESPACES = [
+    ['http://dbpedia.org/resource/Category:', 'dbc:'],
+    ['http://dbpedia.org/resource/', 'dbr:'],
+    ['http://dbpedia.org/ontology/', 'dbo:'],
+    ['http://dbpedia.org/property/', 'dbp:'],
+    ['http://dbpedia.org/class/yago/', 'yago:'],
+    ['http://www.w3.org/1999/02/22-rdf-syntax-ns#', 'rdf:'],
+    ['http://www.w3.org/2000/01/rdf-schema#', 'rdfs:'],
+    ['http://www.w3.org/2002/07/owl#', 'owl:'],
+    ['http://www.w3.org/2004/02/skos/core#', 'skos:'],
+    ['http://www.w3.org/2003/01/geo/wgs84_pos#', 'geo:'],
+    ['http://www.georss.org/georss/', 'georss:'],
+    ['http://xmlns.com/foaf/0.1/', 'foaf:'],
+    ['http://purl.org/dc/terms/', 'dct:'],
+    ['res:', 'dbr:']
+]
+
+# Sparql keywords, written in lower case by the sparql canonicalizer
+SPARQL_KEYWORDS = {
+    'select', 'distinct', 'reduced', 'where', 'ask', 'construct', 'describe', 'from', 'named', 'as', 'count', 'sum', 'min',
+    'max', 'avg', 'sample', 'group_concat', 'union', 'optional', 'filter', 'minus', 'bind', 'values', 'graph', 'service',
+    'not', 'exists', 'in', 'regex', 'lang', 'langmatches', 'str', 'bound', 'contains', 'strstarts', 'lcase', 'ucase',
+    'order', 'group', 'by', 'having', 'asc', 'desc', 'limit', 'offset', 'true', 'false'
+}
@@ -0,0 +1,79 @@
+# machine readable metrics of the evaluation of a report: raw numbers for the full report and each template, and the
+# wall time of each stage of the evaluation, written as json or csv to follow the results and the throughput across runs
+
+import csv
+import json
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterator, List, Optional
+
+
+class StageTimings:
+    # seconds spent in each stage, summed over the times a stage is entered (once per chunk of the report...)
+    def __init__(self) -> None:
+        self.seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+
+class EvaluationMetrics:
+    # full and templates hold the metrics as numbers (shares in [0, 1], counts), templates is empty if the template
+    # metrics were not asked for. The timings of the stages come with the total wall time of the evaluation
+    def __init__(self, report_path: str):
+        self.report_path = report_path
+        self.full: Dict[str, Any] = {}
+        self.templates: Dict[Hashable, Dict[str, Any]] = {}
+        self.timings = StageTimings()
+        self.start = time.perf_counter()
+        self.wall_time: Optional[float] = None
+
+    def finish(self) -> None:
+        self.wall_time = time.perf_counter() - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        wall_time = self.wall_time if self.wall_time is not None else time.perf_counter() - self.start
+        n_entries = self.full.get('count', 0)
+        return {
+            'report': self.report_path,
+            'full': self.full,
+            'templates': {str(t_id): metrics for t_id, metrics in self.templates.items()},
+            'timings': {**self.timings.seconds, 'total': wall_time},
+            'entries_per_second': n_entries / wall_time if wall_time > 0 else 0.0,
+        }
+
+    def rows(self) -> List[Dict[str, Any]]:
+        # one row per value: the scope is 'full', a template id or 'timings'
+        metrics = self.to_dict()
+        rows = [{'report': self.report_path, 'scope': 'full', 'metric': key, 'value': value} for key, value in metrics['full'].items()]
+        for t_id, template_metrics in metrics['templates'].items():
+            rows.extend({'report': self.report_path, 'scope': t_id, 'metric': key, 'value': value} for key, value in template_metrics.items())
+        rows.extend({'report': self.report_path, 'scope': 'timings', 'metric': key, 'value': value} for key, value in metrics['timings'].items())
+        rows.append({'report': self.report_path, 'scope': 'timings', 'metric': 'entries_per_second', 'value': metrics['entries_per_second']})
+        return rows
+
+    def write_json(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    def write_csv(self, path: str) -> None:
+        write_csv([self], path)
+
+    def print_timings(self) -> None:
+        timings = self.to_dict()['timings']
+        print(f"{self.report_path} evaluated in {timings['total']:.2f}s: " +
+              ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items() if stage != 'total'))
+
+
+def write_csv(evaluations: List[EvaluationMetrics], path: str) -> None:
+    # the rows of several evaluations in one long table, the files of several runs can be concatenated
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['report', 'scope', 'metric', 'value'])
+        writer.writeheader()
+        for evaluation in evaluations:
+            writer.writerows(evaluation.rows())
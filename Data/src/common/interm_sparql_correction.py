@@ -0,0 +1,266 @@
+# utils to normalize raw interm sparql queries, can also be run as a benchmark against the regex implementation
+
+import argparse
+import re
+import time
+from typing import List, Optional, Set
+
+from common.consts import INSERT_SPACES_MATH_RE, REPLACE_FILTER_PAR_RE, REPLACE_QUOTES_RE, REPLACE_REST_PAR_RE
+from common.re_callbacks import correct_sep_dots, insert_spaces_math, correct_parentheses_interm_sparql, is_sep_dot, replace_quotes
+from common.resource_lexer import sub_interm_sparql_resources
+
+RESOURCE_START_RE = re.compile('db[orcp]_')
+
+# tokens that are padded with spaces when they are glued to something, the double spaces it creates matter for the resources
+PADDED_TOKENS = {'brack_open', 'brack_close', 'dbp_length'}
+
+
+def correct_interm_sparql_regex(interm_sparql: str) -> str:
+    interm_sparql = interm_sparql.replace('attr_open', ' par_open ')
+    interm_sparql = interm_sparql.replace('attr_close', ' par_close ')
+
+    interm_sparql = re.sub('\s+', ' ', interm_sparql)
+
+    interm_sparql = interm_sparql.replace('var_uri.', 'var_uri sep_dot') #dbnqa
+    interm_sparql = interm_sparql.replace('brack_open', ' brack_open ')
+    interm_sparql = interm_sparql.replace('brack_close', ' brack_close ')
+    interm_sparql = interm_sparql.replace('dbp_length', ' dbp_length ')
+
+    interm_sparql = REPLACE_FILTER_PAR_RE.sub(
+        correct_parentheses_interm_sparql, interm_sparql)
+    interm_sparql = REPLACE_REST_PAR_RE.sub(
+        correct_parentheses_interm_sparql, interm_sparql)
+    interm_sparql = REPLACE_QUOTES_RE.sub(replace_quotes, interm_sparql)
+    interm_sparql = sub_interm_sparql_resources(
+        correct_sep_dots, interm_sparql)
+    interm_sparql = INSERT_SPACES_MATH_RE.sub(
+        insert_spaces_math, interm_sparql)
+
+    return finalize_interm_sparql(interm_sparql)
+
+
+def finalize_interm_sparql(interm_sparql: str) -> str:
+    interm_sparql = re.sub('\s+', ' ', interm_sparql)
+    interm_sparql = interm_sparql.strip()
+
+    return rename_placeholders(interm_sparql)
+
+
+def rename_placeholders(interm_sparql: str) -> str:
+    interm_sparql = interm_sparql.replace('FILTER', 'filter')
+    interm_sparql = interm_sparql.replace('COUNT', 'count')
+    interm_sparql = interm_sparql.replace('UNION', 'union')
+
+    interm_sparql = interm_sparql.replace('%3F', '?')
+
+    interm_sparql = interm_sparql.replace('par_open', 'attr_open')
+    interm_sparql = interm_sparql.replace('par_close', 'attr_close')
+    interm_sparql = interm_sparql.replace('sparql_open', 'par_open')
+    interm_sparql = interm_sparql.replace('sparql_close', 'par_close')
+
+    return interm_sparql
+
+
+def _rename_parentheses(tokens: List[str], lowered: str) -> None:
+    # par_open/par_close that belong to the sparql syntax become par_open/par_close, the others (resource names)
+    # become attr_open/attr_close, as done through sparql_open/sparql_close by correct_interm_sparql_regex
+    opens = [i for i, token in enumerate(tokens) if token == 'par_open']
+    closes = [i for i, token in enumerate(tokens) if token == 'par_close']
+    sparql_parentheses: Set[int] = set()
+
+    # REPLACE_FILTER_PAR_RE: the par_open right after the first filter and the last par_close are sparql parentheses
+    if 'filter' in lowered:
+        for i in opens:
+            if i > 0 and tokens[i - 1].lower().endswith('filter'):
+                if closes and closes[-1] > i:
+                    sparql_parentheses.update((i, closes[-1]))
+                break
+
+    # REPLACE_REST_PAR_RE: same for count and order by, up to the next par_close
+    if 'count' in lowered or 'order by' in lowered:
+        resume = 0
+        for i in opens:
+            if i in sparql_parentheses:
+                continue
+
+            is_count = i - 1 >= resume and tokens[i - 1].lower().endswith('count')
+            is_order_by = i - 3 >= resume and tokens[i - 1].lower() in ('asc', 'desc') and tokens[i - 2].lower() == 'by' \
+                and tokens[i - 3].lower().endswith('order')
+            if not is_count and not is_order_by:
+                continue
+
+            close_idx = next((j for j in closes if j > i and j not in sparql_parentheses), None)
+            if close_idx is None:
+                break
+
+            sparql_parentheses.update((i, close_idx))
+            resume = close_idx + 1
+
+    for i in opens:
+        tokens[i] = 'par_open' if i in sparql_parentheses else 'attr_open'
+    for i in closes:
+        tokens[i] = 'par_close' if i in sparql_parentheses else 'attr_close'
+
+
+def _resource_end(tokens: List[str], start: int) -> Optional[int]:
+    # index of the last token of the resource starting at tokens[start] (GET_RESOURCES_INTERM_SPARQL_RE), None if the
+    # resource is followed by a double space that the regex would see
+    end = start
+    while end + 1 < len(tokens):
+        next_token = tokens[end + 1]
+
+        if next_token == 'attr_open':
+            close_idx = next((j for j in range(end + 2, len(tokens)) if tokens[j] == 'attr_close'), None)
+            if close_idx is None:
+                break
+            end = close_idx
+
+        elif next_token[0] == '_' or next_token[0] == '-':
+            if next_token[0] == '_' and tokens[end] in PADDED_TOKENS:
+                return None
+            end += 1
+
+        else:
+            break
+
+    if end > start and any(t in PADDED_TOKENS for t in tokens[start:end + 1]):
+        return None
+
+    return end
+
+
+def correct_interm_sparql(interm_sparql: str) -> str:
+    # Same output as correct_interm_sparql_regex, but the query is split into tokens once and the rules of the regex
+    # chain are applied to the tokens they can affect. The few queries where the whitespace lost by the split could
+    # change the result (regex filters, glued parentheses, resources at the very end or next to padded tokens) go
+    # through the regexes instead.
+    raw_interm_sparql = interm_sparql
+    interm_sparql = interm_sparql.replace('attr_open', ' par_open ')
+    interm_sparql = interm_sparql.replace('attr_close', ' par_close ')
+    interm_sparql = interm_sparql.replace('var_uri.', 'var_uri sep_dot')
+    interm_sparql = interm_sparql.replace('brack_open', ' brack_open ')
+    interm_sparql = interm_sparql.replace('brack_close', ' brack_close ')
+    interm_sparql = interm_sparql.replace('dbp_length', ' dbp_length ')
+
+    lowered = interm_sparql.lower()
+    if 'regex' in lowered or 'sparql_' in lowered:
+        return correct_interm_sparql_regex(raw_interm_sparql)
+
+    tokens = interm_sparql.split()
+    if not tokens:
+        return ''
+
+    has_parentheses = 'par_' in interm_sparql
+    if has_parentheses and interm_sparql.count('par_') != tokens.count('par_open') + tokens.count('par_close'):
+        return correct_interm_sparql_regex(raw_interm_sparql)
+
+    trailing_space = interm_sparql[-1].isspace()
+    if has_parentheses:
+        _rename_parentheses(tokens, lowered)
+
+    joined = ' '.join(tokens)
+
+    # resources only change if they are glued to something before them or if they end with a dot
+    if joined.count('db') != joined.count(' db') + joined.startswith('db') or '. ' in joined or joined[-1] == '.':
+        split = _split_resources(tokens, trailing_space)
+        if split is None:
+            return correct_interm_sparql_regex(raw_interm_sparql)
+        tokens = split
+
+    if 'math_' in lowered:
+        tokens = _insert_spaces_math(tokens, trailing_space)
+
+    joined = ' '.join(tokens)
+    joined = joined.replace('FILTER', 'filter')
+    joined = joined.replace('COUNT', 'count')
+    joined = joined.replace('UNION', 'union')
+    return joined.replace('%3F', '?')
+
+
+def _split_resources(tokens: List[str], trailing_space: bool) -> Optional[List[str]]:
+    # GET_RESOURCES_INTERM_SPARQL_RE with correct_sep_dots, None when the regexes have to be used
+    out: List[str] = []
+    last = 0
+    resume = 0
+    for i in [i for i, token in enumerate(tokens) if 'db' in token]:
+        if i < resume:
+            continue
+
+        resource_start = RESOURCE_START_RE.search(tokens[i])
+        if resource_start is None:
+            continue
+
+        end = _resource_end(tokens, i)
+        if end is None or (end == len(tokens) - 1 and not trailing_space):
+            return None
+
+        resume = end + 1
+        token = tokens[i]
+        sep_dot = tokens[end][-1] == '.'
+        if resource_start.start() == 0 and not sep_dot:
+            continue
+
+        out.extend(tokens[last:i])
+        if resource_start.start() > 0:
+            out.append(token[:resource_start.start()])
+            token = token[resource_start.start():]
+
+        resource = [token] + tokens[i + 1:end + 1]
+        if sep_dot and is_sep_dot(' '.join(resource)):
+            resource[-1] = resource[-1][:-1]
+            resource.append('sep_dot')
+
+        out.extend(resource)
+        last = end + 1
+
+    out.extend(tokens[last:])
+    return out
+
+
+def _insert_spaces_math(tokens: List[str], trailing_space: bool) -> List[str]:
+    # INSERT_SPACES_MATH_RE never goes past a space, so it can be applied token by token
+    out: List[str] = []
+    for i, token in enumerate(tokens):
+        if 'math_' in token.lower():
+            padding = ' ' if i < len(tokens) - 1 or trailing_space else ''
+            out.extend(INSERT_SPACES_MATH_RE.sub(insert_spaces_math, token + padding).split())
+        else:
+            out.append(token)
+    return out
+
+
+def benchmark(sparql_data_paths: List[str], repeat: int) -> None:
+    for path in sparql_data_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            queries = f.read().splitlines()
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            expected = [correct_interm_sparql_regex(q) for q in queries]
+        regex_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            corrected = [correct_interm_sparql(q) for q in queries]
+        transducer_time = time.perf_counter() - start
+
+        mismatches = [(q, e, c) for q, e, c in zip(queries, expected, corrected) if e != c]
+        for query, e, c in mismatches[:10]:
+            print(f"[MISMATCH] {query}\n\tregex:      {e}\n\ttransducer: {c}")
+
+        print(f"{path}: {len(queries)} queries, {len(mismatches)} mismatches")
+        print(f"\tregex: {regex_time / repeat:.4f}s per pass")
+        print(f"\ttransducer: {transducer_time / repeat:.4f}s per pass ({regex_time / transducer_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the interm sparql transducer against the regex implementation and benchmark both.")
+
+    parser.add_argument("--sparql", type=str, nargs='+', default=['raw_data/Monument/base/data.sparql'],
+                        help="path to the txt file(s) containing raw interm sparql queries separated by newlines")
+
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of passes over the queries")
+
+    args = parser.parse_args()
+    benchmark(args.sparql, args.repeat)
@@ -1,11 +1,26 @@
 # utils to help converting interm_sparql back to pure sparql
 
-from typing import List
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, List, Tuple
+import multiprocessing
 import re
+import time
 from common.consts import CATCH_VAR_IN_RESOURCE_NAME_RE, GET_RESOURCES_PURE_SPARQL_RE, REPLACE_ORDER_BY_RE, REPLACEMENTS
 import argparse
 from tqdm import tqdm
 
+# same matches as GET_RESOURCES_PURE_SPARQL_RE, the lazy .*? can only stop at the first [\s|}] so it is written as a negated class
+TERMINATED_RESOURCE_PURE_SPARQL_RE = re.compile("(db[orcp]:[^\s|}]*)[\s|}]", flags=re.IGNORECASE)
+ESCAPED_CHARS = ["+", "'", ",", "!", "/"]
+ESCAPED_RESOURCE_CHARS = ["(", ")", "."]
+ESCAPE_TABLE = str.maketrans({c: '\\' + c for c in ESCAPED_CHARS})
+ESCAPE_TABLE_NO_PLUS = str.maketrans({c: '\\' + c for c in ESCAPED_CHARS if c != "+"})
+ESCAPE_RESOURCE_TABLE = str.maketrans({c: '\\' + c for c in ESCAPED_CHARS + ESCAPED_RESOURCE_CHARS})
+ESCAPE_RESOURCE_TABLE_NO_PLUS = str.maketrans({c: '\\' + c for c in ESCAPED_CHARS + ESCAPED_RESOURCE_CHARS if c != "+"})
+SINGLE_AMPERSAND_RE = re.compile("(?<!&)&(?!&)")
+# a resource name can only contain a var_ to restore if a ? follows one of the chars of CATCH_VAR_IN_RESOURCE_NAME_RE
+VAR_IN_RESOURCE_NAME_HINT_RE = re.compile("[a-zA-Z0-9_:]\?")
+
 
 def reverse_replacements(query: str) -> str:
     for r in REPLACEMENTS:
@@ -55,7 +70,7 @@ def add_var_in_resource_names(match: re.Match) -> str:
     return str(match.group(0).replace('?', 'var_'))
 
 
-def interm_sparql_to_pure_sparql(interm_query: str):
+def interm_sparql_to_pure_sparql_sequential(interm_query: str):
     query = reverse_replacements(interm_query)
     query = escape_order_by(query)
     query = CATCH_VAR_IN_RESOURCE_NAME_RE.sub(add_var_in_resource_names, query)
@@ -74,14 +89,81 @@ def interm_sparql_to_pure_sparql(interm_query: str):
     return query
 
 
-def generate_pure_sparql(interm_sparql: List[str]) -> List[str]:
-    pure_sparql = []
+class PureSparqlDecoder:
+    # Same output as interm_sparql_to_pure_sparql_sequential, with the REPLACEMENTS table compiled once.
+    # The rows before the first one with a padded encoding (the prefixes, dbo_ -> dbo: ...) never involve a space, so
+    # they are applied token by token and each distinct token is only decoded once. The rows after it can glue tokens
+    # together (' attr_open ' -> '(') so they are applied in order on the whole query, but only when their encoding is
+    # in it. The steps after that only run when the query contains what they look for.
+    def __init__(self, replacements: List[List[str]], max_cached_tokens: int = 100000):
+        rows = [(r[-1], r[0]) for r in replacements]
+        first_padded = next((i for i, (encoding, _) in enumerate(rows) if encoding != encoding.strip()), len(rows))
+
+        self.token_rows: List[Tuple[str, str]] = rows[:first_padded]
+        self.query_rows: List[Tuple[str, str, str]] = [(encoding.strip(), encoding, original) for encoding, original in rows[first_padded:]]
+        self.max_cached_tokens = max_cached_tokens
+
+        self._tokens_cache: Dict[str, str] = {}
+
+    def _decode_token(self, token: str) -> str:
+        decoded = self._tokens_cache.get(token)
+        if decoded is not None:
+            return decoded
+
+        decoded = token
+        for encoding, original in self.token_rows:
+            if encoding in decoded:
+                decoded = decoded.replace(encoding, original)
+
+        if len(self._tokens_cache) >= self.max_cached_tokens:
+            self._tokens_cache.clear()
+        self._tokens_cache[token] = decoded
+        return decoded
+
+    def reverse_replacements(self, query: str) -> str:
+        # the tokens are split on single spaces so that the whitespaces are kept as they are
+        query = ' '.join([self._decode_token(token) for token in query.split(' ')])
+
+        for stripped_encoding, encoding, original in self.query_rows:
+            if stripped_encoding in query:
+                query = query.replace(encoding, original)
+                query = query.replace(stripped_encoding, original)
+
+        return query
+
+    def convert(self, interm_query: str) -> str:
+        query = self.reverse_replacements(interm_query)
+        if '_ob' in query.lower():
+            query = escape_order_by(query)
+        if VAR_IN_RESOURCE_NAME_HINT_RE.search(query) is not None:
+            query = CATCH_VAR_IN_RESOURCE_NAME_RE.sub(add_var_in_resource_names, query)
+
+        query = query.replace("where{", "where {")
+        query = query.replace("}", " } ")
+        query = query.replace("FILTER", "filter")
+        query = query.replace("COUNT", "count")
+        query = query.replace("UNION", "union")
+
+        query = TERMINATED_RESOURCE_PURE_SPARQL_RE.sub(remove_spaces_from_resources, query)
+
+        query = query.replace("dbp:length", " dbp:length ")
+        if '%3F' in query:
+            query = re.sub(" ?%3F", "?", query)
+        return ' '.join(query.split())
+
+    def convert_many(self, interm_queries: Iterable[str]) -> List[str]:
+        return [self.convert(q) for q in interm_queries]
 
-    for interm_query in tqdm(interm_sparql):
-        query = interm_sparql_to_pure_sparql(interm_query)
-        pure_sparql.append(query)
-    
-    return pure_sparql
+
+PURE_SPARQL_DECODER = PureSparqlDecoder(REPLACEMENTS)
+
+
+def interm_sparql_to_pure_sparql(interm_query: str):
+    return PURE_SPARQL_DECODER.convert(interm_query)
+
+
+def generate_pure_sparql(interm_sparql: List[str]) -> List[str]:
+    return PURE_SPARQL_DECODER.convert_many(tqdm(interm_sparql))
 
 
 def escape_parentheses_in_entities(match: re.Match) -> str:
@@ -97,12 +179,10 @@ def escape_parentheses(query: str) -> str:
 
 
 def escape_ampersands(query: str) -> str:
-    amp = query.find('&')
-    while amp > 0:
-        if query[amp - 1] != '&' and query[amp + 1] != '&':
-            query = query[:amp] + '\\' + query[amp:]
-        amp = query.find('&', amp + 2)
-    return query
+    # escapes the & that are not part of a &&, nothing is escaped if the query starts with &
+    if query.find('&') <= 0:
+        return query
+    return SINGLE_AMPERSAND_RE.sub('\\\\&', query)
 
 
 def escape_dots_in_resources(match:re.Match) -> str:
@@ -116,22 +196,19 @@ def escape_dots(query: str) -> str:
 
 
 def escape_plus(query: str) -> str:
-    idx = query.find('+')
-    while idx > 0:
-        query = query[:idx] + '\\' + query[idx:]
-        idx = query.find('+', idx + 2)
-    return query
+    # nothing is escaped if the query starts with +
+    if query.find('+') <= 0:
+        return query
+    return query.replace('+', '\\+')
 
 
 def escape_star(query: str) -> str:
-    idx = query.find('*')
-    while idx > 0:
-        query = query[:idx] + '\\' + query[idx:]
-        idx = query.find('*', idx + 2)
-    return query
+    if query.find('*') <= 0:
+        return query
+    return query.replace('*', '\\*')
 
 
-def escape_query(query: str) -> str:
+def escape_query_sequential(query: str) -> str:
     query = escape_parentheses(query)
     query = escape_ampersands(query)
     query = escape_dots(query)
@@ -145,11 +222,37 @@ def escape_query(query: str) -> str:
     return query
 
 
+def escape_query(query: str) -> str:
+    # Same output as escape_query_sequential in a single scan: the resources are found once, and each part of the query
+    # is escaped with one str.translate, with the ( ) . of the resources added to the table.
+    plus_escaped = query.find('+') != 0
+    outside_table = ESCAPE_TABLE if plus_escaped else ESCAPE_TABLE_NO_PLUS
+    resource_table = ESCAPE_RESOURCE_TABLE if plus_escaped else ESCAPE_RESOURCE_TABLE_NO_PLUS
+
+    escaped = []
+    last = 0
+    for resource in TERMINATED_RESOURCE_PURE_SPARQL_RE.finditer(query):
+        escaped.append(query[last:resource.start()].translate(outside_table))
+        escaped.append(resource.group(0).translate(resource_table))
+        last = resource.end()
+    escaped.append(query[last:].translate(outside_table))
+    query = ''.join(escaped)
+
+    # the escaped chars never touch an & or an order by, so these can be done last
+    if '&' in query:
+        query = escape_ampersands(query)
+    if '_ob' in query.lower():
+        query = escape_order_by(query)
+
+    return query
+
+
+def escape_many(pure_sparql: Iterable[str]) -> List[str]:
+    return [escape_query(q) for q in pure_sparql]
+
+
 def escape_for_querying(pure_sparql: List[str]) -> List[str]:
-    escaped_sparql = []
-    for query in tqdm(pure_sparql):
-        escaped_sparql.append(escape_query(query))
-    return escaped_sparql
+    return escape_many(tqdm(pure_sparql))
 
 
 def convert_to_pure_sparql(in_path_intem_sparql: str, out_path_pure_sparql: str, escape: bool = False) -> None:
@@ -165,6 +268,111 @@ def convert_to_pure_sparql(in_path_intem_sparql: str, out_path_pure_sparql: str,
         f.writelines('\n'.join(pure_sparql))
 
 
+def read_query_chunks(in_path_intem_sparql: str, chunk_size: int) -> Iterator[List[str]]:
+    # lines of the file in chunks, blank lines at the start and at the end are dropped like read().strip() does
+    chunk: List[str] = []
+    blank_lines: List[str] = []
+    started = False
+
+    with open(in_path_intem_sparql, 'r', encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line.strip():
+                if started:
+                    blank_lines.append(line)
+                continue
+
+            started = True
+            chunk.extend(blank_lines)
+            blank_lines = []
+            chunk.append(line)
+
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def convert_chunk(interm_sparql: List[str], escape: bool) -> List[str]:
+    pure_sparql = PURE_SPARQL_DECODER.convert_many(interm_sparql)
+
+    if escape:
+        pure_sparql = escape_many(pure_sparql)
+
+    return pure_sparql
+
+
+def convert_to_pure_sparql_parallel(in_path_intem_sparql: str, out_path_pure_sparql: str, escape: bool = False, workers: int = 2, chunk_size: int = 10000) -> None:
+    # Same output as convert_to_pure_sparql, but the queries are read, converted by a pool of workers and written chunk
+    # by chunk. At most 2 chunks per worker are in flight, so the memory used does not depend on the size of the file.
+    first_line = True
+
+    with multiprocessing.Pool(workers) as pool, open(out_path_pure_sparql, 'w', encoding="utf-8") as f, tqdm(unit='queries') as progress:
+        pending: Deque[multiprocessing.pool.AsyncResult] = deque()
+
+        def write_next_chunk() -> None:
+            nonlocal first_line
+            pure_sparql = pending.popleft().get()
+            if not pure_sparql:
+                return
+
+            if not first_line:
+                f.write('\n')
+            f.write('\n'.join(pure_sparql))
+            first_line = False
+            progress.update(len(pure_sparql))
+
+        for chunk in read_query_chunks(in_path_intem_sparql, chunk_size):
+            pending.append(pool.apply_async(convert_chunk, (chunk, escape)))
+            if len(pending) >= 2 * workers:
+                write_next_chunk()
+
+        while pending:
+            write_next_chunk()
+
+
+def benchmark(interm_sparql_path: str, repeat: int) -> None:
+    with open(interm_sparql_path, 'r', encoding="utf-8") as f:
+        interm_sparql = f.read().strip().split('\n')
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        expected = [interm_sparql_to_pure_sparql_sequential(q) for q in interm_sparql]
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        converted = PURE_SPARQL_DECODER.convert_many(interm_sparql)
+    decoder_time = time.perf_counter() - start
+
+    mismatches = [(q, e, c) for q, e, c in zip(interm_sparql, expected, converted) if e != c]
+    for query, e, c in mismatches[:10]:
+        print(f"[MISMATCH] {query}\n\tsequential: {e}\n\tdecoder:    {c}")
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        expected_escaped = [escape_query_sequential(q) for q in converted]
+    sequential_escape_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        escaped = escape_many(converted)
+    escape_time = time.perf_counter() - start
+
+    escape_mismatches = [(q, e, c) for q, e, c in zip(converted, expected_escaped, escaped) if e != c]
+    for query, e, c in escape_mismatches[:10]:
+        print(f"[MISMATCH] {query}\n\tsequential: {e}\n\tsingle pass: {c}")
+
+    n_queries = len(interm_sparql) * repeat
+    print(f"{interm_sparql_path}: {len(interm_sparql)} queries, {len(mismatches)} conversion mismatches, {len(escape_mismatches)} escape mismatches")
+    print(f"conversion, sequential: {n_queries / sequential_time:.0f} queries/s")
+    print(f"conversion, decoder: {n_queries / decoder_time:.0f} queries/s ({sequential_time / decoder_time:.1f}x)")
+    print(f"escape, sequential: {n_queries / sequential_escape_time:.0f} queries/s")
+    print(f"escape, single pass: {n_queries / escape_time:.0f} queries/s ({sequential_escape_time / escape_time:.1f}x)")
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(
@@ -173,11 +381,30 @@ if __name__ == "__main__":
     parser.add_argument("--in", dest='in_file', type=str, required=True,
                         help="path to the txt file containing intermediary sparql queries separated by newlines")
 
-    parser.add_argument("--out", type=str, required=True,
+    parser.add_argument("--out", type=str, default=None,
                         help="path to the txt file containing converted pure sparql queries separated by newlines")
 
     parser.add_argument("--escape", "-e", action="store_true", default=False,
                         help="wether or not to escape the queries to make them runnable on dbpedia")
 
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes converting the queries, with more than 1 the file is streamed in chunks")
+
+    parser.add_argument("--chunk_size", type=int, default=10000,
+                        help="number of queries sent to a worker at once when --workers is more than 1")
+
+    parser.add_argument("--benchmark", action="store_true", default=False,
+                        help="instead of converting, checks the decoder and the single pass escaping against the sequential versions on --in and reports the throughput of both")
+
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="number of passes over the queries for --benchmark")
+
     args = parser.parse_args()
-    convert_to_pure_sparql(args.in_file, args.out, escape=args.escape)
+    if args.benchmark:
+        benchmark(args.in_file, args.repeat)
+    elif args.out is None:
+        parser.error("--out is required unless --benchmark is set")
+    elif args.workers > 1:
+        convert_to_pure_sparql_parallel(args.in_file, args.out, escape=args.escape, workers=args.workers, chunk_size=args.chunk_size)
+    else:
+        convert_to_pure_sparql(args.in_file, args.out, escape=args.escape)
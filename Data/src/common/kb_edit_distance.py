@@ -0,0 +1,153 @@
+# edit distance between the sequences of kb elements (dbr_, dbo_... tokens) of a target and of its prediction. The
+# elements are interned as integer ids, so there is no limit to the number of distinct elements of an entry, and the
+# distances of a whole report can be computed in batches with numpy
+
+import argparse
+import random
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from common.report_stream import iter_report
+
+KB_TAGS = ('dbr', 'dbc', 'dbp', 'dbo')
+
+DEFAULT_BATCH_SIZE = 4096
+
+IdPair = Tuple[Sequence[int], Sequence[int]]
+
+
+def kb_elements(query: str) -> List[str]:
+    return [w for w in query.split() if w[:3] in KB_TAGS]
+
+
+class KBInterner:
+    # integer id of each kb element seen, the same element always gets the same id
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+
+    def encode(self, elements: Iterable[str]) -> List[int]:
+        return [self.ids.setdefault(element, len(self.ids)) for element in elements]
+
+    def encode_entry(self, entry: Dict) -> IdPair:
+        # ids of the kb elements of the target and of the prediction of a report entry
+        return self.encode(kb_elements(entry['trg'])), self.encode(kb_elements(entry['predicted']))
+
+
+def edit_distance(a: Sequence[int], b: Sequence[int]) -> int:
+    # levenshtein distance of two sequences of ids, keeping two rows of the dynamic programming table
+    if len(a) < len(b):
+        a, b = b, a
+
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y)))
+        previous = current
+    return previous[-1]
+
+
+def edit_distances(pairs: Sequence[IdPair], batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+    # Distances of all the pairs. The pairs are sorted by length and batch_size of them are padded into arrays, the
+    # tables of a batch are then filled a row at a time: the deletions and substitutions of a row are elementwise, its
+    # insertions a running minimum along the row (D[i][j] = j + min over k <= j of D'[i][k] - k)
+    lengths_a = np.array([len(a) for a, _ in pairs], dtype=np.int64)
+    lengths_b = np.array([len(b) for _, b in pairs], dtype=np.int64)
+    distances = np.zeros(len(pairs), dtype=np.int64)
+
+    order = np.lexsort((lengths_b, lengths_a))
+    for start in range(0, len(pairs), batch_size):
+        batch = order[start:start + batch_size]
+        batch_a, batch_b = lengths_a[batch], lengths_b[batch]
+        width = int(batch_b.max())
+
+        # the padding values never match, the cells they reach are not read
+        a = np.full((len(batch), int(batch_a.max())), -1, dtype=np.int64)
+        b = np.full((len(batch), width), -2, dtype=np.int64)
+        for k, i in enumerate(batch):
+            a[k, :batch_a[k]] = pairs[i][0]
+            b[k, :batch_b[k]] = pairs[i][1]
+
+        columns = np.arange(width + 1, dtype=np.int64)
+        previous = np.tile(columns, (len(batch), 1))
+        result = batch_b.copy()
+
+        for i in range(1, a.shape[1] + 1):
+            best = np.minimum(previous[:, :-1] + (a[:, i - 1:i] != b), previous[:, 1:] + 1)
+            shifted = np.concatenate([np.full((len(batch), 1), i, dtype=np.int64), best - columns[1:]], axis=1)
+            previous = np.minimum.accumulate(shifted, axis=1) + columns
+
+            ending = batch_a == i
+            result[ending] = previous[ending, batch_b[ending]]
+
+        distances[batch] = result
+
+    return distances
+
+
+def similarity(distance: int, length: int) -> float:
+    # 1 for identical sequences, 0 when no element is kept. length is the sum of the lengths of both sequences
+    return (length - distance) / length if length > 0 else 1.0
+
+
+def entry_edit_distance(entry: Dict, interner: KBInterner) -> Tuple[int, int]:
+    # edit distance between the kb elements of the target and of the prediction of an entry, and their total length
+    trg, predicted = interner.encode_entry(entry)
+    return edit_distance(trg, predicted), len(trg) + len(predicted)
+
+
+def entry_edit_distances(entries: Sequence[Dict], interner: KBInterner, batch_size: int = DEFAULT_BATCH_SIZE) -> List[Tuple[int, int]]:
+    # entry_edit_distance of each entry, computed in batches
+    pairs = [interner.encode_entry(entry) for entry in entries]
+    if not pairs:
+        return []
+    distances = edit_distances(pairs, batch_size)
+    return [(int(distance), len(a) + len(b)) for distance, (a, b) in zip(distances, pairs)]
+
+
+def benchmark(report_path: str, batch_size: int, n_synthetic: int, seed: int) -> None:
+    # distances of the entries of a report (and of random sequences of ids, longer than those of a report) entry by
+    # entry and in batches
+    interner = KBInterner()
+    pairs = [interner.encode_entry(entry) for entry in iter_report(report_path)] if report_path else []
+
+    rng = random.Random(seed)
+    synthetic = [([rng.randrange(60) for _ in range(rng.randint(0, 40))], [rng.randrange(60) for _ in range(rng.randint(0, 40))])
+                 for _ in range(n_synthetic)]
+
+    for name, dataset in (('report', pairs), ('synthetic', synthetic)):
+        if not dataset:
+            continue
+        print(f"{name}: {len(dataset)} pairs, {max(len(a) + len(b) for a, b in dataset)} elements at most")
+
+        start = time.perf_counter()
+        single = [edit_distance(a, b) for a, b in dataset]
+        print(f"\tone at a time: {time.perf_counter() - start:.3f}s")
+
+        start = time.perf_counter()
+        batched = edit_distances(dataset, batch_size)
+        print(f"\tbatched: {time.perf_counter() - start:.3f}s")
+
+        if list(batched) != single:
+            raise ValueError("The batched distances differ from the distances computed one at a time")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the kb element edit distances of a report one at a time and in batches.")
+
+    parser.add_argument("--in", dest='in_file', type=str, default=None,
+                        help="path to the json (or json lines) file containing the generated error report")
+
+    parser.add_argument("--batch_size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="number of pairs of sequences whose distances are computed together")
+
+    parser.add_argument("--synthetic", type=int, default=20000,
+                        help="number of pairs of random sequences of ids also timed")
+
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the random sequences")
+
+    args = parser.parse_args()
+    benchmark(args.in_file, args.batch_size, args.synthetic, args.seed)
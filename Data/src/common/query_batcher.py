@@ -0,0 +1,195 @@
+# packing of queries that differ only by their resources into a single query with a VALUES block, so that a template
+# heavy dataset needs a round trip per group of queries instead of one per query
+
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, cast
+
+from common.consts import SPARQL_KEYWORDS
+from common.query_cache import QueryCache
+from common.query_executor import QueryResult
+from common.sparql_canonicalizer import EXPRESSION_KEYWORDS, SPARQL_TOKEN_RE, parse_expression
+
+DEFAULT_MAX_BATCH = 50
+
+# virtuoso truncates results to this many rows, a batch result that reaches it may be missing rows of some queries
+DBPEDIA_MAX_ROWS = 10000
+
+BATCH_VAR = '?__batch'
+SLOT_VAR = '?__slot'
+
+# a query using one of these cannot be packed: its answer for one row of the VALUES block would not be the answer of
+# the query alone (aggregates, limits, minus with no shared variable...) or the rewrite would be ambiguous
+UNBATCHABLE_KEYWORDS = {'count', 'sum', 'min', 'max', 'avg', 'sample', 'group_concat', 'group', 'having', 'limit',
+                        'offset', 'values', 'bind', 'minus', 'graph', 'service', 'from', 'construct', 'describe'}
+
+STRUCTURE_TOKENS = {'{', '}', '.', ';', ',', '[', ']', '(', ')'}
+
+
+class QueryBatch:
+    # queries[i] of the batch is the query at members[i] with the tokens at the slot positions replaced by slot_values[i]
+    def __init__(self, members: List[int], tokens: List[str], slots: List[int], slot_values: List[List[str]],
+                 template_id: Hashable = None):
+        self.members = members
+        self.template_id = template_id
+        self.ask = tokens[0] == 'ask'
+
+        slot_vars = {position: f'{SLOT_VAR}{k}' for k, position in enumerate(slots)}
+        self.batch_vars = {BATCH_VAR[1:]} | {var[1:] for var in slot_vars.values()}
+
+        rows = ' '.join(f"( {i} {' '.join(values)} )" for i, values in enumerate(slot_values))
+        values_block = f"values ( {BATCH_VAR} {' '.join(slot_vars.values())} ) {{ {rows} }}"
+
+        tokens = [slot_vars.get(position, token) for position, token in enumerate(tokens)]
+        where = tokens.index('{')
+        head = tokens[:where]
+        if self.ask:
+            head = ['select', 'distinct', BATCH_VAR] + head[1:]
+        elif '*' not in head:
+            head = head[:-1] + [BATCH_VAR, 'where'] if head[-1] == 'where' else head + [BATCH_VAR]
+        self.query = ' '.join(head + ['{', values_block] + tokens[where + 1:])
+
+    def split(self, result: Dict[Any, Any]) -> Optional[List[Dict[Any, Any]]]:
+        # the result of each member query, None if the batch result may have been truncated
+        bindings = result.get('results', {}).get('bindings', [])
+        if len(bindings) >= DBPEDIA_MAX_ROWS:
+            return None
+
+        if self.ask:
+            found = {int(binding[BATCH_VAR[1:]]['value']) for binding in bindings}
+            return [{'head': {'link': []}, 'boolean': i in found} for i in range(len(self.members))]
+
+        per_member: List[List[Dict[str, Any]]] = [[] for _ in self.members]
+        for binding in bindings:
+            per_member[int(binding[BATCH_VAR[1:]]['value'])].append(
+                {var: term for var, term in binding.items() if var not in self.batch_vars})
+
+        head = {**result.get('head', {}), 'vars': [v for v in result.get('head', {}).get('vars', []) if v not in self.batch_vars]}
+        return [{'head': head, 'results': {**result.get('results', {}), 'bindings': member_bindings}}
+                for member_bindings in per_member]
+
+
+def _tokenize(query: str) -> List[str]:
+    tokens = SPARQL_TOKEN_RE.findall(query)
+    return [t.lower() if t.lower() in SPARQL_KEYWORDS else t for t in tokens]
+
+
+def term_slots(tokens: List[str]) -> Optional[List[int]]:
+    # positions of the iris and literals of the triple patterns of a packable query, None if it cannot be packed
+    if not tokens or tokens[0] not in ('select', 'ask') or '{' not in tokens or tokens.count('select') > 1:
+        return None
+    if any(t in UNBATCHABLE_KEYWORDS for t in tokens):
+        return None
+    where = tokens.index('{')
+    if '(' in tokens[:where]:
+        return None
+
+    slots = []
+    depth = 0
+    i = where
+    while i < len(tokens):
+        token = tokens[i]
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            depth -= 1
+            if depth == 0:
+                break
+        elif token in EXPRESSION_KEYWORDS:
+            # only the terms of triple patterns become variables, a filter keeps its constants
+            _, i = parse_expression(tokens, i + 1)
+            continue
+        elif token not in STRUCTURE_TOKENS and token not in SPARQL_KEYWORDS and token[0] not in '?$' and token != 'a':
+            slots.append(i)
+        i += 1
+
+    return slots
+
+
+def plan_batches(queries: Sequence[str], template_ids: Optional[Sequence[Hashable]] = None,
+                 max_batch: int = DEFAULT_MAX_BATCH) -> Tuple[List[QueryBatch], List[int]]:
+    # Queries of the same template that only differ by the terms of their triple patterns are packed, max_batch at a
+    # time. Without template ids the shape of the queries alone groups them. Returns the batches and the indexes of the
+    # queries left alone.
+    groups: Dict[Tuple[Hashable, Tuple[str, ...]], List[int]] = {}
+    tokenized: Dict[int, Tuple[List[str], List[int]]] = {}
+    singles = []
+
+    for i, query in enumerate(queries):
+        tokens = _tokenize(query)
+        slots = term_slots(tokens)
+        if not slots:
+            singles.append(i)
+            continue
+
+        tokenized[i] = (tokens, slots)
+        shape = list(tokens)
+        for position in slots:
+            shape[position] = ''
+        template_id = template_ids[i] if template_ids is not None else None
+        groups.setdefault((template_id, tuple(shape)), []).append(i)
+
+    batches = []
+    for (template_id, _), members in groups.items():
+        for start in range(0, len(members), max_batch):
+            chunk = members[start:start + max_batch]
+            if len(chunk) == 1:
+                singles.extend(chunk)
+                continue
+
+            tokens, slots = tokenized[chunk[0]]
+            varying = [p for p in slots if len({tokenized[i][0][p] for i in chunk}) > 1]
+            batches.append(QueryBatch(chunk, tokens, varying, [[tokenized[i][0][p] for p in varying] for i in chunk], template_id))
+
+    return batches, sorted(singles)
+
+
+def run_batched(queries: Sequence[str], run: Callable[[List[str]], List[QueryResult]],
+                template_ids: Optional[Sequence[Hashable]] = None, max_batch: int = DEFAULT_MAX_BATCH,
+                labels: Optional[Dict[str, Hashable]] = None, cache: Optional[QueryCache] = None, endpoint: str = '',
+                refresh: bool = False, run_batches: Optional[Callable[[List[str]], List[QueryResult]]] = None) -> List[QueryResult]:
+    # run sends a list of queries and gives their results in order, run_batches (run by default) does the same for the
+    # batched queries. The batches are sent first, the queries of a batch that failed or may have been truncated are
+    # then sent alone with the queries that could not be packed. The template id of each batched query is added to
+    # labels if given.
+    # With a cache, the queries already in it (unless refresh) are not packed but sent alone so that run finds them
+    # there, and the result of each query of a batch is stored under the query itself: the batched queries are not
+    # worth caching since the same batch is unlikely to be sent again, run_batches should not cache them.
+    cached = set()
+    if cache is not None and not refresh:
+        cached = {i for i, query in enumerate(queries) if cache.contains(query, endpoint)}
+    pending = [i for i in range(len(queries)) if i not in cached]
+
+    batches, pending_singles = plan_batches([queries[i] for i in pending],
+                                            [template_ids[i] for i in pending] if template_ids is not None else None, max_batch)
+    for batch in batches:
+        batch.members = [pending[i] for i in batch.members]
+    singles = [pending[i] for i in pending_singles] + list(cached)
+
+    if labels is not None:
+        labels.update((batch.query, batch.template_id) for batch in batches)
+    results: List[Optional[QueryResult]] = [None] * len(queries)
+
+    n_batched = 0
+    run_batches = run_batches if run_batches is not None else run
+    for batch, batch_result in zip(batches, run_batches([batch.query for batch in batches]) if batches else []):
+        member_results = None if isinstance(batch_result, Exception) else batch.split(batch_result)
+        if member_results is None:
+            singles.extend(batch.members)
+            continue
+
+        n_batched += len(batch.members)
+        for i, member_result in zip(batch.members, member_results):
+            results[i] = member_result
+            if cache is not None:
+                cache.put(queries[i], endpoint, member_result)
+
+    print(f"{n_batched} queries packed in {len(batches)} batched queries, {len(singles)} queries sent alone ({len(cached)} cached)")
+    singles.sort()
+    for i, result in zip(singles, run([queries[i] for i in singles]) if singles else []):
+        results[i] = result
+
+    # every query gets its result in its slot, a result missing (a run giving fewer results than queries) would shift
+    # the results of the next queries if the empty slots were dropped
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        raise ValueError(f"No result for {len(missing)} of {len(queries)} queries, the first one: {queries[missing[0]]}")
+    return cast(List[QueryResult], results)
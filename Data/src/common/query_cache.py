@@ -0,0 +1,163 @@
+# on-disk cache of sparql query results, can also be run as a script to see or clear its content
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+DEFAULT_CACHE_PATH = 'dbpedia_cache.sqlite'
+
+
+def normalize_query(query: str) -> str:
+    return ' '.join(query.split())
+
+
+def query_key(query: str, endpoint: str) -> str:
+    return hashlib.sha256(f'{endpoint}\n{normalize_query(query)}'.encode('utf-8')).hexdigest()
+
+
+class QueryCache:
+    # SQLite table of query results keyed by the hash of the endpoint and the normalized query.
+    # Entries older than ttl seconds are treated as missing and removed, and when there are more than max_entries the
+    # least recently used ones are removed. hits and misses count the lookups since the cache was opened.
+    # The connection is shared by the threads using the cache, one statement and its commit at a time.
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, endpoint TEXT, query TEXT, result TEXT, created_at REAL, accessed_at REAL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at)')
+        self.connection.commit()
+
+    def get(self, query: str, endpoint: str) -> Optional[Dict[Any, Any]]:
+        with self.lock:
+            return self._get(query, endpoint)
+
+    def _get(self, query: str, endpoint: str) -> Optional[Dict[Any, Any]]:
+        key = query_key(query, endpoint)
+        row = self.connection.execute('SELECT result, created_at FROM results WHERE key = ?', (key,)).fetchone()
+
+        if row is not None and self.ttl is not None and time.time() - row[1] > self.ttl:
+            self.connection.execute('DELETE FROM results WHERE key = ?', (key,))
+            self.connection.commit()
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.connection.execute('UPDATE results SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        self.connection.commit()
+        result: Dict[Any, Any] = json.loads(row[0])
+        return result
+
+    def contains(self, query: str, endpoint: str) -> bool:
+        # whether get would find the query, without counting a hit or a miss or touching the entry
+        with self.lock:
+            row = self.connection.execute('SELECT created_at FROM results WHERE key = ?', (query_key(query, endpoint),)).fetchone()
+        return row is not None and (self.ttl is None or time.time() - row[0] <= self.ttl)
+
+    def put(self, query: str, endpoint: str, result: Dict[Any, Any]) -> None:
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO results (key, endpoint, query, result, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (query_key(query, endpoint), endpoint, normalize_query(query), json.dumps(result), now, now))
+
+            if self.max_entries is not None:
+                self.connection.execute(
+                    'DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,))
+
+            self.connection.commit()
+
+    def evict_expired(self) -> int:
+        if self.ttl is None:
+            return 0
+
+        deleted = self.connection.execute('DELETE FROM results WHERE created_at < ?', (time.time() - self.ttl,)).rowcount
+        self.connection.commit()
+        return deleted
+
+    def clear(self) -> None:
+        self.connection.execute('DELETE FROM results')
+        self.connection.commit()
+
+    def __len__(self) -> int:
+        count: int = self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        return count
+
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses}
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+_OPEN_CACHES: Dict[str, QueryCache] = {}
+
+
+def open_cache(path: Optional[str] = DEFAULT_CACHE_PATH, ttl: Optional[float] = None, max_entries: Optional[int] = None) -> Optional[QueryCache]:
+    # caches are shared by path so that successive calls reuse the connection and add up their hits and misses, the ttl
+    # and max_entries given replace those of the cache already open
+    if path is None:
+        return None
+
+    if path not in _OPEN_CACHES:
+        _OPEN_CACHES[path] = QueryCache(path, ttl=ttl, max_entries=max_entries)
+    cache = _OPEN_CACHES[path]
+    if ttl is not None:
+        cache.ttl = ttl
+    if max_entries is not None:
+        cache.max_entries = max_entries
+    return cache
+
+
+@contextmanager
+def temporary_cache() -> Iterator[QueryCache]:
+    # a cache in a temporary directory removed on exit, for results that are only needed for a while but too many to be
+    # kept in memory
+    with tempfile.TemporaryDirectory() as directory:
+        cache = QueryCache(os.path.join(directory, 'results.sqlite'))
+        try:
+            yield cache
+        finally:
+            cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show or clear the content of a sparql results cache.")
+
+    parser.add_argument("--cache", type=str, default=DEFAULT_CACHE_PATH,
+                        help="path to the sqlite file of the cache")
+
+    parser.add_argument("--ttl", type=float, default=None,
+                        help="if set, removes the entries older than this many seconds")
+
+    parser.add_argument("--clear", action="store_true", default=False,
+                        help="removes all the entries")
+
+    args = parser.parse_args()
+    cache = QueryCache(args.cache, ttl=args.ttl)
+
+    if args.clear:
+        cache.clear()
+    print(f"{cache.evict_expired()} expired entries removed")
+    print(f"{len(cache)} entries in {args.cache}")
+    cache.close()
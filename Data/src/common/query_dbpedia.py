@@ -2,19 +2,50 @@
 
 import json
 import argparse
-from typing import Any, Dict
+import os
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Set
 from SPARQLWrapper import SPARQLWrapper, JSON
 from tqdm import tqdm
 
 import ssl
+from common.cassette import Cassette, open_cassette
 from common.interm_sparql_to_pure_sparql import escape_query
+from common.query_batcher import run_batched
+from common.query_cache import DEFAULT_CACHE_PATH, QueryCache, open_cache
+from common.query_executor import QueryExecutor, QueryResult
+from common.query_metrics import QueryMetrics
+from common.query_retry import CircuitBreaker, RetryPolicy
+from common.triple_store import TripleStore
 ssl._create_default_https_context = ssl._create_unverified_context
 
 ENDPOINT = "http://dbpedia.org/sparql"
 GRAPH = "http://dbpedia.org"
 
 
-def query_dbpedia(query: str) -> Dict[Any, Any]:
+def query_dbpedia(query: str, cache: Optional[QueryCache] = None, refresh: bool = False,
+                  local_store: Optional[TripleStore] = None, cassette: Optional[Cassette] = None) -> Dict[Any, Any]:
+    # with a local store, the query runs on it instead of the endpoint (and the cache is not used)
+    # with a cache, the endpoint is only queried on a miss (or always if refresh) and successful results are stored
+    # with a cassette, the query is recorded (and the cache is not read) or replayed instead of being sent
+    if local_store is not None:
+        return local_store.query(query)
+
+    if cache is not None and not refresh and not (cassette is not None and cassette.recording):
+        cached = cache.get(query, ENDPOINT)
+        if cached is not None:
+            return cached
+
+    if cassette is not None:
+        response = cassette.play(query, _send_query, ENDPOINT)
+    else:
+        response = _send_query(query)
+
+    if cache is not None:
+        cache.put(query, ENDPOINT, response)
+    return response
+
+
+def _send_query(query: str) -> Dict[Any, Any]:
     sparql = SPARQLWrapper(ENDPOINT)
     sparql.setReturnFormat(JSON)
 
@@ -24,33 +55,232 @@ def query_dbpedia(query: str) -> Dict[Any, Any]:
     return response
 
 
-def fetch_dbpedia_answers(json_dataset_path: str, force_all: bool = False) -> None:
+def query_dbpedia_many(queries: List[str], cache: Optional[QueryCache] = None, refresh: bool = False, concurrency: int = 8,
+                       rate: Optional[float] = None, timeout: float = 60.0, local_store: Optional[TripleStore] = None,
+                       local_workers: int = 1, cassette: Optional[Cassette] = None, batch: bool = False,
+                       template_ids: Optional[Sequence[Hashable]] = None, retries: int = 3,
+                       metrics: Optional[QueryMetrics] = None) -> List[QueryResult]:
+    # results in the order of the queries, the exception raised by a query takes the place of its result
+    # with batch, queries of the same template (or of the same shape without template ids) are packed in VALUES queries
+    # with metrics, each query sent to dbpedia is recorded in it, labelled with its template id
+    if local_store is not None:
+        return local_store.query_many(queries, local_workers)
+
+    if metrics is not None and template_ids is not None:
+        metrics.labels.update(zip(queries, template_ids))
+
+    executor = create_executor(concurrency, rate, timeout, cache, cassette, retries, metrics)
+    with tqdm(total=None if batch else len(queries)) as progress:
+        run_queries = lambda sent: executor.run(sent, refresh=refresh, progress=progress)
+        if batch:
+            run_batches = lambda sent: executor.run(sent, progress=progress, use_cache=False)
+            results = run_batched(queries, run_queries, template_ids, labels=metrics.labels if metrics is not None else None,
+                                  cache=cache, endpoint=ENDPOINT, refresh=refresh or reads_skipped(cassette),
+                                  run_batches=run_batches)
+        else:
+            results = run_queries(queries)
+    executor.close()
+    print_retries(executor)
+
+    return results
+
+
+def create_executor(concurrency: int, rate: Optional[float], timeout: float, cache: Optional[QueryCache],
+                    cassette: Optional[Cassette], retries: int, metrics: Optional[QueryMetrics] = None) -> QueryExecutor:
+    # queries failing for a transient reason (timeout, 503...) are retried with a backoff, and all the queries pause
+    # while dbpedia fails most of them
+    return QueryExecutor(ENDPOINT, concurrency=concurrency, rate=rate, timeout=timeout, cache=cache, cassette=cassette,
+                         retry=RetryPolicy(retries) if retries > 0 else None, breaker=CircuitBreaker(), metrics=metrics)
+
+
+def reads_skipped(cassette: Optional[Cassette]) -> bool:
+    # a recording cassette gets every query, none is read from the cache
+    return cassette is not None and cassette.recording
+
+
+def print_retries(executor: QueryExecutor) -> None:
+    if executor.retried > 0:
+        print(f"{executor.retried} queries were retried after a transient failure")
+
+
+def print_cache_stats(cache: Optional[QueryCache]) -> None:
+    if cache is not None:
+        stats = cache.stats()
+        print(f"cache {cache.path}: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+
+
+def read_checkpoint_ids(checkpoint_path: str) -> Set[str]:
+    # ids of the entries already in the result log, a last line cut by a crash is removed so that appends stay valid
+    if not os.path.exists(checkpoint_path):
+        return set()
+
+    ids = set()
+    valid_size = 0
+    with open(checkpoint_path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+
+            ids.add(json.loads(line)['_id'])
+            valid_size += len(line)
+
+    if valid_size != os.path.getsize(checkpoint_path):
+        with open(checkpoint_path, 'r+b') as f:
+            f.truncate(valid_size)
+
+    return ids
+
+
+def merge_checkpoint(dataset: List[Dict[str, Any]], checkpoint_path: str) -> int:
+    entries_by_id = {str(entry['_id']): entry for entry in dataset}
+
+    merged = 0
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            logged = json.loads(line)
+            entry = entries_by_id[logged['_id']]
+            entry['dbpedia_result'] = logged['dbpedia_result']
+            entry.pop('query_result', None)
+            merged += 1
+
+    return merged
+
+
+def fetch_dbpedia_answers(json_dataset_path: str, force_all: bool = False, cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+                          concurrency: int = 8, rate: Optional[float] = None, timeout: float = 60.0,
+                          checkpoint_every: int = 500, local_store_paths: Optional[List[str]] = None, local_workers: int = 1,
+                          cassette: Optional[Cassette] = None, batch: bool = False, retries: int = 3,
+                          cache_ttl: Optional[float] = None, cache_max_entries: Optional[int] = None) -> None:
+    # Results are appended to <dataset>.results.jsonl every checkpoint_every queries instead of being kept in memory.
+    # A run that stops before the end picks up after the last logged entry, the log is merged into the dataset and
+    # removed once all the queries were sent. Failed queries are not logged, they are left without a result and retried
+    # by the next run.
     with open(json_dataset_path, 'r', encoding='utf-8') as f:
         dataset = json.load(f)
 
+    checkpoint_path = f'{json_dataset_path}.results.jsonl'
+    done_ids = read_checkpoint_ids(checkpoint_path)
+    if done_ids:
+        print(f"Resuming after {len(done_ids)} logged results")
+
+    entries = [entry for entry in dataset if str(entry['_id']) not in done_ids
+               and (force_all or (entry.get('dbpedia_result') is None and entry.get('query_result') is None))]
+
+    if local_store_paths:
+        local_store = TripleStore.from_files(local_store_paths)
+        cache = None
+        run_queries = lambda queries: local_store.query_many(queries, local_workers)
+    else:
+        cache = open_cache(cache_path, cache_ttl, cache_max_entries)
+        executor = create_executor(concurrency, rate, timeout, cache, cassette, retries)
+        run_queries = lambda queries: executor.run(queries, refresh=force_all)
+        if batch:
+            run_endpoint = run_queries
+            run_queries = lambda queries: run_batched(queries, run_endpoint, cache=cache, endpoint=ENDPOINT,
+                                                      refresh=force_all or reads_skipped(cassette),
+                                                      run_batches=lambda sent: executor.run(sent, use_cache=False))
+
     print("Running queries:")
-    for entry in tqdm(dataset):
-        if force_all or ("query_result" not in entry or entry["query_result"] is None):
-            try:
-                entry["query_result"] = query_dbpedia(
-                    escape_query(entry["query"]["pure_sparql"]))
+    n_errors = 0
+    with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint, tqdm(total=len(entries)) as progress:
+        for i in range(0, len(entries), checkpoint_every):
+            chunk = entries[i:i + checkpoint_every]
+            results = run_queries([escape_query(entry["query"]["pure_sparql"]) for entry in chunk])
+            progress.update(len(chunk))
+
+            for entry, result in zip(chunk, results):
+                if isinstance(result, Exception):
+                    print(f"[ERROR] at query id {entry['_id']}:")
+                    print(result)
+                    n_errors += 1
+                else:
+                    checkpoint.write(json.dumps({'_id': str(entry['_id']), 'dbpedia_result': result}) + '\n')
 
-            except Exception as error:
-                print(f"[ERROR] at query id {entry['_id']}:")
-                print(error)
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
 
-    with open(json_dataset_path, 'w', encoding='utf-8') as f:
+    if not local_store_paths:
+        executor.close()
+        print_retries(executor)
+    print_cache_stats(cache)
+
+    if n_errors > 0:
+        print(f"{n_errors} queries failed, run again to retry them")
+
+    for entry in dataset:
+        if 'query_result' in entry:
+            entry['dbpedia_result'] = entry.pop('query_result')
+    print(f"Merging {merge_checkpoint(dataset, checkpoint_path)} results")
+
+    tmp_path = f'{json_dataset_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(dataset, f, indent=4)
+    os.replace(tmp_path, json_dataset_path)
+    os.remove(checkpoint_path)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Fetch query results from dbpedia.")
 
     parser.add_argument("--in", dest='in_file', type=str, required=True,
-                        help="path to the json file containing the dataset")
+                        help="path to the json file containing the dataset. Results are appended to <dataset>.results.jsonl as they come so "
+                             "that an interrupted run resumes where it stopped, and merged into the dataset at the end")
 
     parser.add_argument("--force_all", "-f", action="store_true", default=False,
                         help="wether or not to force refetch of ALL queries")
 
+    parser.add_argument("--cache", type=str, default=DEFAULT_CACHE_PATH,
+                        help="path to the sqlite file caching the query results (default: %(default)s)")
+
+    parser.add_argument("--no_cache", action="store_true", default=False,
+                        help="always query dbpedia without reading or writing the cache")
+
+    parser.add_argument("--cache_ttl", type=float, default=None,
+                        help="if set, seconds after which a cached result is expired and the query sent again")
+
+    parser.add_argument("--cache_max_entries", type=int, default=None,
+                        help="if set, maximum number of results in the cache, the least recently used ones are removed")
+
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="maximum number of queries sent to dbpedia at the same time")
+
+    parser.add_argument("--rate", type=float, default=None,
+                        help="if set, maximum number of queries sent to dbpedia per second")
+
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="seconds after which a query is considered failed")
+
+    parser.add_argument("--checkpoint_every", type=int, default=500,
+                        help="number of queries between two writes to the result log")
+
+    parser.add_argument("--local_store", type=str, nargs='+', default=None,
+                        help="n-triples/turtle dump(s) to load in an in-memory triple store queried instead of dbpedia")
+
+    parser.add_argument("--local_workers", type=int, default=1,
+                        help="number of processes running the queries on the local store")
+
+    parser.add_argument("--record", type=str, default=None,
+                        help="if set, path to a gzipped cassette where every query sent and its answer are recorded")
+
+    parser.add_argument("--replay", type=str, default=None,
+                        help="if set, path to a cassette recorded with --record that answers the queries instead of dbpedia")
+
+    parser.add_argument("--replay_latency", type=float, default=None,
+                        help="seconds a replayed query takes, the recorded durations by default")
+
+    parser.add_argument("--batch", action='store_true', default=False,
+                        help="pack the queries that only differ by their resources in VALUES queries")
+
+    parser.add_argument("--retries", type=int, default=3,
+                        help="number of times a query failing for a transient reason (timeout, 503...) is sent again")
+
     args = parser.parse_args()
-    fetch_dbpedia_answers(args.in_file, force_all=args.force_all)
+    cassette = open_cassette(args.record, args.replay, args.replay_latency)
+    fetch_dbpedia_answers(args.in_file, force_all=args.force_all, cache_path=None if args.no_cache else args.cache,
+                          concurrency=args.concurrency, rate=args.rate, timeout=args.timeout,
+                          checkpoint_every=args.checkpoint_every, local_store_paths=args.local_store,
+                          local_workers=args.local_workers, cassette=cassette,
+                          batch=args.batch, retries=args.retries, cache_ttl=args.cache_ttl,
+                          cache_max_entries=args.cache_max_entries)
+    if cassette is not None:
+        cassette.close()
@@ -0,0 +1,407 @@
+# concurrent execution of sparql queries over pooled http connections, can also be run as a benchmark against a local
+# mock endpoint or a recorded cassette
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+import http.client
+import json
+import queue
+import socket
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlencode, urljoin, urlparse
+
+from common.cassette import Cassette
+from common.query_cache import QueryCache
+from common.query_metrics import QueryMetrics, percentile
+from common.query_retry import CircuitBreaker, CircuitOpenError, HTTPError, RetryPolicy, is_transient
+from common.sparql_mock_server import MockSparqlServer
+
+# same parameters and accept header as SPARQLWrapper with the JSON return format
+RETURN_FORMAT_PARAMETERS = ('format', 'output', 'results')
+ACCEPT_JSON = 'application/sparql-results+json,application/json,text/javascript,application/javascript'
+USER_AGENT = 'sparqlwrapper 2.0.0 (rdflib.github.io/sparqlwrapper)'
+
+# redirects followed by a query, the pool then sends every query to the new location (http to https...)
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+QueryResult = Union[Dict[Any, Any], Exception]
+
+
+class TokenBucket:
+    # allows bursts of up to capacity queries, then rate queries per second
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class PooledRequest:
+    # the connection a query is being sent on, so that the query can be aborted from another thread when it times out:
+    # its socket is shut down, which wakes up the thread blocked on it, and the connection is replaced in the pool
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.connection: Optional[http.client.HTTPConnection] = None
+        self.aborted = False
+
+    def attach(self, connection: http.client.HTTPConnection) -> bool:
+        # False if the query was aborted before it got a connection
+        with self.lock:
+            self.connection = connection
+            return not self.aborted
+
+    def detach(self) -> bool:
+        # True if the query was aborted, its connection may be unusable
+        with self.lock:
+            self.connection = None
+            return self.aborted
+
+    def abort(self) -> None:
+        with self.lock:
+            self.aborted = True
+            if self.connection is not None and self.connection.sock is not None:
+                try:
+                    self.connection.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class ConnectionPool:
+    # keep-alive connections to the endpoint, a connection is only used by one query at a time and is replaced when a
+    # query fails on it since the state of the socket is unknown. Queries are sent url-encoded, in the url with GET or
+    # in the body with POST (for queries too long for an url). A query given a PooledRequest can be aborted with it.
+    # A redirect moves the pool to its location: the query is sent again there, and so are the next ones, the
+    # connections to the previous location being replaced as they are taken.
+    def __init__(self, endpoint: str, size: int, timeout: float, method: str = 'GET'):
+        self.timeout = timeout
+        self.method = method
+        self._set_endpoint(endpoint)
+
+        self.connections: queue.Queue = queue.Queue()
+        for _ in range(size):
+            self.connections.put(self._connect())
+
+    def _set_endpoint(self, endpoint: str) -> None:
+        # the connection class, host and path are replaced at once for the threads reading them
+        url = urlparse(endpoint)
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.target: Tuple[type, str, str] = (connection_class, url.netloc, url.path or '/')
+        self.endpoint = endpoint
+
+    def _connect(self) -> http.client.HTTPConnection:
+        connection_class, netloc, _ = self.target
+        connection: http.client.HTTPConnection = connection_class(netloc, timeout=self.timeout)
+        return connection
+
+    def _take(self) -> http.client.HTTPConnection:
+        connection: http.client.HTTPConnection = self.connections.get()
+        target = self._connect()
+        if type(connection) is not type(target) or (connection.host, connection.port) != (target.host, target.port):
+            connection.close()
+            return target
+        return connection
+
+    def query(self, query: str, request: Optional[PooledRequest] = None, redirects: int = 0) -> Dict[Any, Any]:
+        parameters = {'query': query, **{f: 'json' for f in RETURN_FORMAT_PARAMETERS}}
+        connection = self._take()
+        request = request if request is not None else PooledRequest()
+        if not request.attach(connection):
+            request.detach()
+            self.connections.put(connection)
+            raise TimeoutError("query aborted before it was sent")
+
+        try:
+            try:
+                response, body = self._request(connection, parameters)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if request.aborted:
+                    raise
+                # the endpoint closed the kept-alive connection while it was idle, closing it makes it reconnect
+                connection.close()
+                response, body = self._request(connection, parameters)
+
+        except Exception:
+            request.detach()
+            connection.close()
+            self.connections.put(self._connect())
+            raise
+
+        if request.detach():
+            connection.close()
+            connection = self._connect()
+        self.connections.put(connection)
+
+        if response.status in REDIRECT_STATUSES:
+            location = response.getheader('Location')
+            if location is None or redirects >= MAX_REDIRECTS:
+                raise HTTPError(response.status, f"cannot follow the redirect of {self.endpoint} to {location}")
+            # the location of a GET has the query in its parameters, the pool only keeps the endpoint
+            self._set_endpoint(urljoin(self.endpoint, location).split('?', 1)[0])
+            return self.query(query, request, redirects + 1)
+
+        if response.status != 200:
+            raise HTTPError(response.status, body.decode('utf-8', errors='replace')[:500])
+
+        result: Dict[Any, Any] = json.loads(body)
+        return result
+
+    def _request(self, connection: http.client.HTTPConnection, parameters: Dict[str, str]) -> Tuple[http.client.HTTPResponse, bytes]:
+        path = self.target[2]
+        if self.method == 'POST':
+            connection.request('POST', path, body=urlencode(parameters),
+                               headers={'Accept': ACCEPT_JSON, 'User-Agent': USER_AGENT,
+                                        'Content-Type': 'application/x-www-form-urlencoded'})
+        else:
+            connection.request('GET', f'{path}?{urlencode(parameters)}', headers={'Accept': ACCEPT_JSON, 'User-Agent': USER_AGENT})
+        response = connection.getresponse()
+        return response, response.read()
+
+    def close(self) -> None:
+        while not self.connections.empty():
+            self.connections.get().close()
+
+
+class QueryExecutor:
+    # Runs queries with at most concurrency of them in flight, each on a pooled connection. The http calls are blocking
+    # and run in a thread pool of the same size, asyncio only schedules them, enforces the rate limit and the timeouts.
+    # Results come back in the order of the queries, failed queries give their exception instead of a result.
+    # A recording cassette gets every query sent (cache reads are skipped so that none is missing from it), a replaying
+    # one answers instead of the endpoint and no connection is opened. durations has the seconds taken by each query
+    # sent (not the cached ones), failed or not, in the order they finished.
+    # With a retry policy, queries failing for a transient reason are sent again after a backoff, retried counts these
+    # new attempts. With a circuit breaker, no query is sent while the circuit is open. With metrics, every query run
+    # (cached or not) is recorded in it. Queries run with use_cache=False are neither read from nor written to the cache.
+    # The sqlite cache is blocking, it is read and written in a thread of its own so that the event loop keeps going.
+    # A query that times out is aborted, which gives its thread and its connection back to the next queries.
+    def __init__(self, endpoint: str, concurrency: int = 8, rate: Optional[float] = None, timeout: float = 60.0,
+                 cache: Optional[QueryCache] = None, cassette: Optional[Cassette] = None, method: str = 'GET',
+                 retry: Optional[RetryPolicy] = None, breaker: Optional[CircuitBreaker] = None,
+                 metrics: Optional[QueryMetrics] = None):
+        self.endpoint = endpoint
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.cache = cache
+        self.cassette = cassette
+        self.retry = retry
+        self.breaker = breaker
+        self.metrics = metrics
+        self.durations: List[float] = []
+        self.retried = 0
+
+        replaying = cassette is not None and not cassette.recording
+        self.pool = ConnectionPool(endpoint, concurrency, timeout, method) if not replaying else None
+        self.threads = ThreadPoolExecutor(max_workers=concurrency)
+        self.cache_thread = ThreadPoolExecutor(max_workers=1) if cache is not None else None
+
+    def _send(self, query: str, request: PooledRequest) -> Dict[Any, Any]:
+        pool = self.pool
+        send = (lambda q: pool.query(q, request)) if pool is not None else None
+        if self.cassette is not None:
+            return self.cassette.play(query, send, self.endpoint)
+        assert send is not None
+        return send(query)
+
+    async def _query(self, query: str, semaphore: asyncio.Semaphore, bucket: Optional[TokenBucket], refresh: bool,
+                     use_cache: bool = True) -> QueryResult:
+        start = time.perf_counter()
+        cache_status = None
+        loop = asyncio.get_running_loop()
+        if self.cache is not None and use_cache and not refresh and not (self.cassette is not None and self.cassette.recording):
+            cached = await loop.run_in_executor(self.cache_thread, self.cache.get, query, self.endpoint)
+            if cached is not None:
+                if self.metrics is not None:
+                    self.metrics.record(query, time.perf_counter() - start, cached, 'hit', 0)
+                return cached
+            cache_status = 'miss'
+
+        attempts = 1 + (self.retry.retries if self.retry is not None else 0)
+        latency = 0.0
+        for attempt in range(attempts):
+            result, duration = await self._send_once(query, semaphore, bucket)
+            latency += duration
+            if isinstance(result, CircuitOpenError):
+                break
+
+            failed = isinstance(result, Exception) and is_transient(result)
+            if self.breaker is not None:
+                self.breaker.record(failed)
+            if not failed or self.retry is None or attempt == attempts - 1:
+                break
+
+            self.retried += 1
+            await asyncio.sleep(self.retry.delay(attempt))
+
+        if self.cache is not None and use_cache and not isinstance(result, Exception):
+            await loop.run_in_executor(self.cache_thread, self.cache.put, query, self.endpoint, result)
+        if self.metrics is not None:
+            self.metrics.record(query, latency, result, cache_status, attempt + 1)
+        return result
+
+    async def _send_once(self, query: str, semaphore: asyncio.Semaphore, bucket: Optional[TokenBucket]) -> Tuple[QueryResult, float]:
+        # the result and the seconds the query took once sent, the time spent waiting for its turn is not counted
+        async with semaphore:
+            # waited for with the semaphore held so that the queries queued behind it do not go through an open circuit
+            if self.breaker is not None:
+                try:
+                    await self.breaker.wait()
+                except CircuitOpenError as error:
+                    return error, 0.0
+
+            if bucket is not None:
+                await bucket.acquire()
+
+            loop = asyncio.get_running_loop()
+            request = PooledRequest()
+            start = time.perf_counter()
+            try:
+                result: QueryResult = await asyncio.wait_for(loop.run_in_executor(self.threads, self._send, query, request), self.timeout)
+            except asyncio.TimeoutError:
+                request.abort()
+                result = TimeoutError(f"query timed out after {self.timeout}s")
+            except Exception as error:
+                result = error
+            duration = time.perf_counter() - start
+            self.durations.append(duration)
+
+        return result, duration
+
+    async def run_async(self, queries: Iterable[str], refresh: bool = False, progress: Optional[Any] = None,
+                        use_cache: bool = True) -> List[QueryResult]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        bucket = TokenBucket(self.rate) if self.rate is not None else None
+
+        async def run_one(query: str) -> QueryResult:
+            result = await self._query(query, semaphore, bucket, refresh, use_cache)
+            if progress is not None:
+                progress.update(1)
+            return result
+
+        return list(await asyncio.gather(*(run_one(q) for q in queries)))
+
+    def run(self, queries: Iterable[str], refresh: bool = False, progress: Optional[Any] = None,
+            use_cache: bool = True) -> List[QueryResult]:
+        return asyncio.run(self.run_async(queries, refresh, progress, use_cache))
+
+    def close(self) -> None:
+        self.threads.shutdown()
+        if self.cache_thread is not None:
+            self.cache_thread.shutdown()
+        if self.pool is not None:
+            self.pool.close()
+
+
+def print_latencies(name: str, elapsed: float, n_queries: int, durations: List[float]) -> None:
+    print(f"\t{name}: {elapsed:.2f}s, {n_queries / elapsed:.0f} queries/s, latency p50 {percentile(durations, 50) * 1000:.0f}ms "
+          f"p95 {percentile(durations, 95) * 1000:.0f}ms p99 {percentile(durations, 99) * 1000:.0f}ms "
+          f"max {max(durations, default=0.0) * 1000:.0f}ms")
+
+
+def benchmark(n_queries: int, latency: float, concurrency: int, jitter: float = 0.0, error_rate: float = 0.0,
+              timeout_rate: float = 0.0, timeout: float = 1.0, method: str = 'GET', retries: int = 0, backoff: float = 0.1,
+              seed: int = 0) -> None:
+    queries = [f'SELECT ?x WHERE {{ ?x ?p {i} }}' for i in range(n_queries)]
+    print(f"{n_queries} queries, {latency}s of latency per query (+{jitter}s mean jitter), {error_rate:.0%} errors, "
+          f"{timeout_rate:.0%} timeouts after {timeout}s, {method}, {retries} retries")
+
+    for n in (1, concurrency):
+        server = MockSparqlServer(latency=latency, jitter=jitter, error_rate=error_rate, timeout_rate=timeout_rate,
+                                  hang=timeout * 2, seed=seed).start()
+        executor = QueryExecutor(server.endpoint, concurrency=n, timeout=timeout, method=method,
+                                 retry=RetryPolicy(retries, backoff) if retries > 0 else None)
+        start = time.perf_counter()
+        results = executor.run(queries)
+        elapsed = time.perf_counter() - start
+        executor.close()
+        server.stop()
+
+        if any(not isinstance(r, Exception) and r['query'] != q for q, r in zip(queries, results)):
+            raise ValueError("Results are not in the order of the queries")
+
+        print_latencies(f"concurrency {n}", elapsed, n_queries, executor.durations)
+        errors = Counter(type(r).__name__ for r in results if isinstance(r, Exception))
+        print(f"\t\t{sum(errors.values())} failed queries {dict(errors)} after {executor.retried} retries, "
+              f"requests received by the server {server.counts}")
+
+
+def benchmark_cassette(cassette_path: str, latency: Optional[float], concurrency: int) -> None:
+    # replays the recorded queries, the throughput at a fixed latency can be compared between runs
+    cassette = Cassette(cassette_path, 'replay', latency)
+    queries = list(cassette.interactions)
+
+    latency_name = f"{latency}s" if latency is not None else "recorded"
+    print(f"{len(queries)} recorded queries, {latency_name} latency per query")
+
+    for n in (1, concurrency):
+        executor = QueryExecutor('', concurrency=n, cassette=cassette)
+        start = time.perf_counter()
+        results = executor.run(queries)
+        elapsed = time.perf_counter() - start
+        executor.close()
+
+        print_latencies(f"concurrency {n}", elapsed, len(queries), executor.durations)
+    print(f"\t{sum(isinstance(r, Exception) for r in results)} recorded errors replayed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the concurrent query executor against a local mock endpoint or a recorded cassette.")
+
+    parser.add_argument("--queries", type=int, default=1000,
+                        help="number of queries to run")
+
+    parser.add_argument("--latency", type=float, default=None,
+                        help="seconds the mock endpoint or the cassette waits before answering a query, "
+                             "0.05 for the mock endpoint and the recorded durations for a cassette by default")
+
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="mean of the exponential delay the mock endpoint adds to the latency")
+
+    parser.add_argument("--error_rate", type=float, default=0.0,
+                        help="fraction of the queries the mock endpoint answers with a 503")
+
+    parser.add_argument("--timeout_rate", type=float, default=0.0,
+                        help="fraction of the queries the mock endpoint never answers")
+
+    parser.add_argument("--timeout", type=float, default=1.0,
+                        help="seconds after which the executor gives up on a query")
+
+    parser.add_argument("--retries", type=int, default=0,
+                        help="number of times a query failing for a transient reason is sent again")
+
+    parser.add_argument("--backoff", type=float, default=0.1,
+                        help="maximum delay in seconds before the first retry, doubled at each retry")
+
+    parser.add_argument("--post", action='store_true', default=False,
+                        help="send the queries with POST instead of GET")
+
+    parser.add_argument("--cassette", type=str, default=None,
+                        help="if set, path to a cassette recorded with --record whose queries are replayed")
+
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="maximum number of queries in flight")
+
+    args = parser.parse_args()
+    if args.cassette is not None:
+        benchmark_cassette(args.cassette, args.latency, args.concurrency)
+    else:
+        benchmark(args.queries, args.latency if args.latency is not None else 0.05, args.concurrency, args.jitter,
+                  args.error_rate, args.timeout_rate, args.timeout, 'POST' if args.post else 'GET', args.retries, args.backoff)
@@ -0,0 +1,89 @@
+# per-query instrumentation of the dbpedia client: latency, response size, cache hit/miss and error class of every
+# query, summarized as percentiles and histograms per template
+
+import json
+import threading
+from collections import Counter
+from typing import Any, Dict, Hashable, List, Optional
+
+# upper bounds in seconds of the latency histogram buckets, the last bucket has no bound
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+N_SLOWEST_QUERIES = 20
+
+
+def percentile(values: List[float], q: float) -> float:
+    # nearest-rank percentile, q in [0, 100]
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))] if ordered else 0.0
+
+
+def result_size(result: Any) -> Dict[str, int]:
+    if isinstance(result, Exception) or result is None:
+        return {'bytes': 0, 'rows': 0}
+    return {'bytes': len(json.dumps(result, separators=(',', ':'))), 'rows': len(result.get('results', {}).get('bindings', []))}
+
+
+class QueryMetrics:
+    # records holds a dict per query run: the query, its latency in seconds (summed over its attempts without the time
+    # spent queued or in backoff, the lookup time for a cache hit), the size of its result, whether the cache had it
+    # (None without cache), the class of its error and how many times it was sent. labels maps a query to its
+    # template, the queries without one are grouped under None.
+    def __init__(self) -> None:
+        self.records: List[Dict[str, Any]] = []
+        self.labels: Dict[str, Hashable] = {}
+        self.lock = threading.Lock()
+
+    def record(self, query: str, latency: float, result: Any, cache: Optional[str], attempts: int) -> None:
+        record = {'query': query, 'latency': latency, **result_size(result), 'cache': cache,
+                  'error': type(result).__name__ if isinstance(result, Exception) else None, 'attempts': attempts}
+        with self.lock:
+            self.records.append(record)
+
+    def summarize(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        latencies = [r['latency'] for r in records]
+        sizes = [r['bytes'] for r in records]
+
+        histogram = Counter(next((f'<={bound}s' for bound in LATENCY_BUCKETS if latency <= bound), f'>{LATENCY_BUCKETS[-1]}s')
+                            for latency in latencies)
+        buckets = [f'<={bound}s' for bound in LATENCY_BUCKETS] + [f'>{LATENCY_BUCKETS[-1]}s']
+
+        return {
+            'count': len(records),
+            'cache_hits': sum(r['cache'] == 'hit' for r in records),
+            'cache_misses': sum(r['cache'] == 'miss' for r in records),
+            'retries': sum(max(r['attempts'] - 1, 0) for r in records),
+            'errors': dict(Counter(r['error'] for r in records if r['error'] is not None)),
+            'latency': {'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95), 'p99': percentile(latencies, 99),
+                        'max': max(latencies, default=0.0), 'total': sum(latencies)},
+            'latency_histogram': {bucket: histogram[bucket] for bucket in buckets},
+            'bytes': {'p50': percentile(sizes, 50), 'p95': percentile(sizes, 95), 'max': max(sizes, default=0)},
+            'rows': {'p50': percentile([r['rows'] for r in records], 50), 'max': max((r['rows'] for r in records), default=0)},
+        }
+
+    def report(self) -> Dict[str, Any]:
+        per_template: Dict[Hashable, List[Dict[str, Any]]] = {}
+        for record in self.records:
+            per_template.setdefault(self.labels.get(record['query']), []).append(record)
+
+        slowest = sorted(self.records, key=lambda r: r['latency'], reverse=True)[:N_SLOWEST_QUERIES]
+        return {
+            'total': self.summarize(self.records),
+            'templates': {str(t_id): self.summarize(records) for t_id, records in per_template.items()},
+            'slowest_queries': [{**r, 'template': self.labels.get(r['query'])} for r in slowest],
+        }
+
+    def dump(self, path: str) -> None:
+        report = self.report()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4, default=str)
+
+        total = report['total']
+        print(f"Query metrics written to {path}: {total['count']} queries, latency p50 {total['latency']['p50']:.3f}s "
+              f"p95 {total['latency']['p95']:.3f}s p99 {total['latency']['p99']:.3f}s, {total['cache_hits']} cache hits, "
+              f"{sum(total['errors'].values())} errors")
+
+        slowest_templates = sorted(report['templates'].items(), key=lambda t: t[1]['latency']['p95'], reverse=True)[:5]
+        for t_id, summary in slowest_templates:
+            print(f"\ttemplate {t_id}: {summary['count']} queries, latency p95 {summary['latency']['p95']:.3f}s, "
+                  f"{summary['latency']['total']:.1f}s in total")
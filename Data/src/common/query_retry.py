@@ -0,0 +1,77 @@
+# retries with exponential backoff of the queries that failed for a transient reason, and a circuit breaker pausing
+# the queries while the endpoint fails most of them
+
+import asyncio
+from collections import deque
+import http.client
+import random
+import time
+from typing import Deque
+
+# statuses of an endpoint that is overloaded, restarting or behind a failing proxy, the query may work later
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HTTPError(RuntimeError):
+    def __init__(self, status: int, body: str):
+        super().__init__(f"HTTP Error {status}: {body}")
+        self.status = status
+        self.body = body
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def is_transient(error: BaseException) -> bool:
+    # a transient failure says nothing about the query, running it again may give its answer. The others (a 400 for a
+    # query the endpoint cannot parse...) would fail the same way every time
+    if isinstance(error, HTTPError):
+        return error.status in TRANSIENT_STATUSES
+    return isinstance(error, (TimeoutError, ConnectionError, CircuitOpenError, http.client.HTTPException))
+
+
+class RetryPolicy:
+    # retries times at most, the n-th retry waits a random delay of up to min(backoff * 2^n, max_backoff) seconds
+    def __init__(self, retries: int = 3, backoff: float = 1.0, max_backoff: float = 30.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff * 2 ** attempt, self.max_backoff))
+
+
+class CircuitBreaker:
+    # Keeps the outcomes of the last window queries, when at least threshold of them failed for a transient reason the
+    # circuit opens and no query is sent for cooldown seconds. After max_trips openings in a row with no query answered
+    # in between, the endpoint is considered down and the queries fail right away with CircuitOpenError.
+    def __init__(self, threshold: float = 0.5, window: int = 20, cooldown: float = 30.0, max_trips: int = 5):
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.max_trips = max_trips
+
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.open_until = 0.0
+        self.trips = 0
+
+    def record(self, failed: bool) -> None:
+        if not failed:
+            self.trips = 0
+        self.outcomes.append(failed)
+
+        if len(self.outcomes) == self.window and sum(self.outcomes) >= self.threshold * self.window:
+            self.trips += 1
+            self.outcomes.clear()
+            self.open_until = time.monotonic() + self.cooldown
+            if self.trips <= self.max_trips:
+                print(f"[CIRCUIT OPEN] most of the last {self.window} queries failed, pausing for {self.cooldown}s")
+
+    async def wait(self) -> None:
+        if self.trips > self.max_trips:
+            raise CircuitOpenError(f"endpoint down, the circuit opened {self.trips} times in a row")
+
+        while time.monotonic() < self.open_until:
+            await asyncio.sleep(self.open_until - time.monotonic())
+
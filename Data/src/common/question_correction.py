@@ -0,0 +1,240 @@
+# utils to correct typos in natural language questions, can also be run as a benchmark
+
+import argparse
+from collections import Counter
+import re
+import time
+from typing import Collection, Dict, Iterable, List, Set, Tuple
+
+from Levenshtein import distance as levenshtein_distance
+
+from classes.entry import Entry
+from common.consts import CAMEL_CASE_SPLIT_RE, QUESTION_REPLACEMENTS
+from common.utils import build_trie_regex
+
+
+class ReplacementTable:
+    # An ordered list of str.replace substitutions applied in a single regex.sub pass over a question, the callback
+    # looking up the replacement of the typo matched. This gives the output of the sequential str.replace only for typos
+    # that do not depend on their order: a typo whose text can overlap the text of an earlier one, or be created by the
+    # replacement of an earlier one (' od ' -> ' of ' then ' form ' -> ' from ' then ' of from ' -> ' of form ' chain into
+    # each other), is chained instead and replaced with str.replace in its order after the pass, as are the typos after it
+    # that such a typo could create or that it could create.
+    def __init__(self, replacements: List[List[str]]):
+        self.replacements = [(r[0], r[-1]) for r in replacements]
+
+        self.lookup: Dict[str, str] = {}
+        self.chained: List[Tuple[str, str]] = []
+        for original, replacement in self.replacements:
+            if (original, replacement) in self.chained or self.lookup.get(original) == replacement:
+                if not _can_create(replacement, original):
+                    # the same substitution again does not find anything left to replace
+                    continue
+
+            if self._is_chained(original, replacement):
+                self.chained.append((original, replacement))
+            else:
+                self.lookup[original] = replacement
+
+        # a question with none of the typos, almost all of them, is only scanned once
+        self.any_regex = re.compile(build_trie_regex(original for original, _ in self.replacements))
+        self.regex = re.compile(build_trie_regex(self.lookup)) if self.lookup else None
+        self.chained_regex = re.compile(build_trie_regex(original for original, _ in self.chained)) if self.chained else None
+
+    def _is_chained(self, original: str, replacement: str) -> bool:
+        # the typos of the pass are replaced before the chained ones, even those that came after them in the list
+        return (any(_overlap(original, earlier) or _can_create(earlier_replacement, original)
+                    for earlier, earlier_replacement in self.lookup.items()) or
+                any(_overlap(original, earlier) or _can_create(earlier_replacement, original) or _can_create(replacement, earlier)
+                    for earlier, earlier_replacement in self.chained))
+
+    def apply(self, text: str) -> str:
+        if self.any_regex.search(text) is None:
+            return text
+
+        if self.regex is not None:
+            text = self.regex.sub(lambda match: self.lookup[match.group()], text)
+
+        if self.chained_regex is not None and self.chained_regex.search(text) is not None:
+            for original, replacement in self.chained:
+                if original in text:
+                    text = text.replace(original, replacement)
+        return text
+
+    def apply_sequential(self, text: str) -> str:
+        for original, replacement in self.replacements:
+            text = text.replace(original, replacement)
+        return text
+
+
+def _overlap(a: str, b: str) -> bool:
+    # whether occurrences of a and b can share chars in a text
+    return a in b or b in a or any(a.endswith(b[:i]) or b.endswith(a[:i]) for i in range(1, min(len(a), len(b))))
+
+
+def _can_create(replacement: str, original: str) -> bool:
+    # whether writing replacement in a text can make a new occurrence of original, alone or with the chars around it.
+    # Removing a typo joins the chars around it, which can make anything
+    return replacement == '' or _overlap(replacement, original)
+
+
+QUESTION_TYPOS = ReplacementTable(QUESTION_REPLACEMENTS)
+
+# the name of a kb element of a query, in interm sparql (dbr_Carew_Cross), pure sparql (dbr:Carew_Cross) or as a full uri
+KB_NAME_RE = re.compile(r'(?:\bdb[rcpo][_:]|dbpedia\.org/(?:resource/(?:Category:)?|ontology/|property/))([^\s<>{}()]+)')
+
+
+def resource_words(query: str) -> Set[str]:
+    # lowercase words of the names of the kb elements of a query, camel case names (birthPlace) give both their words and
+    # the whole word since questions use either
+    words = set()
+    for name in KB_NAME_RE.findall(query):
+        for word in re.findall(r'[^\W\d_]+', name):
+            words.add(word.lower())
+            words.update(part.lower() for part in CAMEL_CASE_SPLIT_RE.findall(word))
+    return words
+
+
+class SymSpellCorrector:
+    # Corrects unseen typos with a lexicon of known words (one "word count" per line, the count is optional).
+    # Symmetric delete (SymSpell): every word of the lexicon is indexed under all the strings obtained by deleting up to
+    # max_edit_distance chars of its prefix, so a token only needs to generate its own deletes and look them up to get
+    # its candidates instead of being compared to the whole lexicon.
+    def __init__(self, max_edit_distance: int = 2, prefix_length: int = 7, min_token_length: int = 4):
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self.min_token_length = min_token_length
+
+        self.counts: Dict[str, int] = {}
+        self.deletes_index: Dict[str, List[str]] = {}
+        self._cache: Dict[str, str] = {}
+
+    @classmethod
+    def from_file(cls, lexicon_path: str, **kwargs) -> 'SymSpellCorrector':
+        corrector = cls(**kwargs)
+        corrector.load_lexicon(lexicon_path)
+        return corrector
+
+    def load_lexicon(self, lexicon_path: str) -> None:
+        with open(lexicon_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+
+                self.add_word(parts[0], int(parts[1]) if len(parts) > 1 else 1)
+
+    def add_word(self, word: str, count: int = 1) -> None:
+        if word in self.counts:
+            self.counts[word] += count
+            return
+
+        self.counts[word] = count
+        for delete in self._get_deletes(word):
+            self.deletes_index.setdefault(delete, []).append(word)
+
+        self._cache.clear()
+
+    def _get_deletes(self, word: str) -> Set[str]:
+        deletes = {word[:self.prefix_length]}
+        edits = set(deletes)
+
+        for _ in range(self.max_edit_distance):
+            edits = {e[:i] + e[i + 1:] for e in edits for i in range(len(e))}
+            deletes.update(edits)
+
+        return deletes
+
+    def lookup(self, token: str) -> str:
+        if token in self.counts or len(token) < self.min_token_length or not token.isalpha():
+            return token
+
+        if token in self._cache:
+            return self._cache[token]
+
+        best, best_distance, best_count = token, self.max_edit_distance + 1, 0
+        candidates = {c for d in self._get_deletes(token) for c in self.deletes_index.get(d, [])}
+
+        for candidate in candidates:
+            if abs(len(candidate) - len(token)) > self.max_edit_distance:
+                continue
+
+            dist = levenshtein_distance(token, candidate)
+            if dist < best_distance or (dist == best_distance and self.counts[candidate] > best_count):
+                best, best_distance, best_count = candidate, dist, self.counts[candidate]
+
+        self._cache[token] = best
+        return best
+
+    def correct(self, question: str, protected: Collection[str] = ()) -> str:
+        # the protected tokens, usually the resource_words of the query of the question, are names that the lexicon may
+        # not know and are kept as they are so that the question still matches its query
+        return ' '.join(token if token in protected else self.lookup(token) for token in question.split(' '))
+
+    def correct_many(self, questions: Iterable[str]) -> List[str]:
+        return [self.correct(q) for q in questions]
+
+    def correct_entries(self, entries: List[Entry]) -> None:
+        for entry in entries:
+            if entry.question.question is None:
+                continue
+            query = ' '.join(q for q in (entry.query.interm_sparql, entry.query.pure_sparql) if q)
+            entry.question.question = self.correct(entry.question.question, resource_words(query))
+
+
+def build_lexicon(nl_data_paths: List[str], out_path: str, min_count: int) -> None:
+    counts: Counter = Counter()
+
+    for path in nl_data_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for question in f.read().splitlines():
+                counts.update(QUESTION_TYPOS.apply(question.lower().strip()).split())
+
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.writelines(f'{word} {count}\n' for word, count in counts.most_common() if count >= min_count and word.isalpha())
+
+
+def benchmark(nl_data_path: str, repeat: int) -> None:
+    with open(nl_data_path, 'r', encoding='utf-8') as f:
+        questions = [q.lower().strip() for q in f.read().splitlines()]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        expected = [QUESTION_TYPOS.apply_sequential(q) for q in questions]
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        corrected = [QUESTION_TYPOS.apply(q) for q in questions]
+    compiled_time = time.perf_counter() - start
+
+    if corrected != expected:
+        raise ValueError("Compiled typo correction does not match the sequential replacements")
+
+    n_corrected = len([q for q, c in zip(questions, corrected) if q != c])
+    print(f"{len(questions)} questions, {n_corrected} with typos, {len(QUESTION_TYPOS.chained)} typos chained")
+    print(f"sequential: {sequential_time / repeat:.4f}s per pass")
+    print(f"compiled: {compiled_time / repeat:.4f}s per pass ({sequential_time / compiled_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the compiled typo correction against sequential replacements, or build a lexicon.")
+
+    parser.add_argument("--nl", type=str, nargs='+', default=['raw_data/Monument/base/data.en'],
+                        help="path to the txt file(s) containing natural language questions separated by newlines")
+
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="number of passes over the questions")
+
+    parser.add_argument("--lexicon_out", type=str, default=None,
+                        help="if set, builds a lexicon for the SymSpellCorrector from the questions instead of running the benchmark")
+
+    parser.add_argument("--min_count", type=int, default=2,
+                        help="minimum number of occurrences for a word to be added to the lexicon")
+
+    args = parser.parse_args()
+    if args.lexicon_out is not None:
+        build_lexicon(args.nl, args.lexicon_out, args.min_count)
+    else:
+        for nl_data_path in args.nl:
+            benchmark(nl_data_path, args.repeat)
@@ -113,22 +113,27 @@ def replace_quotes(match: re.Match) -> str:
     return ''.join(whole_match)
 
 
-def correct_sep_dots(match: re.Match) -> str:
-    e = match.group(0).strip()
-    if e[-1] == '.':
-        if e in EXCEPTIONS_NOT_REPLACE:
-            return f' {match.group(0)} '
+def is_sep_dot(resource: str) -> bool:
+    # tells if the dot at the end of a resource is a sep_dot that was not separated from it (lots of those in DBNQA)
+    if resource[-1] != '.' or resource in EXCEPTIONS_NOT_REPLACE:
+        return False
 
-        elif e[-2].isnumeric() or e.split('_')[-1].lower() in ENDS_EXCEPTIONS_REPLACE:
-            return f' {e[:-1]} sep_dot '
+    elif resource[-2].isnumeric() or resource.split('_')[-1].lower() in ENDS_EXCEPTIONS_REPLACE:
+        return True
 
-        elif len(e.split('.')[-2]) <= 4:
-            return f' {match.group(0)} '
+    elif len(resource.split('.')[-2]) <= 4:
+        return False
 
-        elif len(e.split('_')[-1]) <= 4 or e.split('_')[-1].lower() in ENDS_EXCEPTIONS_NOT_REPLACE:
-            return f' {match.group(0)} '
-        else:
-            return f' {e[:-1]} sep_dot '
+    elif len(resource.split('_')[-1]) <= 4 or resource.split('_')[-1].lower() in ENDS_EXCEPTIONS_NOT_REPLACE:
+        return False
+
+    return True
+
+
+def correct_sep_dots(match: re.Match) -> str:
+    e = match.group(0).strip()
+    if is_sep_dot(e):
+        return f' {e[:-1]} sep_dot '
 
     return f' {match.group(0)} '
 
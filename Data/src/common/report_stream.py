@@ -0,0 +1,83 @@
+# streaming reads and writes of error reports, so that a report is never loaded whole in memory
+
+import json
+from typing import IO, Any, Dict, Iterable, Iterator, List
+
+READ_SIZE = 1 << 16
+
+JSON_WHITESPACE = ' \t\n\r'
+
+
+def iter_json_array(f: IO[str]) -> Iterator[Any]:
+    # elements of the top-level json array of f, decoded one at a time from a buffer holding about one element
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    read_size = READ_SIZE
+    started = False
+
+    while True:
+        while position < len(buffer) and buffer[position] in JSON_WHITESPACE + ',':
+            position += 1
+
+        if position < len(buffer) and not started:
+            if buffer[position] != '[':
+                raise ValueError(f"Expected a json array, found {buffer[position]!r}")
+            started = True
+            position += 1
+            continue
+
+        if position < len(buffer) and buffer[position] == ']':
+            return
+
+        decoded = False
+        if position < len(buffer):
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+                # a number cut by the end of the buffer decodes as a shorter one (12|345, 1|e10), an element is only
+                # complete once the delimiter following it was read
+                decoded = end < len(buffer) and buffer[end] in JSON_WHITESPACE + ',]'
+            except json.JSONDecodeError:
+                pass
+
+        if not decoded:
+            # the element does not fit in the buffer yet, reads twice as much each time so that a large element is not
+            # decoded again and again
+            more = f.read(read_size)
+            if not more:
+                raise ValueError("Unexpected end of the json array")
+            buffer = buffer[position:] + more
+            position = 0
+            read_size *= 2
+            continue
+
+        yield element
+        position = end
+        read_size = READ_SIZE
+
+
+def iter_report(path: str) -> Iterator[Dict[str, Any]]:
+    # entries of a report written as a json array (error_report.json) or as json lines
+    with open(path, 'r', encoding='utf-8') as f:
+        first = f.read(1)
+        while first and first in JSON_WHITESPACE:
+            first = f.read(1)
+        f.seek(0)
+
+        if first == '[':
+            yield from iter_json_array(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def iter_chunks(entries: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
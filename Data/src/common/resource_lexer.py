@@ -0,0 +1,352 @@
+# linear time lexer for the resources of interm sparql queries, can also be run as a benchmark against GET_RESOURCES_INTERM_SPARQL_RE
+
+import argparse
+from bisect import bisect_left
+import multiprocessing
+import re
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from common.consts import GET_RESOURCES_INTERM_SPARQL_RE
+
+RESOURCE_START_RE = re.compile('db[orcp]_')
+OPEN_RE = re.compile('(?:attr|par)_open')
+CLOSE_RE = re.compile('(?:attr|par)_close')
+WHITESPACES_RE = re.compile(r'\s*')
+NEWLINE_RE = re.compile('\n')
+# positions where the .*? of a resource can stop. A _, ,_ or - would only lead to another .*?, so they are skipped too
+NEXT_STOP_RE = re.compile(r'[\s?]|(?:attr|par)_open|brack_close')
+# anchored at 0, the greedy .* only backtracks once over the string
+LAST_TERMINATOR_RE = re.compile(r'(?s:.*)(\s|brack_close)')
+WHOLE_MATCH_RE = re.compile('.*', re.S)
+
+# chars that can start a segment of a resource after a space (_, - or attr_open/par_open)
+SEGMENT_START_CHARS = set('_-ap')
+# chars of [a-z^db[orcp] in GET_RESOURCES_INTERM_SPARQL_RE
+GLUED_ATTRIBUTE_CHARS = set('abcdefghijklmnopqrstuvwxyz^[')
+
+# (start, end of the resource, end of the match including its terminator)
+ResourceSpan = Tuple[int, int, int]
+
+
+class ResourceLexer:
+    # Finds the same resources as GET_RESOURCES_INTERM_SPARQL_RE without backtracking.
+    # The regex nests lazy quantifiers in a * group, so when a resource can not be terminated it tries every way to
+    # split it into segments, which is exponential in the number of _ (or -, attr_open...) it contains.
+    # The lexer follows the regex, but it only takes a branch after checking that the rest of the pattern can match:
+    #  - after a _, , or -, the regex goes on with .*? which always succeeds if there is a terminator (\s or brack_close)
+    #    somewhere after, so it only needs the position of the last one
+    #  - after attr_open(...)attr_close, it needs to be followed by another segment or a terminator, this is computed once
+    #    per attr_close from the end of the query
+    # so every position of the query is looked at a bounded number of times.
+    def __init__(self, interm_sparql: str):
+        self.s = interm_sparql
+        self.n = len(interm_sparql)
+
+        last_terminator = LAST_TERMINATOR_RE.match(interm_sparql)
+        self.last_terminator = last_terminator.start(1) if last_terminator else -1
+
+        self._can_continue: Dict[int, bool] = {}
+        self._close_starts: List[int] = []
+        self._close_ends: List[int] = []
+        self._next_valid_close: List[Optional[int]] = []
+        self._newlines: List[int] = []
+
+        if OPEN_RE.search(interm_sparql) is not None:
+            self._index_closes()
+
+    def find_all(self) -> List[ResourceSpan]:
+        spans: List[ResourceSpan] = []
+        pos = 0
+
+        while True:
+            start = RESOURCE_START_RE.search(self.s, pos)
+            if start is None:
+                break
+
+            # if a resource can not be terminated, none of the next ones can either
+            span = self._match_from(start.start())
+            if span is None:
+                break
+
+            spans.append(span)
+            pos = span[2]
+
+        return spans
+
+    def _terminator_length(self, pos: int) -> int:
+        if pos < self.n and self.s[pos].isspace():
+            return 1
+        if self.s.startswith('brack_close', pos):
+            return len('brack_close')
+        return 0
+
+    def _end_of_match(self, pos: int) -> Optional[Tuple[int, int]]:
+        # \??(?:\s|brack_close)
+        if pos < self.n and self.s[pos] == '?':
+            length = self._terminator_length(pos + 1)
+            if length:
+                return pos + 1, pos + 1 + length
+
+        length = self._terminator_length(pos)
+        if length:
+            return pos, pos + length
+
+        return None
+
+    def _can_terminate_after(self, pos: int) -> bool:
+        # .*? followed by the rest of the pattern matches iff a terminator can be found from pos
+        return pos <= self.last_terminator
+
+    def _skip_whitespaces(self, pos: int) -> int:
+        # \s* always matches, possibly the empty string
+        match = WHITESPACES_RE.match(self.s, pos)
+        return match.end() if match is not None else pos
+
+    def _index_closes(self) -> None:
+        for m in CLOSE_RE.finditer(self.s):
+            self._close_starts.append(m.start())
+            self._close_ends.append(m.end())
+
+        self._newlines = [m.start() for m in NEWLINE_RE.finditer(self.s)]
+
+        # filled from the end, so that every attr_close only looks at the ones after it, which are already known
+        self._next_valid_close = [None] * (len(self._close_starts) + 1)
+        for i in range(len(self._close_starts) - 1, -1, -1):
+            close_end = self._close_ends[i]
+            if self.s.startswith(' ', close_end) and self.s[close_end + 1:close_end + 2] in GLUED_ATTRIBUTE_CHARS:
+                pos = close_end + 2
+                while self.s.startswith(']', pos):
+                    pos += 1
+                for after_brackets in range(pos, close_end + 1, -1):
+                    self.can_continue(after_brackets)
+
+            self._next_valid_close[i] = i if self.can_continue(close_end) else self._next_valid_close[i + 1]
+
+    def _glued_attribute_end(self, open_end: int) -> Optional[int]:
+        # (?:attr|par)_open([a-z^db[orcp]_*?)(?:attr|par)_close [a-z^db[orcp]]*?
+        if self.s[open_end:open_end + 1] not in GLUED_ATTRIBUTE_CHARS:
+            return None
+
+        pos = open_end + 1
+        while True:
+            close = CLOSE_RE.match(self.s, pos)
+            if close is not None:
+                pos = close.end()
+                if not self.s.startswith(' ', pos) or self.s[pos + 1:pos + 2] not in GLUED_ATTRIBUTE_CHARS:
+                    return None
+
+                pos += 2
+                while not self.can_continue(pos):
+                    if not self.s.startswith(']', pos):
+                        return None
+                    pos += 1
+                return pos
+
+            if not self.s.startswith('_', pos):
+                return None
+            pos += 1
+
+    def _attribute_end(self, open_end: int) -> Optional[int]:
+        # (?:attr|par)_open(.*?)(?:attr|par)_close, the first attr_close after which the resource can go on
+        i = bisect_left(self._close_starts, open_end)
+        valid = self._next_valid_close[i] if i < len(self._next_valid_close) else None
+        if valid is None:
+            return None
+
+        newline = bisect_left(self._newlines, open_end)
+        if newline < len(self._newlines) and self._newlines[newline] < self._close_starts[valid]:
+            return None
+
+        return self._close_ends[valid]
+
+    def can_continue(self, pos: int) -> bool:
+        # can the (...)* group of the regex or its end match from pos
+        if pos in self._can_continue:
+            return self._can_continue[pos]
+
+        if pos >= self.n:
+            result = False
+        elif self._end_of_match(pos) is not None:
+            result = True
+        elif self.s[pos] == '_' or self.s[pos] == '-':
+            result = self._can_terminate_after(pos + 1)
+        elif self.s.startswith(',_', pos):
+            result = self._can_terminate_after(pos + 2)
+        else:
+            attribute_open = OPEN_RE.match(self.s, pos)
+            result = attribute_open is not None and \
+                (self._glued_attribute_end(attribute_open.end()) is not None or self._attribute_end(attribute_open.end()) is not None)
+
+        self._can_continue[pos] = result
+        return result
+
+    def _lazy_any(self, pos: int) -> Optional[int]:
+        # .*? : goes forward until the rest of the pattern can match
+        while True:
+            stop = NEXT_STOP_RE.search(self.s, pos)
+            if stop is None:
+                return None
+
+            pos = stop.start()
+            if self.can_continue(pos):
+                return pos
+            pos += 1
+
+    def _match_from(self, start: int) -> Optional[ResourceSpan]:
+        # db[orcp]_.*?
+        pos = self._lazy_any(start + 4)
+        if pos is None:
+            return None
+
+        # (?:...)* then \??(?:\s|brack_close), taking the first alternative of the group that can lead to a match
+        while True:
+            # most resources are just followed by a space and a word
+            if self.s.startswith(' ', pos):
+                next_char = self.s[pos + 1:pos + 2]
+                if next_char not in SEGMENT_START_CHARS and not next_char.isspace():
+                    return start, pos, pos + 1
+
+            after_whitespaces = self._skip_whitespaces(pos)
+            attribute_open = OPEN_RE.match(self.s, after_whitespaces)
+
+            if attribute_open is not None:
+                attribute_end = self._glued_attribute_end(attribute_open.end())
+                if attribute_end is None:
+                    attribute_end = self._attribute_end(attribute_open.end())
+                if attribute_end is not None:
+                    pos = attribute_end
+                    continue
+
+            # \s?_.*? then ,?_.*? then \s*?\-.*?
+            if pos < self.n and self.s[pos].isspace() and self.s.startswith('_', pos + 1) and self._can_terminate_after(pos + 2):
+                next_pos = pos + 2
+            elif self.s.startswith('_', pos) and self._can_terminate_after(pos + 1):
+                next_pos = pos + 1
+            elif self.s.startswith(',_', pos) and self._can_terminate_after(pos + 2):
+                next_pos = pos + 2
+            elif self.s.startswith('-', after_whitespaces) and self._can_terminate_after(after_whitespaces + 1):
+                next_pos = after_whitespaces + 1
+            else:
+                end = self._end_of_match(pos)
+                if end is None:
+                    return None
+                return start, end[0], end[1]
+
+            # .*? at the end of the segment
+            pos = self._lazy_any(next_pos)
+            if pos is None:
+                return None
+
+
+def find_interm_sparql_resources(interm_sparql: str) -> List[ResourceSpan]:
+    return ResourceLexer(interm_sparql).find_all()
+
+
+def findall_interm_sparql_resources(interm_sparql: str) -> List[str]:
+    # same as [parts[0] for parts in GET_RESOURCES_INTERM_SPARQL_RE.findall(interm_sparql)]
+    return [interm_sparql[start:end] for start, end, _ in find_interm_sparql_resources(interm_sparql)]
+
+
+def sub_interm_sparql_resources(repl: Callable[[re.Match], str], interm_sparql: str) -> str:
+    # same as GET_RESOURCES_INTERM_SPARQL_RE.sub(repl, interm_sparql), repl only gets group(0) of the match
+    out: List[str] = []
+    last = 0
+
+    for start, _, end in find_interm_sparql_resources(interm_sparql):
+        out.append(interm_sparql[last:start])
+        match = WHOLE_MATCH_RE.match(interm_sparql, start, end)
+        if match is None:
+            raise ValueError(f"Cannot match the resource at {start}:{end} of {interm_sparql}")
+        out.append(repl(match))
+        last = end
+
+    out.append(interm_sparql[last:])
+    return ''.join(out)
+
+
+def _regex_findall(interm_sparql: str) -> List[str]:
+    return [parts[0] for parts in GET_RESOURCES_INTERM_SPARQL_RE.findall(interm_sparql)]
+
+
+def check_against_regex(sparql_data_paths: List[str]) -> None:
+    # the queries are corrected first since this is what the callers of the lexer get
+    from common.interm_sparql_correction import correct_interm_sparql
+
+    for path in sparql_data_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            queries = [correct_interm_sparql(q) for q in f.read().splitlines()]
+
+        start = time.perf_counter()
+        expected = [_regex_findall(q) for q in queries]
+        regex_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = [findall_interm_sparql_resources(q) for q in queries]
+        lexer_time = time.perf_counter() - start
+
+        mismatches = [(q, e, f) for q, e, f in zip(queries, expected, found) if e != f]
+        for query, regex_resources, lexer_resources in mismatches[:10]:
+            print(f"[MISMATCH] {query}\n\tregex: {regex_resources}\n\tlexer: {lexer_resources}")
+
+        print(f"{path}: {len(queries)} queries, {len(mismatches)} mismatches")
+        print(f"\tregex: {regex_time:.4f}s, lexer: {lexer_time:.4f}s")
+
+
+def adversarial_queries(n_segments: int) -> Dict[str, str]:
+    # resources that can not be terminated, the regex tries every way of splitting them before giving up
+    return {
+        'underscores': 'select var_uri where brack_open var_uri dbo_x dbr_' + '_'.join(['a'] * n_segments),
+        'dashes': 'dbr_' + '-'.join(['a'] * n_segments) + '_b',
+        'attributes': 'dbr_a' + 'attr_open_b_attr_close_' * n_segments + 'c',
+        'mixed': 'dbr_a' + ',_b-c_d'.join([''] * n_segments) + 'attr_open e',
+    }
+
+
+def benchmark_adversarial(segments: List[int], timeout: float) -> None:
+    # the regex runs in another process so that it can be stopped
+    pool = multiprocessing.Pool(1)
+    regex_timed_out = set()
+
+    for n_segments in segments:
+        for name, query in adversarial_queries(n_segments).items():
+            start = time.perf_counter()
+            found = findall_interm_sparql_resources(query)
+            lexer_time = time.perf_counter() - start
+
+            description = f"{name} ({n_segments} segments, {len(query)} chars): lexer {lexer_time * 1e6:.0f}us"
+            if name in regex_timed_out:
+                print(f"{description}, regex skipped")
+                continue
+
+            start = time.perf_counter()
+            try:
+                expected = pool.apply_async(_regex_findall, (query,)).get(timeout)
+            except multiprocessing.TimeoutError:
+                pool.terminate()
+                pool = multiprocessing.Pool(1)
+                regex_timed_out.add(name)
+                print(f"{description}, regex > {timeout}s")
+                continue
+            regex_time = time.perf_counter() - start
+
+            status = '' if expected == found else ' MISMATCH'
+            print(f"{description}, regex {regex_time * 1e6:.0f}us{status}")
+
+    pool.terminate()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the resource lexer against GET_RESOURCES_INTERM_SPARQL_RE and benchmark both on adversarial queries.")
+
+    parser.add_argument("--sparql", type=str, nargs='+', default=['raw_data/Monument/base/data.sparql'],
+                        help="path to the txt file(s) containing raw interm sparql queries separated by newlines")
+
+    parser.add_argument("--segments", type=int, nargs='+', default=[4, 8, 12, 16, 20, 100, 1000, 10000],
+                        help="number of segments of the adversarial resources")
+
+    parser.add_argument("--timeout", type=float, default=5,
+                        help="time after which the regex is stopped on an adversarial query, in seconds")
+
+    args = parser.parse_args()
+    check_against_regex(args.sparql)
+    benchmark_adversarial(args.segments, args.timeout)
@@ -0,0 +1,46 @@
+# order-insensitive fingerprints of sparql json results, to compare answers with a single string comparison
+
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# older virtuoso versions type literals with a datatype as typed-literal
+TERM_TYPES = {'typed-literal': 'literal'}
+
+
+def _term_key(term: Optional[Dict[str, str]]) -> Optional[Tuple[str, str, str, str]]:
+    if term is None:
+        return None
+
+    term_type = term.get('type', '')
+    return (TERM_TYPES.get(term_type, term_type), term.get('value', ''), term.get('datatype', ''), term.get('xml:lang', ''))
+
+
+def result_rows(result: Dict[Any, Any]) -> List[Any]:
+    # the bindings as rows of terms in the order of the projected variables, sorted so that the order in which the
+    # endpoint returned them does not matter. Variables are matched by position, so the names given to them by the
+    # query do not matter either
+    if 'boolean' in result:
+        return [result['boolean']]
+
+    variables = result.get('head', {}).get('vars', [])
+    bindings = result.get('results', {}).get('bindings', [])
+    rows = [[_term_key(binding.get(var)) for var in variables] for binding in bindings]
+
+    return sorted(rows, key=lambda row: json.dumps(row))
+
+
+def fingerprint_result(result: Dict[Any, Any]) -> str:
+    rows = json.dumps(result_rows(result), separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(rows.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def get_fingerprint(dbpedia_side: Dict[str, Any]) -> Optional[str]:
+    # fingerprint of one side of the dbpedia data of a report entry, computed if the report predates fingerprints
+    if dbpedia_side.get('is_error', True):
+        return None
+
+    if 'fingerprint' not in dbpedia_side:
+        dbpedia_side['fingerprint'] = fingerprint_result(dbpedia_side['query_result'])
+    fingerprint: str = dbpedia_side['fingerprint']
+    return fingerprint
@@ -0,0 +1,74 @@
+# results of queries shared by the evaluations of several reports running in parallel threads, so that the gold queries
+# common to the reports are only sent once
+
+import threading
+from typing import Dict, Hashable, Iterable, List, Set, Tuple
+
+from common.query_executor import QueryResult
+
+
+class SharedResults:
+    # Each report registers the keys (canonical queries) it needs before the evaluations start. A worker claims the keys
+    # it needs: it gets the ones no other worker has claimed and must send them then publish their results, the other
+    # ones are waited for. A result is kept until every report that registered or claimed its key has read it, a
+    # worker asking for it again afterwards sends it again (and finds it in the cache).
+    def __init__(self) -> None:
+        self.results: Dict[Hashable, QueryResult] = {}
+        self.readers: Dict[Hashable, Set[Hashable]] = {}
+        self.pending: Dict[Hashable, threading.Event] = {}
+        self.lock = threading.Lock()
+        self.reused = 0
+
+    def register(self, reader: Hashable, keys: Iterable[Hashable]) -> None:
+        with self.lock:
+            for key in keys:
+                self.readers.setdefault(key, set()).add(reader)
+
+    def claim(self, reader: Hashable, keys: Iterable[Hashable]) -> Tuple[List[Hashable], List[Hashable]]:
+        # the keys to send and publish, and the keys to wait for
+        claimed, waited = [], []
+        with self.lock:
+            for key in dict.fromkeys(keys):
+                # a key claimed without being registered is not dropped before its reader got it
+                self.readers.setdefault(key, set()).add(reader)
+                if key in self.results or key in self.pending:
+                    waited.append(key)
+                else:
+                    self.pending[key] = threading.Event()
+                    claimed.append(key)
+        return claimed, waited
+
+    def publish(self, reader: Hashable, key: Hashable, result: QueryResult) -> None:
+        # the worker publishing a result is its first reader
+        with self.lock:
+            event = self.pending.pop(key)
+            self.results[key] = result
+            self._read(reader, key)
+        event.set()
+
+    def wait(self, reader: Hashable, key: Hashable) -> QueryResult:
+        with self.lock:
+            event = self.pending.get(key)
+        if event is not None:
+            event.wait()
+
+        with self.lock:
+            result = self.results[key]
+            self.reused += 1
+            self._read(reader, key)
+        return result
+
+    def release(self, reader: Hashable, keys: Iterable[Hashable]) -> None:
+        # keys a registered reader will not read, it got their results another way
+        with self.lock:
+            for key in keys:
+                self._read(reader, key)
+
+    def _read(self, reader: Hashable, key: Hashable) -> None:
+        readers = self.readers.get(key)
+        if readers is None:
+            return
+        readers.discard(reader)
+        if not readers:
+            del self.readers[key]
+            self.results.pop(key, None)
@@ -0,0 +1,309 @@
+# canonical form of pure sparql queries so that structurally equivalent queries compare equal without being run, can
+# also be run as a check of the canonical forms over a dataset
+
+import argparse
+import random
+import re
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from common.consts import SPARQL_KEYWORDS, SPARQL_NAMESPACES
+from common.interm_sparql_to_pure_sparql import PURE_SPARQL_DECODER
+
+SPARQL_TOKEN_RE = re.compile(
+    r'"(?:[^"\\]|\\.)*"(?:@[A-Za-z][\w-]*|\^\^\S+)?'  # literal
+    r"|'(?:[^'\\]|\\.)*'(?:@[A-Za-z][\w-]*|\^\^\S+)?"  # literal in single quotes
+    r'|<\s?[^<>\s]*>'  # iri, with the space the decoder leaves after <
+    r'|[?$]\w+'  # variable
+    r'|[A-Za-z][\w.-]*:(?:\\.|[^\s{}\\])*'  # prefixed name, resource names can contain escaped chars
+    r'|&&|\|\||!=|<=|>=|[\w.+-]+|\S')
+
+VARIABLE_RE = re.compile(r'\?\w+')
+
+SINGLE_QUOTED_ESCAPE_RE = re.compile(r'\\.|"')
+
+# a group is a list of items (what is between the dots), an item is a list of tokens and nested groups
+Group = List[List[Any]]
+
+# elements that are not triple patterns even when they are not in braces
+EXPRESSION_KEYWORDS = {'filter', 'bind'}
+
+
+def normalize_token(token: str) -> str:
+    if token[0] == '<' and token[-1] == '>':
+        iri = token[1:-1].strip()
+        compacted = _compact_iri(iri)
+        if compacted != iri or (':' in iri and '//' not in iri):
+            # <dbr:X> is the same as dbr:X in this project, see clean_pure_sparql
+            return compacted
+        return f'<{iri}>'
+
+    if token[0] == '$':
+        return f'?{token[1:]}'
+
+    if token[0] == "'":
+        # 'x' is the same literal as "x"
+        end = token.rindex("'")
+        return f'"{SINGLE_QUOTED_ESCAPE_RE.sub(_requote, token[1:end])}"{token[end + 1:]}'
+
+    if ':' in token and token[0] != '"':
+        return _compact_iri(token)
+
+    if token.lower() in SPARQL_KEYWORDS and (token.islower() or token.isupper()):
+        return token.lower()
+
+    return token
+
+
+def _requote(match: re.Match) -> str:
+    # escape of a single-quoted literal written in double quotes
+    escape: str = match.group()
+    return {"\\'": "'", '"': '\\"'}.get(escape, escape)
+
+
+def tokenize_sparql(query: str) -> List[str]:
+    return [normalize_token(t) for t in SPARQL_TOKEN_RE.findall(query)]
+
+
+def _compact_iri(iri: str) -> str:
+    for namespace, prefix in SPARQL_NAMESPACES:
+        if iri.startswith(namespace):
+            return prefix + iri[len(namespace):]
+    return iri
+
+
+def parse_group(tokens: List[str], i: int) -> Tuple[Group, int]:
+    # tokens[i] is the token after the opening brace, returns the index after the closing brace
+    items: Group = []
+    item: List[Any] = []
+
+    while i < len(tokens):
+        token = tokens[i]
+
+        if token == '}':
+            i += 1
+            break
+
+        if token == '{':
+            group, i = parse_group(tokens, i + 1)
+            item.append(group)
+            # OPTIONAL {...} ?x ... needs no dot, only a union continues the item
+            if i >= len(tokens) or tokens[i] != 'union':
+                items.append(item)
+                item = []
+
+        elif token == '.':
+            if item:
+                items.append(item)
+                item = []
+            i += 1
+
+        elif token in EXPRESSION_KEYWORDS:
+            if item:
+                items.append(item)
+            item, i = parse_expression(tokens, i + 1)
+            items.append([token] + item)
+            item = []
+
+        else:
+            item.append(token)
+            i += 1
+
+    if item:
+        items.append(item)
+    return items, i
+
+
+def parse_expression(tokens: List[str], i: int) -> Tuple[List[Any], int]:
+    # (...), f(...), [not] exists {...} or a single token
+    expression: List[Any] = []
+    while i < len(tokens) and tokens[i] in ('not', 'exists'):
+        expression.append(tokens[i])
+        i += 1
+
+    if expression:
+        if i < len(tokens) and tokens[i] == '{':
+            group, i = parse_group(tokens, i + 1)
+            expression.append(group)
+        return expression, i
+
+    if i + 1 < len(tokens) and tokens[i] != '(' and tokens[i + 1] == '(':
+        expression.append(tokens[i])
+        i += 1
+
+    if i >= len(tokens) or tokens[i] != '(':
+        return expression + tokens[i:i + 1], i + 1
+
+    depth = 0
+    while i < len(tokens):
+        expression.append(tokens[i])
+        depth += (tokens[i] == '(') - (tokens[i] == ')')
+        i += 1
+        if depth == 0:
+            break
+
+    return expression, i
+
+
+def is_triple(item: List[Any]) -> bool:
+    return len(item) >= 3 and all(isinstance(e, str) and e not in (';', ',') for e in item) \
+        and item[0] not in SPARQL_KEYWORDS
+
+
+def _render_group(group: Group, rename: Callable[[str], str]) -> str:
+    if not group:
+        return '{ }'
+    return '{ ' + ' . '.join(_render_item(item, rename) for item in group) + ' }'
+
+
+def _render_item(item: List[Any], rename: Callable[[str], str]) -> str:
+    return ' '.join(_render_group(e, rename) if isinstance(e, list) else rename(e) for e in item)
+
+
+def _iter_tokens(elements: List[Any]) -> Iterator[str]:
+    for element in elements:
+        if isinstance(element, list):
+            yield from _iter_tokens(element)
+        else:
+            yield element
+
+
+def _sort_triples(group: Group, rename: Callable[[str], str]) -> None:
+    # sorts the runs of consecutive triple patterns, the order of the other items (filters, unions...) is kept
+    for item in group:
+        for element in item:
+            if isinstance(element, list):
+                _sort_triples(element, rename)
+
+    start = 0
+    while start < len(group):
+        if not is_triple(group[start]):
+            start += 1
+            continue
+
+        end = start
+        while end < len(group) and is_triple(group[end]):
+            end += 1
+
+        group[start:end] = sorted(group[start:end], key=lambda item: _render_item(item, rename))
+        start = end
+
+
+def _anonymize(token: str) -> str:
+    return '?' if token[0] == '?' else token
+
+
+def canonicalize_sparql(query: str) -> str:
+    # Keywords in lower case, iris shortened to their prefix, 'a' written rdf:type, the optional where and the trailing
+    # dots removed, triple patterns of the same basic graph pattern sorted, and variables renamed ?v0, ?v1... in order
+    # of appearance (projection first). Every step keeps the answers of the query, so equal canonical forms are
+    # equivalent queries, up to the names of the projected variables.
+    tokens = tokenize_sparql(query)
+    body: Group = []
+
+    if '{' not in tokens:
+        head, tail = tokens, []
+    else:
+        start = tokens.index('{')
+        head = [t for t in tokens[:start] if t != 'where']
+        body, end = parse_group(tokens, start + 1)
+        tail = tokens[end:]
+
+    def normalize_triples(group: Group) -> None:
+        for item in group:
+            if is_triple(item) and item[1] == 'a':
+                item[1] = 'rdf:type'
+            for element in item:
+                if isinstance(element, list):
+                    normalize_triples(element)
+
+    normalize_triples(body)
+
+    # the order of the triples decides the names of the variables and the other way around, so the triples are first
+    # sorted without the variable names, then again with the names until the names stop changing
+    rename: Callable[[str], str] = _anonymize
+    names: Dict[str, str] = {}
+
+    def rename_variable(token: str) -> str:
+        return names.get(token, token)
+
+    for _ in range(3):
+        _sort_triples(body, rename)
+
+        order: Dict[str, str] = {}
+        for token in _iter_tokens([head, body, tail]):
+            if token[0] == '?' and len(token) > 1 and token not in order:
+                order[token] = f'?v{len(order)}'
+
+        if order == names:
+            break
+        names = order
+        rename = rename_variable
+
+    out = [rename(t) for t in head]
+    if '{' in tokens:
+        out.append(_render_group(body, rename))
+    out.extend(rename(t) for t in tail)
+
+    return ' '.join(out)
+
+
+def structurally_equal(query: str, other: str) -> bool:
+    return canonicalize_sparql(query) == canonicalize_sparql(other)
+
+
+def _shuffle_query(query: str, rng: random.Random) -> str:
+    # same query with its variables renamed and the triples of its basic graph patterns shuffled
+    tokens = tokenize_sparql(query)
+    variables = list(dict.fromkeys(t for t in tokens if VARIABLE_RE.fullmatch(t)))
+    new_names = dict(zip(variables, rng.sample([f'?x{i}' for i in range(len(variables))], len(variables))))
+
+    if '{' not in tokens:
+        return ' '.join(new_names.get(t, t) for t in tokens)
+
+    start = tokens.index('{')
+    body, end = parse_group(tokens, start + 1)
+
+    def shuffle(group: Group) -> None:
+        for item in group:
+            for element in item:
+                if isinstance(element, list):
+                    shuffle(element)
+        if all(is_triple(item) for item in group):
+            rng.shuffle(group)
+
+    shuffle(body)
+
+    def rename(token: str) -> str:
+        return new_names.get(token, token)
+
+    return ' '.join([rename(t) for t in tokens[:start]] + [_render_group(body, rename)] + [rename(t) for t in tokens[end:]])
+
+
+def check(sparql_data_paths: List[str], seed: int) -> None:
+    rng = random.Random(seed)
+
+    for path in sparql_data_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            queries = PURE_SPARQL_DECODER.convert_many(f.read().splitlines())
+
+        canonical = [canonicalize_sparql(q) for q in queries]
+        not_invariant = [q for q, c in zip(queries, canonical) if canonicalize_sparql(_shuffle_query(q, rng)) != c]
+
+        for query in not_invariant[:5]:
+            print(f"[NOT INVARIANT] {query}\n\t{canonicalize_sparql(query)}")
+
+        print(f"{path}: {len(queries)} queries, {len(set(queries))} distinct, {len(set(canonical))} distinct canonical forms")
+        print(f"\t{len(not_invariant)} canonical forms changed by renaming the variables and shuffling the triples")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the canonical forms of the queries of a dataset do not depend on variable names and triple order.")
+
+    parser.add_argument("--sparql", type=str, nargs='+', default=['raw_data/Monument/base/data.sparql'],
+                        help="path to the txt file(s) containing interm sparql queries separated by newlines")
+
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the variable renaming and triple shuffling")
+
+    args = parser.parse_args()
+    check(args.sparql, args.seed)
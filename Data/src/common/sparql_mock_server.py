@@ -0,0 +1,176 @@
+# local http server speaking the part of the sparql protocol used by SPARQLWrapper and the query executor, with tunable
+# latency and injected failures, can also be run as a script to serve it as a stand-in for dbpedia
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from common.cassette import Cassette
+from common.query_cache import normalize_query
+from common.triple_store import TripleStore
+
+
+class MockSparqlServer(ThreadingHTTPServer):
+    # Answers a query with its canned response if it has one, else with its result on the store if there is one, else
+    # with an empty result that echoes the query. Each query waits latency seconds plus an exponential delay of mean
+    # jitter, then fails with a 503 with probability error_rate, or hangs for hang seconds without answering with
+    # probability timeout_rate. counts has the number of requests per outcome since the server started.
+    def __init__(self, address: Tuple[str, int] = ('127.0.0.1', 0), latency: float = 0.05, jitter: float = 0.0,
+                 error_rate: float = 0.0, timeout_rate: float = 0.0, hang: float = 30.0,
+                 responses: Optional[Dict[str, Dict[Any, Any]]] = None, store: Optional[TripleStore] = None,
+                 seed: Optional[int] = None):
+        super().__init__(address, MockSparqlHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.responses = {normalize_query(q): r for q, r in (responses or {}).items()}
+        self.store = store
+
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {'ok': 0, 'error': 0, 'timeout': 0, 'bad_request': 0}
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        host = host.decode() if isinstance(host, bytes) else host
+        return f'http://{host}:{port}/sparql'
+
+    def start(self) -> 'MockSparqlServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def draw(self) -> Tuple[float, str]:
+        # delay and outcome of a query, drawn under the lock so that a seed gives the same sequence
+        with self.lock:
+            delay = self.latency + (self.rng.expovariate(1 / self.jitter) if self.jitter > 0 else 0.0)
+            roll = self.rng.random()
+
+        if roll < self.error_rate:
+            return delay, 'error'
+        if roll < self.error_rate + self.timeout_rate:
+            return delay, 'timeout'
+        return delay, 'ok'
+
+    def count(self, outcome: str) -> None:
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def answer(self, query: str) -> Dict[Any, Any]:
+        response = self.responses.get(normalize_query(query))
+        if response is not None:
+            return response
+        if self.store is not None:
+            return self.store.query(query)
+        return {'head': {'vars': []}, 'results': {'bindings': []}, 'query': query}
+
+
+class MockSparqlHandler(BaseHTTPRequestHandler):
+    server: MockSparqlServer
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        self._handle(parse_qs(urlparse(self.path).query).get('query', [None])[0])
+
+    def do_POST(self) -> None:
+        # the query is either url-encoded in the form (SPARQLWrapper with POST) or the whole body
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        if self.headers.get('Content-Type', '').startswith('application/sparql-query'):
+            self._handle(body)
+        else:
+            self._handle(parse_qs(body).get('query', [None])[0])
+
+    def _handle(self, query: Optional[str]) -> None:
+        if query is None:
+            self.server.count('bad_request')
+            return self._send(400, 'text/plain', b'Missing query parameter')
+
+        delay, outcome = self.server.draw()
+        time.sleep(delay)
+
+        if outcome == 'timeout':
+            self.server.count('timeout')
+            time.sleep(self.server.hang)
+            self.close_connection = True
+            return
+
+        if outcome == 'error':
+            self.server.count('error')
+            return self._send(503, 'text/plain', b'Service Temporarily Unavailable')
+
+        try:
+            result = self.server.answer(query)
+        except Exception as error:
+            # same as virtuoso, which answers a query it cannot compile with a 400 and the error as text
+            self.server.count('bad_request')
+            return self._send(400, 'text/plain', f'Virtuoso 37000 Error SP030: {error}'.encode('utf-8'))
+
+        self.server.count('ok')
+        self._send(200, 'application/sparql-results+json', json.dumps(result).encode('utf-8'))
+
+    def _send(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a mock sparql endpoint with tunable latency and failures.")
+
+    parser.add_argument("--port", type=int, default=8890,
+                        help="port to listen on, the endpoint is http://127.0.0.1:<port>/sparql")
+
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds every query waits before being answered")
+
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="mean of the exponential delay added to the latency, gives a latency tail")
+
+    parser.add_argument("--error_rate", type=float, default=0.0,
+                        help="fraction of the queries answered with a 503")
+
+    parser.add_argument("--timeout_rate", type=float, default=0.0,
+                        help="fraction of the queries left without an answer for --hang seconds")
+
+    parser.add_argument("--hang", type=float, default=30.0,
+                        help="seconds a timed out query hangs before its connection is closed")
+
+    parser.add_argument("--cassette", type=str, default=None,
+                        help="if set, cassette recorded with --record whose results are served for the recorded queries")
+
+    parser.add_argument("--data", type=str, nargs='+', default=None,
+                        help="if set, n-triples/turtle dump(s) loaded in a triple store that answers the other queries")
+
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the latencies and failures")
+
+    args = parser.parse_args()
+    responses = None
+    if args.cassette is not None:
+        responses = {q: i['result'] for q, i in Cassette(args.cassette, 'replay').interactions.items() if 'result' in i}
+    store = TripleStore.from_files(args.data) if args.data else None
+
+    server = MockSparqlServer(('127.0.0.1', args.port), args.latency, args.jitter, args.error_rate, args.timeout_rate,
+                              args.hang, responses, store, args.seed)
+    print(f"Serving {server.endpoint}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,840 @@
+# in-memory triple store loaded from n-triples/turtle dumps that runs the sparql subset of the datasets offline, can also
+# be run as a benchmark of a dump and a file of queries
+
+import argparse
+import bz2
+import gzip
+import multiprocessing
+import re
+import time
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from common.consts import SPARQL_NAMESPACES
+from common.sparql_canonicalizer import Group, parse_group, tokenize_sparql
+
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+RDF_TYPE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type'
+NUMERIC_TYPES = {XSD + t for t in ('integer', 'decimal', 'double', 'float', 'int', 'long', 'short', 'byte', 'nonNegativeInteger',
+                                   'positiveInteger', 'negativeInteger', 'nonPositiveInteger', 'unsignedInt', 'unsignedLong')}
+
+# a term is ('uri', iri), ('literal', value, datatype, lang) or ('bnode', label)
+Term = Tuple[str, ...]
+Solution = Dict[str, int]
+
+PREFIX_IRIS = {prefix: namespace for namespace, prefix in SPARQL_NAMESPACES if namespace.startswith('http')}
+PREFIX_IRIS['res:'] = PREFIX_IRIS['dbr:']
+PREFIX_IRIS['xsd:'] = XSD
+
+TURTLE_TOKEN_RE = re.compile(
+    r'<[^>]*>'
+    r'|"(?:[^"\\]|\\.)*"(?:@[A-Za-z][\w-]*|\^\^(?:<[^>]*>|[A-Za-z][\w-]*:[\w-]*))?'
+    r'|@prefix|@base|[A-Za-z_][\w-]*:(?:\\.|[^\s;,\\.]|\.(?=\S))*'
+    r'|[+-]?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|[;,.\[\]]|\w+|\S')
+
+ESCAPE_RE = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+STRING_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f'}
+
+
+def unescape(value: str) -> str:
+    if '\\' not in value:
+        return value
+
+    def replace(match: re.Match) -> str:
+        code = match.group(1) or match.group(2)
+        if code:
+            return chr(int(code, 16))
+        char: str = match.group(3)
+        return STRING_ESCAPES.get(char, char)
+
+    return ESCAPE_RE.sub(replace, value)
+
+
+def parse_literal(token: str, expand: Callable[[str], str]) -> Term:
+    end = token.rindex('"')
+    value = unescape(token[1:end])
+    suffix = token[end + 1:]
+
+    if suffix.startswith('@'):
+        return ('literal', value, '', suffix[1:].lower())
+    if suffix.startswith('^^'):
+        datatype = suffix[2:]
+        return ('literal', value, datatype[1:-1] if datatype[0] == '<' else expand(datatype), '')
+    return ('literal', value, '', '')
+
+
+def parse_number(token: str) -> Term:
+    if 'e' in token.lower():
+        return ('literal', token, XSD + 'double', '')
+    if '.' in token:
+        return ('literal', token, XSD + 'decimal', '')
+    return ('literal', token, XSD + 'integer', '')
+
+
+def open_dump(path: str) -> IO[str]:
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+class TripleStore:
+    # Every term gets an integer id and the triples are indexed three times (subject -> predicate -> objects,
+    # predicate -> object -> subjects, object -> subject -> predicates) so that any pattern with at least one bound
+    # position is answered by dict lookups.
+    def __init__(self) -> None:
+        self.terms: List[Term] = []
+        self.term_ids: Dict[Term, int] = {}
+
+        self.spo: Dict[int, Dict[int, Set[int]]] = {}
+        self.pos: Dict[int, Dict[int, Set[int]]] = {}
+        self.osp: Dict[int, Dict[int, Set[int]]] = {}
+        self.size = 0
+
+    @classmethod
+    def from_files(cls, paths: Iterable[str]) -> 'TripleStore':
+        store = cls()
+        for path in paths:
+            store.load(path)
+        return store
+
+    def term_id(self, term: Term) -> int:
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = len(self.terms)
+            self.term_ids[term] = term_id
+            self.terms.append(term)
+        return term_id
+
+    def add(self, s: Term, p: Term, o: Term) -> None:
+        s_id, p_id, o_id = self.term_id(s), self.term_id(p), self.term_id(o)
+
+        objects = self.spo.setdefault(s_id, {}).setdefault(p_id, set())
+        if o_id in objects:
+            return
+
+        objects.add(o_id)
+        self.pos.setdefault(p_id, {}).setdefault(o_id, set()).add(s_id)
+        self.osp.setdefault(o_id, {}).setdefault(s_id, set()).add(p_id)
+        self.size += 1
+
+    def load(self, path: str) -> None:
+        # n-triples, and the turtle subset used by dumps: prefixes, ';' and ',' lists, 'a', numbers and booleans
+        prefixes = dict(PREFIX_IRIS)
+
+        def expand(name: str) -> str:
+            prefix, local = name.split(':', 1)
+            if prefix + ':' not in prefixes:
+                raise ValueError(f"Unknown prefix {prefix}: in {path}")
+            return prefixes[prefix + ':'] + unescape(local)
+
+        def to_term(token: str) -> Term:
+            if token[0] == '<':
+                return ('uri', unescape(token[1:-1]))
+            if token[0] == '"':
+                return parse_literal(token, expand)
+            if token.startswith('_:'):
+                return ('bnode', token[2:])
+            if token == 'a':
+                return ('uri', RDF_TYPE)
+            if token in ('true', 'false'):
+                return ('literal', token, XSD + 'boolean', '')
+            if token[0].isdigit() or token[0] in '+-':
+                return parse_number(token)
+            return ('uri', expand(token))
+
+        statement: List[str] = []
+        with open_dump(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line[0] == '#':
+                    continue
+
+                for token in TURTLE_TOKEN_RE.findall(line):
+                    if token != '.':
+                        statement.append(token)
+                        continue
+
+                    if not statement:
+                        continue
+                    if statement[0].lower() in ('@prefix', 'prefix'):
+                        prefixes[statement[1]] = unescape(statement[2][1:-1])
+                    else:
+                        self._add_statement(statement, to_term, path)
+                    statement = []
+
+                # PREFIX declarations have no dot
+                if statement and statement[0].lower() == 'prefix' and len(statement) == 3:
+                    prefixes[statement[1]] = unescape(statement[2][1:-1])
+                    statement = []
+
+    def _add_statement(self, tokens: List[str], to_term: Callable[[str], Term], path: str) -> None:
+        if '[' in tokens:
+            raise ValueError(f"Nested blank nodes are not supported in {path}: {' '.join(tokens)}")
+
+        subject = to_term(tokens[0])
+        i = 1
+        while i + 1 < len(tokens):
+            predicate = to_term(tokens[i])
+            i += 1
+            while i < len(tokens):
+                self.add(subject, predicate, to_term(tokens[i]))
+                i += 1
+                if i < len(tokens) and tokens[i] == ',':
+                    i += 1
+                    continue
+                break
+
+            while i < len(tokens) and tokens[i] == ';':
+                i += 1
+
+    def match(self, s: Optional[int], p: Optional[int], o: Optional[int]) -> Iterator[Tuple[int, int, int]]:
+        if s is not None:
+            predicates = self.spo.get(s, {})
+            if p is not None:
+                objects = predicates.get(p, ())
+                if o is not None:
+                    if o in objects:
+                        yield s, p, o
+                else:
+                    for o_id in objects:
+                        yield s, p, o_id
+            elif o is not None:
+                for p_id in self.osp.get(o, {}).get(s, ()):
+                    yield s, p_id, o
+            else:
+                for p_id, objects in predicates.items():
+                    for o_id in objects:
+                        yield s, p_id, o_id
+
+        elif p is not None:
+            objects_subjects = self.pos.get(p, {})
+            if o is not None:
+                for s_id in objects_subjects.get(o, ()):
+                    yield s_id, p, o
+            else:
+                for o_id, subjects in objects_subjects.items():
+                    for s_id in subjects:
+                        yield s_id, p, o_id
+
+        elif o is not None:
+            for s_id, subject_predicates in self.osp.get(o, {}).items():
+                for p_id in subject_predicates:
+                    yield s_id, p_id, o
+
+        else:
+            for s_id, predicates in self.spo.items():
+                for p_id, objects in predicates.items():
+                    for o_id in objects:
+                        yield s_id, p_id, o_id
+
+    def estimate(self, s: Optional[int], p: Optional[int], o: Optional[int]) -> int:
+        # rough number of matches, used to order the triple patterns of a query
+        if s is not None:
+            return len(self.spo.get(s, {}).get(p, ())) if p is not None else len(self.spo.get(s, {}))
+        if o is not None:
+            return len(self.pos.get(p, {}).get(o, ())) if p is not None else len(self.osp.get(o, {}))
+        if p is not None:
+            return len(self.pos.get(p, {})) * 4
+        return self.size
+
+    def query(self, query: str) -> Dict[Any, Any]:
+        return SparqlEvaluator(self, query).run()
+
+    def query_many(self, queries: List[str], workers: int = 1) -> List[Union[Dict[Any, Any], Exception]]:
+        # the exception raised by a query takes the place of its result, workers are forked so they share the store
+        if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return [_query_or_error(self, q) for q in queries]
+
+        global _WORKER_STORE
+        _WORKER_STORE = self
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            results = pool.map(_worker_query, queries, chunksize=max(1, len(queries) // (workers * 4)))
+        _WORKER_STORE = None
+
+        return results
+
+
+_WORKER_STORE: Optional[TripleStore] = None
+
+
+def _query_or_error(store: TripleStore, query: str) -> Union[Dict[Any, Any], Exception]:
+    try:
+        return store.query(query)
+    except Exception as error:
+        return error
+
+
+def _worker_query(query: str) -> Union[Dict[Any, Any], Exception]:
+    assert _WORKER_STORE is not None
+    return _query_or_error(_WORKER_STORE, query)
+
+
+class ExpressionError(Exception):
+    # error while evaluating a filter, the filter is then false as in sparql
+    pass
+
+
+class SparqlEvaluator:
+    # SELECT [DISTINCT] (variables, *, count) / ASK over basic graph patterns, FILTER, UNION, OPTIONAL, GROUP BY,
+    # ORDER BY, LIMIT and OFFSET. Results are in the sparql json format returned by dbpedia.
+    def __init__(self, store: TripleStore, query: str):
+        self.store = store
+        self.prefixes = dict(PREFIX_IRIS)
+        self.n_blank_nodes = 0
+        self.variables: List[str] = []
+
+        tokens = tokenize_sparql(query)
+        while len(tokens) >= 3 and tokens[0].lower() == 'prefix':
+            self.prefixes[tokens[1]] = tokens[2][1:-1]
+            tokens = tokens[3:]
+
+        if '{' not in tokens:
+            raise ValueError(f"No graph pattern in query: {query}")
+
+        start = tokens.index('{')
+        self.head = [t for t in tokens[:start] if t != 'where']
+        self.body, end = parse_group(tokens, start + 1)
+        self.tail = tokens[end:]
+
+    # terms -------------------
+
+    def to_term(self, token: str) -> Term:
+        if token[0] == '<':
+            return ('uri', token[1:-1])
+        if token[0] == '"':
+            return parse_literal(token, self.expand)
+        if token == 'a':
+            return ('uri', RDF_TYPE)
+        if token in ('true', 'false'):
+            return ('literal', token, XSD + 'boolean', '')
+        if token[0].isdigit() or (token[0] in '+-' and len(token) > 1):
+            return parse_number(token)
+        if ':' in token:
+            return ('uri', self.expand(token))
+        raise ValueError(f"Unexpected token in query: {token}")
+
+    def expand(self, name: str) -> str:
+        prefix, local = name.split(':', 1)
+        if prefix + ':' not in self.prefixes:
+            raise ValueError(f"Unknown prefix {prefix}:")
+        return self.prefixes[prefix + ':'] + re.sub(r'\\(.)', r'\1', local)
+
+    def _pattern_position(self, token: str) -> Union[str, int]:
+        # variable name or term id, -1 for a term that is not in the store
+        if token[0] == '?':
+            if token not in self.variables:
+                self.variables.append(token)
+            return token
+        return self.store.term_ids.get(self.to_term(token), -1)
+
+    # graph patterns -------------------
+
+    def _triple_patterns(self, tokens: List[str]) -> List[Tuple[Union[str, int], ...]]:
+        # s p o, with ';' and ',' lists and [ ] as a blank node
+        terms: List[str] = []
+        i = 0
+        while i < len(tokens):
+            if tokens[i] == '[' and i + 1 < len(tokens) and tokens[i + 1] == ']':
+                self.n_blank_nodes += 1
+                terms.append(f'?_blank{self.n_blank_nodes}')
+                i += 2
+            else:
+                terms.append(tokens[i])
+                i += 1
+
+        patterns = []
+        subject: Optional[str] = None
+        predicate: Optional[str] = None
+        expected: Optional[str] = 's'
+        for term in terms:
+            if term == ';':
+                expected = 'p'
+            elif term == ',':
+                expected = 'o'
+            elif expected == 's':
+                subject, expected = term, 'p'
+            elif expected == 'p':
+                predicate, expected = term, 'o'
+            elif expected == 'o' and subject is not None and predicate is not None:
+                patterns.append((subject, predicate, term))
+                expected = None
+            else:
+                raise ValueError(f"Unsupported triple pattern: {' '.join(tokens)}")
+
+        if expected is not None or not patterns:
+            raise ValueError(f"Unsupported triple pattern: {' '.join(tokens)}")
+
+        return [tuple(self._pattern_position(t) for t in pattern) for pattern in patterns]
+
+    def eval_group(self, group: Group, solutions: List[Solution]) -> List[Solution]:
+        # the elements of the group are joined left to right, as the optional and minus patterns depend on what was
+        # matched before them. Consecutive triple patterns make one basic graph pattern, and the filters apply to the
+        # whole group
+        steps: List[Tuple[str, Any]] = []
+        triples: List[Tuple[Union[str, int], ...]] = []
+        filters: List[List[Any]] = []
+
+        def end_bgp() -> None:
+            nonlocal triples
+            if triples:
+                steps.append(('bgp', triples))
+                triples = []
+
+        for item in group:
+            if item and item[0] == 'filter':
+                filters.append(item[1:])
+                continue
+
+            tokens: List[str] = []
+            i = 0
+            while i < len(item):
+                element = item[i]
+                if isinstance(element, list) or element in ('optional', 'minus'):
+                    if tokens:
+                        triples.extend(self._triple_patterns(tokens))
+                        tokens = []
+                    end_bgp()
+
+                    if element in ('optional', 'minus'):
+                        steps.append((element, item[i + 1]))
+                        i += 2
+                        continue
+
+                    union = [element]
+                    while i + 2 < len(item) and item[i + 1] == 'union':
+                        union.append(item[i + 2])
+                        i += 2
+                    steps.append(('union', union) if len(union) > 1 else ('group', element))
+                    i += 1
+
+                elif isinstance(element, str) and element in ('bind', 'values', 'graph', 'service'):
+                    raise ValueError(f"Unsupported keyword: {element}")
+
+                else:
+                    tokens.append(element)
+                    i += 1
+
+            if tokens:
+                triples.extend(self._triple_patterns(tokens))
+        end_bgp()
+
+        for kind, pattern in steps:
+            if kind == 'bgp':
+                solutions = self.eval_bgp(pattern, solutions)
+            elif kind == 'group':
+                solutions = self.eval_group(pattern, solutions)
+            elif kind == 'union':
+                solutions = [s for branch in pattern for s in self.eval_group(branch, solutions)]
+            elif kind == 'optional':
+                extended = []
+                for solution in solutions:
+                    matches = self.eval_group(pattern, [solution])
+                    extended.extend(matches if matches else [solution])
+                solutions = extended
+            else:
+                minus = self.eval_group(pattern, [{}])
+                solutions = [s for s in solutions if not any(_compatible_and_shared(s, m) for m in minus)]
+
+        for expression in filters:
+            parsed = ExpressionParser(self, expression).parse()
+            solutions = [s for s in solutions if self.effective_boolean(parsed, s)]
+
+        return solutions
+
+    def eval_bgp(self, triples: List[Tuple[Union[str, int], ...]], solutions: List[Solution]) -> List[Solution]:
+        if not triples or not solutions:
+            return solutions
+
+        # greedy join order: the pattern with the fewest estimated matches given the variables bound so far first
+        bound = set(solutions[0].keys())
+        remaining = list(triples)
+        ordered = []
+        while remaining:
+            def cost(triple: Tuple[Union[str, int], ...]) -> Tuple[int, int]:
+                ids = [None if isinstance(t, str) else t for t in triple]
+                n_bound = sum(1 for t in triple if not isinstance(t, str) or t in bound)
+                return -n_bound, self.store.estimate(*ids)
+
+            best = min(remaining, key=cost)
+            remaining.remove(best)
+            ordered.append(best)
+            bound.update(t for t in best if isinstance(t, str))
+
+        for triple in ordered:
+            extended = []
+            for solution in solutions:
+                ids = [solution.get(t) if isinstance(t, str) else t for t in triple]
+                for match in self.store.match(*ids):
+                    new_solution = dict(solution)
+                    for position, value in zip(triple, match):
+                        if isinstance(position, str):
+                            if new_solution.setdefault(position, value) != value:
+                                break
+                    else:
+                        extended.append(new_solution)
+            solutions = extended
+            if not solutions:
+                break
+
+        return solutions
+
+    # expressions -------------------
+
+    def value(self, node: Any, solution: Solution) -> Term:
+        kind = node[0]
+        if kind == 'var':
+            if node[1] not in solution:
+                raise ExpressionError(f"Unbound variable {node[1]}")
+            return self.store.terms[solution[node[1]]]
+        if kind == 'term':
+            term: Term = node[1]
+            return term
+        if kind == 'not':
+            return _boolean(not self.strict_boolean(node[1], solution))
+        if kind in ('||', '&&'):
+            # an error on one side is ignored when the other side decides the result
+            sides: List[Optional[bool]] = []
+            for side in node[1:]:
+                try:
+                    sides.append(self.strict_boolean(side, solution))
+                except ExpressionError:
+                    sides.append(None)
+            decisive = kind == '||'
+            if decisive in sides:
+                return _boolean(decisive)
+            if None in sides:
+                raise ExpressionError(f"Error in {kind}")
+            return _boolean(not decisive)
+        if kind == 'compare':
+            return _boolean(_compare(node[1], self.value(node[2], solution), self.value(node[3], solution)))
+        if kind == 'call':
+            return self.call(node[1], node[2], solution)
+        raise ExpressionError(f"Unknown expression {kind}")
+
+    def strict_boolean(self, node: Any, solution: Solution) -> bool:
+        term = self.value(node, solution)
+        if term[0] != 'literal':
+            raise ExpressionError("No boolean value for an iri")
+        if term[2] == XSD + 'boolean':
+            return term[1] in ('true', '1')
+        if term[2] in NUMERIC_TYPES:
+            return float(term[1]) != 0
+        return term[1] != ''
+
+    def effective_boolean(self, node: Any, solution: Solution) -> bool:
+        # value of a filter, false when the expression is an error
+        try:
+            return self.strict_boolean(node, solution)
+        except ExpressionError:
+            return False
+
+    def call(self, name: str, args: List[Any], solution: Solution) -> Term:
+        if name == 'bound':
+            return _boolean(args[0][1] in solution)
+
+        values = [self.value(arg, solution) for arg in args]
+        if name == 'str':
+            return ('literal', values[0][1], '', '')
+        if name == 'datatype':
+            if values[0][0] != 'literal' or values[0][3]:
+                raise ExpressionError("No datatype for an iri or a literal with a language")
+            return ('uri', values[0][2] or XSD + 'string')
+        if name == 'lang':
+            return ('literal', values[0][3] if values[0][0] == 'literal' else '', '', '')
+        if name == 'langmatches':
+            # basic filtering of rfc 4647: the whole tag or its first subtags, '*' for any tag
+            tag, language_range = values[0][1].lower(), values[1][1].lower()
+            if language_range == '*':
+                return _boolean(tag != '')
+            return _boolean(tag == language_range or tag.startswith(language_range + '-'))
+        if name == 'regex':
+            flags = re.IGNORECASE if len(values) > 2 and 'i' in values[2][1] else 0
+            return _boolean(re.search(values[1][1], values[0][1], flags) is not None)
+        if name == 'contains':
+            return _boolean(values[1][1] in values[0][1])
+        if name == 'strstarts':
+            return _boolean(values[0][1].startswith(values[1][1]))
+        if name in ('lcase', 'ucase'):
+            return ('literal', values[0][1].lower() if name == 'lcase' else values[0][1].upper()) + tuple(values[0][2:])
+        if name in ('isiri', 'isuri'):
+            return _boolean(values[0][0] == 'uri')
+        if name == 'isliteral':
+            return _boolean(values[0][0] == 'literal')
+        raise ValueError(f"Unsupported function: {name}")
+
+    # solution modifiers -------------------
+
+    def run(self) -> Dict[Any, Any]:
+        form = self.head[0] if self.head else ''
+        solutions = self.eval_group(self.body, [{}])
+
+        if form == 'ask':
+            return {'head': {'link': []}, 'boolean': bool(solutions)}
+        if form != 'select':
+            raise ValueError(f"Unsupported query form: {form}")
+
+        distinct, projection = self._parse_projection(self.head[1:])
+        group_by, order_by, limit, offset = self._parse_modifiers(self.tail)
+
+        rows = self._aggregate(solutions, projection, group_by)
+
+        for variable, descending in reversed(order_by):
+            rows.sort(key=lambda row: _order_key(row.get(variable)), reverse=descending)
+
+        names = [name for name, _ in projection] if projection else [v for v in self.variables if not v.startswith('?_blank')]
+        projected = [tuple(row.get(name) for name in names) for row in rows]
+
+        if distinct:
+            projected = list(dict.fromkeys(projected))
+        projected = projected[offset:offset + limit if limit is not None else None]
+
+        return {
+            'head': {'link': [], 'vars': [name[1:] for name in names]},
+            'results': {'distinct': False, 'ordered': True, 'bindings': [
+                {name[1:]: _term_json(term) for name, term in zip(names, row) if term is not None} for row in projected]}
+        }
+
+    def _parse_projection(self, tokens: List[str]) -> Tuple[bool, List[Tuple[str, Any]]]:
+        # [(name, None)] for variables, [(name, ('count', distinct, variable or None))] for counts, [] for *
+        distinct = bool(tokens) and tokens[0] in ('distinct', 'reduced')
+        if distinct:
+            tokens = tokens[1:]
+
+        projection: List[Tuple[str, Any]] = []
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token == '*':
+                i += 1
+            elif token[0] == '?':
+                projection.append((token, None))
+                i += 1
+            elif token == 'count' or (token == '(' and i + 1 < len(tokens) and tokens[i + 1] == 'count'):
+                wrapped = token == '('
+                i += 2 if wrapped else 1
+                close = tokens.index(')', i)
+                inside = [t for t in tokens[i + 1:close]]
+                count_distinct = bool(inside) and inside[0] == 'distinct'
+                inside = inside[1:] if count_distinct else inside
+                i = close + 1
+
+                name = f'?callret-{len(projection)}'
+                if i + 1 < len(tokens) and tokens[i] == 'as':
+                    name = tokens[i + 1]
+                    i += 2
+                if wrapped:
+                    i += 1
+
+                projection.append((name, ('count', count_distinct, inside[0] if inside and inside[0] != '*' else None)))
+            else:
+                raise ValueError(f"Unsupported projection: {' '.join(tokens)}")
+
+        return distinct, projection
+
+    def _parse_modifiers(self, tokens: List[str]) -> Tuple[List[str], List[Tuple[str, bool]], Optional[int], int]:
+        group_by: List[str] = []
+        order_by: List[Tuple[str, bool]] = []
+        limit, offset = None, 0
+
+        i = 0
+        while i < len(tokens):
+            if tokens[i] == 'group' and tokens[i + 1] == 'by':
+                i += 2
+                while i < len(tokens) and tokens[i][0] == '?':
+                    group_by.append(tokens[i])
+                    i += 1
+            elif tokens[i] == 'order' and tokens[i + 1] == 'by':
+                i += 2
+                while i < len(tokens):
+                    if tokens[i][0] == '?':
+                        order_by.append((tokens[i], False))
+                        i += 1
+                    elif tokens[i] in ('asc', 'desc') and tokens[i + 1] == '(' and tokens[i + 3] == ')':
+                        order_by.append((tokens[i + 2], tokens[i] == 'desc'))
+                        i += 4
+                    else:
+                        break
+            elif tokens[i] == 'limit':
+                limit = int(tokens[i + 1])
+                i += 2
+            elif tokens[i] == 'offset':
+                offset = int(tokens[i + 1])
+                i += 2
+            else:
+                raise ValueError(f"Unsupported solution modifier: {' '.join(tokens[i:])}")
+
+        return group_by, order_by, limit, offset
+
+    def _aggregate(self, solutions: List[Solution], projection: List[Tuple[str, Any]], group_by: List[str]) -> List[Dict[str, Term]]:
+        terms = self.store.terms
+        aggregates = [(name, aggregate) for name, aggregate in projection if aggregate is not None]
+        if not aggregates and not group_by:
+            return [{name: terms[term_id] for name, term_id in s.items()} for s in solutions]
+
+        groups: Dict[Tuple, List[Solution]] = {}
+        for solution in solutions:
+            groups.setdefault(tuple(solution.get(v) for v in group_by), []).append(solution)
+        if not groups and not group_by:
+            groups[()] = []
+
+        rows = []
+        for key, members in groups.items():
+            row = {v: terms[term_id] for v, term_id in zip(group_by, key) if term_id is not None}
+            for name, (_, count_distinct, variable) in aggregates:
+                values = [tuple(sorted(s.items())) if variable is None else s[variable] for s in members
+                          if variable is None or variable in s]
+                row[name] = ('literal', str(len(set(values)) if count_distinct else len(values)), XSD + 'integer', '')
+            rows.append(row)
+
+        return rows
+
+
+class ExpressionParser:
+    # filter expressions: || && comparisons ! (...) function calls, variables and terms
+    def __init__(self, evaluator: SparqlEvaluator, tokens: List[Any]):
+        if any(isinstance(t, list) for t in tokens):
+            raise ValueError("EXISTS filters are not supported")
+        self.evaluator = evaluator
+        self.tokens = tokens
+        self.i = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def take(self) -> str:
+        token: str = self.tokens[self.i]
+        self.i += 1
+        return token
+
+    def parse(self) -> Any:
+        node = self.parse_or()
+        if self.i != len(self.tokens):
+            raise ValueError(f"Unsupported filter: {' '.join(self.tokens)}")
+        return node
+
+    def parse_or(self) -> Any:
+        node = self.parse_and()
+        while self.peek() == '||':
+            self.take()
+            node = ('||', node, self.parse_and())
+        return node
+
+    def parse_and(self) -> Any:
+        node = self.parse_comparison()
+        while self.peek() == '&&':
+            self.take()
+            node = ('&&', node, self.parse_comparison())
+        return node
+
+    def parse_comparison(self) -> Any:
+        node = self.parse_unary()
+        if self.peek() in ('=', '!=', '<', '>', '<=', '>='):
+            node = ('compare', self.take(), node, self.parse_unary())
+        return node
+
+    def parse_unary(self) -> Any:
+        token = self.take()
+        if token == '!':
+            return ('not', self.parse_unary())
+        if token == '(':
+            node = self.parse_or()
+            self.take()
+            return node
+        if token[0] == '?':
+            return ('var', token)
+        if self.peek() == '(' and token[0].isalpha() and ':' not in token:
+            self.take()
+            args = []
+            while self.peek() != ')':
+                args.append(self.parse_or())
+                if self.peek() == ',':
+                    self.take()
+            self.take()
+            return ('call', token.lower(), args)
+        return ('term', self.evaluator.to_term(token))
+
+
+def _boolean(value: bool) -> Term:
+    return ('literal', 'true' if value else 'false', XSD + 'boolean', '')
+
+
+def _compatible_and_shared(solution: Solution, other: Solution) -> bool:
+    shared = solution.keys() & other.keys()
+    return bool(shared) and all(solution[v] == other[v] for v in shared)
+
+
+def _compare(operator: str, left: Term, right: Term) -> bool:
+    if left[0] == 'literal' and right[0] == 'literal' and left[2] in NUMERIC_TYPES and right[2] in NUMERIC_TYPES:
+        a: Any = float(left[1])
+        b: Any = float(right[1])
+    elif operator in ('=', '!='):
+        return (left == right) == (operator == '=')
+    elif left[0] == right[0] == 'literal' and left[2] == right[2]:
+        a, b = left[1], right[1]
+    else:
+        raise ExpressionError(f"Cannot compare {left} and {right}")
+
+    result: bool = {'=': a == b, '!=': a != b, '<': a < b, '>': a > b, '<=': a <= b, '>=': a >= b}[operator]
+    return result
+
+
+def _order_key(term: Optional[Term]) -> Tuple:
+    if term is None:
+        return (0,)
+    if term[0] == 'bnode':
+        return (1, term[1])
+    if term[0] == 'uri':
+        return (2, term[1])
+    if term[2] in NUMERIC_TYPES:
+        try:
+            return (3, 0, float(term[1]), '')
+        except ValueError:
+            pass
+    return (3, 1, 0.0, term[1])
+
+
+def _term_json(term: Term) -> Dict[str, str]:
+    if term[0] == 'uri':
+        return {'type': 'uri', 'value': term[1]}
+    if term[0] == 'bnode':
+        return {'type': 'bnode', 'value': term[1]}
+    if term[3]:
+        return {'type': 'literal', 'xml:lang': term[3], 'value': term[1]}
+    if term[2]:
+        return {'type': 'typed-literal', 'datatype': term[2], 'value': term[1]}
+    return {'type': 'literal', 'value': term[1]}
+
+
+def benchmark(dump_paths: List[str], sparql_path: str, workers: int) -> None:
+    start = time.perf_counter()
+    store = TripleStore.from_files(dump_paths)
+    print(f"{store.size} triples, {len(store.terms)} terms loaded in {time.perf_counter() - start:.2f}s")
+
+    with open(sparql_path, 'r', encoding='utf-8') as f:
+        queries = [q for q in f.read().splitlines() if q.strip()]
+
+    start = time.perf_counter()
+    results = store.query_many(queries, workers)
+    elapsed = time.perf_counter() - start
+
+    errors = [(q, r) for q, r in zip(queries, results) if isinstance(r, Exception)]
+    for query, error in errors[:5]:
+        print(f"[ERROR] {query}\n\t{error}")
+    print(f"{len(queries)} queries in {elapsed:.2f}s ({len(queries) / elapsed:.0f} queries/s), {len(errors)} errors")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load dumps in the in-memory triple store and time a file of pure sparql queries against them.")
+
+    parser.add_argument("--data", type=str, nargs='+', required=True,
+                        help="path to the n-triples/turtle dump(s), can be .gz or .bz2")
+
+    parser.add_argument("--sparql", type=str, required=True,
+                        help="path to the txt file containing pure sparql queries separated by newlines")
+
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes running the queries")
+
+    args = parser.parse_args()
+    benchmark(args.data, args.sparql, args.workers)
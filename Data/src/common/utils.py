@@ -1,6 +1,7 @@
 # general utils
 
-from typing import List, Tuple
+from typing import Dict, Iterable, List, Tuple
+import re
 import unicodedata
 
 from common.consts import CAMEL_CASE_SPLIT_RE, REPLACEMENTS, RESOURCE_ABBRV, RESOURCE_TYPE, URI_SHORTENERS
@@ -53,4 +54,26 @@ def reduce_uri(uri):
     for r in URI_SHORTENERS:
         uri = uri.replace(r['match'], r['pure_sparql'])
 
-    return uri
\ No newline at end of file
+    return uri
+
+
+def build_trie_regex(words: Iterable[str]) -> str:
+    # builds a regex alternation where words sharing a prefix share a branch, so re only tests the next char once per position
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def to_regex(node: Dict) -> str:
+        branches = [re.escape(char) + to_regex(child) for char, child in sorted(node.items()) if char != '']
+        if not branches:
+            return ''
+
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            body = f'(?:{body})?'
+        return body
+
+    return to_regex(trie)
@@ -2,6 +2,7 @@ import argparse
 import json
 from typing import Dict, List
 from classes.lcquad_dataset import LCQUADDataset
+from common.question_correction import SymSpellCorrector
 
 def load_templates(path: str) -> List[Dict]:
     with open(path, 'r', encoding='utf-8') as f:
@@ -9,7 +10,8 @@ def load_templates(path: str) -> List[Dict]:
     return templates
 
 def main(args: argparse.Namespace) -> None:
-    processed_dataset = LCQUADDataset(args.train, args.test) #, (args.dbr, args.dbp, args.dbc, args.dbo))
+    spell_corrector = SymSpellCorrector.from_file(args.lexicon) if args.lexicon else None
+    processed_dataset = LCQUADDataset(args.train, args.test, spell_corrector=spell_corrector) #, (args.dbr, args.dbp, args.dbc, args.dbo))
     templates = load_templates(args.templates)
     processed_dataset.tag_templated_questions(templates)
     processed_dataset.untag_elems_not_predictable(untag_all=False)
@@ -52,6 +54,9 @@ if __name__ == "__main__":
     parser.add_argument("--out_dir", type=str, default='out_data/LC-QuAD',
                         help="path to save all data")
 
+    parser.add_argument("--lexicon", type=str, default=None,
+                        help="optional path to a lexicon file (one 'word count' per line) used to correct unseen typos in questions")
+
 
     args = parser.parse_args()
 
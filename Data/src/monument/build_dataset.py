@@ -1,9 +1,11 @@
 import argparse
 import json
 from classes.monument_dataset import MonumentDataset
+from common.question_correction import SymSpellCorrector
 
 def main(args: argparse.Namespace) -> None:
-    processed_dataset = MonumentDataset(args.nl, args.sparql, args.templates)
+    spell_corrector = SymSpellCorrector.from_file(args.lexicon) if args.lexicon else None
+    processed_dataset = MonumentDataset(args.nl, args.sparql, args.templates, spell_corrector=spell_corrector)
     processed_dataset.save(f'{args.out_dir}/dataset.json')
 
 if __name__ == "__main__":
@@ -22,6 +24,9 @@ if __name__ == "__main__":
     parser.add_argument("--out_dir", type=str, default='out_data/Monument/base',
                         help="path to save all data")
 
+    parser.add_argument("--lexicon", type=str, default=None,
+                        help="optional path to a lexicon file (one 'word count' per line) used to correct unseen typos in questions")
+
 
     args = parser.parse_args()
 
@@ -4,8 +4,9 @@ import re
 from typing import Dict, List, Optional
 
 from classes.monument_dataset import MonumentDataset
-from common.consts import GET_RESOURCES_INTERM_SPARQL_RE, GET_RESOURCES_PURE_SPARQL_RE
+from common.consts import GET_RESOURCES_PURE_SPARQL_RE
 from common.re_callbacks import abstract_resources
+from common.resource_lexer import sub_interm_sparql_resources
 
 Template = Dict[str, str]
 
@@ -119,7 +120,7 @@ def use_placeholders(dataset: MonumentDataset) -> List[Template]:
     templated_entries: List[Template] = []
 
     for entry in dataset.entries:
-        templated_interm_sparql = GET_RESOURCES_INTERM_SPARQL_RE.sub(abstract_resources, entry.interm_sparql)
+        templated_interm_sparql = sub_interm_sparql_resources(abstract_resources, entry.interm_sparql)
         templated_interm_sparql = re.sub('\s+', ' ', templated_interm_sparql)
 
         templated_pure_sparql = GET_RESOURCES_PURE_SPARQL_RE.sub(abstract_resources, entry.pure_sparql)
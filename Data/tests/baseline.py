@@ -0,0 +1,198 @@
+# implementations of the first version of the repository that were replaced by faster ones, kept as they were so that
+# the tests can check that the replacements give the same outputs
+
+import re
+
+from common.consts import (CATCH_VAR_IN_RESOURCE_NAME_RE, ENDS_EXCEPTIONS_NOT_REPLACE, ENDS_EXCEPTIONS_REPLACE, EXCEPTIONS_NOT_REPLACE,
+                           GET_RESOURCES_INTERM_SPARQL_RE, GET_RESOURCES_PURE_SPARQL_RE, INSERT_SPACES_MATH_RE, REPLACE_FILTER_PAR_RE,
+                           REPLACE_ORDER_BY_RE, REPLACE_QUOTES_RE, REPLACE_REST_PAR_RE, REPLACEMENTS)
+from common.re_callbacks import correct_parentheses_interm_sparql, insert_spaces_math, replace_quotes
+
+
+def correct_sep_dots(match: re.Match) -> str:
+    e = match.group(0).strip()
+    if e[-1] == '.':
+        if e in EXCEPTIONS_NOT_REPLACE:
+            return f' {match.group(0)} '
+
+        elif e[-2].isnumeric() or e.split('_')[-1].lower() in ENDS_EXCEPTIONS_REPLACE:
+            return f' {e[:-1]} sep_dot '
+
+        elif len(e.split('.')[-2]) <= 4:
+            return f' {match.group(0)} '
+
+        elif len(e.split('_')[-1]) <= 4 or e.split('_')[-1].lower() in ENDS_EXCEPTIONS_NOT_REPLACE:
+            return f' {match.group(0)} '
+        else:
+            return f' {e[:-1]} sep_dot '
+
+    return f' {match.group(0)} '
+
+
+def correct_interm_sparql(interm_sparql: str) -> str:
+    # Dataset.correct_interm_sparql
+    interm_sparql = interm_sparql.replace('attr_open', ' par_open ')
+    interm_sparql = interm_sparql.replace('attr_close', ' par_close ')
+
+    interm_sparql = re.sub(r'\s+', ' ', interm_sparql)
+
+    interm_sparql = interm_sparql.replace('var_uri.', 'var_uri sep_dot') #dbnqa
+    interm_sparql = interm_sparql.replace('brack_open', ' brack_open ')
+    interm_sparql = interm_sparql.replace('brack_close', ' brack_close ')
+    interm_sparql = interm_sparql.replace('dbp_length', ' dbp_length ')
+
+    interm_sparql = REPLACE_FILTER_PAR_RE.sub(
+        correct_parentheses_interm_sparql, interm_sparql)
+    interm_sparql = REPLACE_REST_PAR_RE.sub(
+        correct_parentheses_interm_sparql, interm_sparql)
+    interm_sparql = REPLACE_QUOTES_RE.sub(replace_quotes, interm_sparql)
+    interm_sparql = GET_RESOURCES_INTERM_SPARQL_RE.sub(
+        correct_sep_dots, interm_sparql)
+    interm_sparql = INSERT_SPACES_MATH_RE.sub(
+        insert_spaces_math, interm_sparql)
+
+    interm_sparql = interm_sparql.replace('FILTER', 'filter')
+    interm_sparql = interm_sparql.replace('COUNT', 'count')
+    interm_sparql = interm_sparql.replace('UNION', 'union')
+
+    interm_sparql = interm_sparql.replace('%3F', '?')
+
+    interm_sparql = re.sub(r'\s+', ' ', interm_sparql)
+    interm_sparql = interm_sparql.strip()
+
+    interm_sparql = interm_sparql.replace('par_open', 'attr_open')
+    interm_sparql = interm_sparql.replace('par_close', 'attr_close')
+    interm_sparql = interm_sparql.replace('sparql_open', 'par_open')
+    interm_sparql = interm_sparql.replace('sparql_close', 'par_close')
+
+    return interm_sparql
+
+
+def reverse_replacements(query: str) -> str:
+    for r in REPLACEMENTS:
+        original = r[0]
+        encoding = r[-1]
+        query = query.replace(encoding, original)
+        stripped_encoding = str.strip(encoding)
+        query = query.replace(stripped_encoding, original)
+
+    return query
+
+
+def escape_order_by(query: str) -> str:
+    matches = REPLACE_ORDER_BY_RE.findall(query)
+
+    if len(matches) == 0:
+        return query
+
+    matches = matches[0]
+
+    if len(matches) > 3:
+        raise ValueError(f"The query '{query}' has more than one order by!")
+
+    if matches[1] == "_oba_":
+        order_by = "ORDER BY ASC("
+    elif matches[1] == "_obd_":
+        order_by = "ORDER BY DESC("
+
+    order_by_str = order_by + matches[2] + ")"
+    query = query.replace(matches[0], order_by_str)
+
+    return query
+
+
+def remove_spaces_from_resources(match: re.Match) -> str:
+    entity = match.group(0)
+    entity = entity.replace(" ", "")
+    entity = entity.replace("\\", "")
+    entity = entity.replace(' attr_dot ', ".")
+    entity = entity.replace(' attr_dot', ".")
+    entity = entity.replace('attr_dot ', ".")
+    entity = entity.replace('attr_dot', ".")
+    return f" {entity} "
+
+
+def add_var_in_resource_names(match: re.Match) -> str:
+    return str(match.group(0).replace('?', 'var_'))
+
+
+def interm_sparql_to_pure_sparql(interm_query: str):
+    # interm_sparql_to_pure_sparql.interm_sparql_to_pure_sparql
+    query = reverse_replacements(interm_query)
+    query = escape_order_by(query)
+    query = CATCH_VAR_IN_RESOURCE_NAME_RE.sub(add_var_in_resource_names, query)
+    query = query.replace("where{", "where {")
+    query = query.replace("}", " } ")
+    query = query.replace("FILTER", "filter")
+    query = query.replace("COUNT", "count")
+    query = query.replace("UNION", "union")
+
+    query = GET_RESOURCES_PURE_SPARQL_RE.sub(remove_spaces_from_resources, query)
+
+    query = query.replace("dbp:length", " dbp:length ")
+    query = re.sub(" ?%3F", "?", query)
+    query = re.sub(r"\s+", " ", query)
+    query = query.strip()
+    return query
+
+
+def escape_parentheses_in_entities(match: re.Match) -> str:
+    resource: str = match.group(0)
+    resource = resource.replace('(', '\\(')
+    resource = resource.replace(')', '\\)')
+    return resource
+
+
+def escape_parentheses(query: str) -> str:
+    query = GET_RESOURCES_PURE_SPARQL_RE.sub(escape_parentheses_in_entities, query)
+    return query
+
+
+def escape_ampersands(query: str) -> str:
+    amp = query.find('&')
+    while amp > 0:
+        if query[amp - 1] != '&' and query[amp + 1] != '&':
+            query = query[:amp] + '\\' + query[amp:]
+        amp = query.find('&', amp + 2)
+    return query
+
+
+def escape_dots_in_resources(match: re.Match) -> str:
+    full_match: str = match.group(0)
+    return full_match.replace('.', '\\.')
+
+
+def escape_dots(query: str) -> str:
+    query = GET_RESOURCES_PURE_SPARQL_RE.sub(escape_dots_in_resources, query)
+    return query
+
+
+def escape_plus(query: str) -> str:
+    idx = query.find('+')
+    while idx > 0:
+        query = query[:idx] + '\\' + query[idx:]
+        idx = query.find('+', idx + 2)
+    return query
+
+
+def escape_star(query: str) -> str:
+    idx = query.find('*')
+    while idx > 0:
+        query = query[:idx] + '\\' + query[idx:]
+        idx = query.find('*', idx + 2)
+    return query
+
+
+def escape_query(query: str) -> str:
+    # interm_sparql_to_pure_sparql.escape_query
+    query = escape_parentheses(query)
+    query = escape_ampersands(query)
+    query = escape_dots(query)
+    query = escape_plus(query)
+    # query = escape_star(query)
+    query = escape_order_by(query)
+    query = query.replace("'", "\\'")
+    query = query.replace(",", "\\,")
+    query = query.replace("!", "\\!")
+    query = query.replace("/", "\\/")
+    return query
@@ -0,0 +1,8 @@
+# the tests import the modules the way the scripts do, from the src directory, and read the samples of raw_data
+
+import os
+import sys
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, os.path.join(DATA_DIR, 'src'))
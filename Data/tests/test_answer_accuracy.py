@@ -0,0 +1,82 @@
+import json
+
+from common import answer_accuracy
+from common.answer_accuracy import generate_report
+
+
+def write_report(path, n_entries):
+    # every target is one of two queries, so that the later chunks only repeat the queries of the first one
+    entries = [{'id': i, 'template_id': i % 2, 'correct': True,
+                'trg': f'select var_x where brack_open var_x dbo_country dbr_Country_{i % 2} brack_close',
+                'predicted': f'select var_x where brack_open var_x dbo_country dbr_Country_{i % 2} brack_close'}
+               for i in range(n_entries)]
+    path.write_text(json.dumps(entries))
+
+
+def test_queries_of_earlier_chunks_are_not_sent_again_without_cache(tmp_path, monkeypatch):
+    sent = []
+
+    def query_dbpedia_many(queries, **kwargs):
+        sent.extend(queries)
+        return [{'head': {'vars': ['x']}, 'results': {'bindings': [{'x': {'type': 'uri', 'value': q}}]}} for q in queries]
+
+    monkeypatch.setattr(answer_accuracy, 'query_dbpedia_many', query_dbpedia_many)
+    report = tmp_path / 'report.json'
+    write_report(report, 8)
+
+    summaries, evaluation = generate_report(str(report), False, True, cache_path=None, chunk_size=2)
+    assert len(sent) == 2
+    assert evaluation.full['answer_accuracy'] == 1.0
+    assert summaries == []
+
+    enriched = [json.loads(line) for line in (tmp_path / 'report_enriched.jsonl').read_text().splitlines()]
+    assert len(enriched) == 8 and all(entry['dbpedia']['trg']['query_result'] for entry in enriched)
+
+
+def test_summaries_are_opt_in(tmp_path, monkeypatch):
+    report = tmp_path / 'report.json'
+    write_report(report, 3)
+
+    summaries, _ = generate_report(str(report), False, False, cache_path=None, keep_summaries=True)
+    assert [summary['id'] for summary in summaries] == [0, 1, 2]
+
+
+def test_errors_of_earlier_chunks_without_cache(tmp_path, monkeypatch):
+    # the query of Country_0 fails for good and is not sent again, the one of Country_1 times out and is sent again
+    sent = []
+
+    def query_dbpedia_many(queries, **kwargs):
+        sent.extend(queries)
+        return [ValueError("cannot parse") if 'Country_0' in q else TimeoutError("timed out") for q in queries]
+
+    monkeypatch.setattr(answer_accuracy, 'query_dbpedia_many', query_dbpedia_many)
+    report = tmp_path / 'report.json'
+    write_report(report, 8)
+
+    generate_report(str(report), False, True, cache_path=None, chunk_size=2)
+    assert len([q for q in sent if 'Country_0' in q]) == 1
+    assert len([q for q in sent if 'Country_1' in q]) == 4
+
+    enriched = [json.loads(line) for line in (tmp_path / 'report_enriched.jsonl').read_text().splitlines()]
+    assert [entry['dbpedia']['trg']['query_result'] for entry in enriched] == ["cannot parse", "timed out"] * 4
+    assert [entry['dbpedia']['trg']['is_transient'] for entry in enriched] == [False, True] * 4
+
+
+def test_gold_queries_shared_by_reports(tmp_path, monkeypatch):
+    # both reports have the same targets, each gold query is sent once for the two of them
+    sent = []
+
+    def query_dbpedia_many(queries, **kwargs):
+        sent.extend(queries)
+        return [{'head': {'vars': ['x']}, 'results': {'bindings': [{'x': {'type': 'uri', 'value': q}}]}} for q in queries]
+
+    monkeypatch.setattr(answer_accuracy, 'query_dbpedia_many', query_dbpedia_many)
+    paths = [tmp_path / 'first.json', tmp_path / 'second.json']
+    for path in paths:
+        write_report(path, 4)
+
+    answer_accuracy.main([str(path) for path in paths], run_dbpedia=True, cache_path=None, chunk_size=2, workers=2)
+    assert len(sent) == 2
+    for path in paths:
+        enriched = [json.loads(line) for line in path.with_name(path.stem + '_enriched.jsonl').read_text().splitlines()]
+        assert all(entry['dbpedia']['trg']['query_result'] and entry['dbpedia']['predicted']['query_result'] for entry in enriched)
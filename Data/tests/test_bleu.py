@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+from common.bleu import BleuStats, bleu_score
+
+# bleu_score follows torchtext in float32 but with the log and exp of python, which can differ from those of torch in
+# their last float32 bit: the scores are compared to the ones of torchtext.data.metrics.bleu_score with a relative
+# tolerance of 2.5e-7, about two float32 ulps
+TOLERANCE = 2.5e-7
+
+# (seed, entries, vocabulary size, longest sentence, references per entry, max_n, weights) of the corpora, and the
+# score the bleu_score of torchtext 0.18 gave for each of them on torch 2.14
+CORPORA = [
+    ((0, 50, 8, 12, 1, 4, None), 0.1934780478477478),
+    ((1, 200, 12, 20, 1, 4, None), 0.24465462565422058),
+    ((2, 100, 6, 10, 3, 4, None), 0.47065600752830505),
+    ((3, 500, 30, 30, 1, 4, None), 0.21370390057563782),
+    ((4, 80, 10, 15, 2, 2, [0.7, 0.3]), 0.6720889210700989),
+    ((5, 60, 5, 8, 1, 3, [0.2, 0.3, 0.5]), 0.26635804772377014),
+    ((6, 30, 40, 1, 1, 4, None), 0.0),
+]
+
+
+def corpus(seed, n_entries, vocabulary_size, max_len, n_refs):
+    # candidates and references drawn from a small vocabulary, the references are the candidate with some words changed
+    # so that the higher order n-grams are also found
+    rng = random.Random(seed)
+    vocabulary = [f'w{i}' for i in range(vocabulary_size)]
+    candidates, references = [], []
+    for _ in range(n_entries):
+        candidate = [rng.choice(vocabulary) for _ in range(rng.randint(1, max_len))]
+        refs = []
+        for _ in range(n_refs):
+            ref = [word if rng.random() < 0.7 else rng.choice(vocabulary) for word in candidate]
+            ref = ref[:rng.randint(1, len(ref))] + [rng.choice(vocabulary) for _ in range(rng.randint(0, 3))]
+            refs.append(ref)
+        candidates.append(candidate)
+        references.append(refs)
+    return candidates, references
+
+
+@pytest.mark.parametrize('parameters, expected', CORPORA)
+def test_bleu_score_matches_torchtext(parameters, expected):
+    seed, n_entries, vocabulary_size, max_len, n_refs, max_n, weights = parameters
+    candidates, references = corpus(seed, n_entries, vocabulary_size, max_len, n_refs)
+    assert bleu_score(candidates, references, max_n, weights) == pytest.approx(expected, rel=TOLERANCE, abs=0)
+
+
+def test_stats_of_entries_add_up_to_the_corpus_score():
+    candidates, references = corpus(1, 200, 12, 20, 1)
+    stats = sum(BleuStats.of_entry(candidate, refs) for candidate, refs in zip(candidates, references))
+    assert stats.score() == bleu_score(candidates, references)
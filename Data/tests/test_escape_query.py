@@ -0,0 +1,60 @@
+import os
+import random
+
+import pytest
+
+import baseline
+from common.interm_sparql_to_pure_sparql import (PURE_SPARQL_DECODER, escape_ampersands, escape_plus, escape_query,
+                                                 escape_query_sequential, escape_star)
+from conftest import DATA_DIR
+from test_interm_sparql_correction import SPARQL_SAMPLES
+
+# characters escaped by escape_query, and resources for the ( ) . only escaped inside them
+SOUP = ['(', ')', '.', '&', '&&', '+', '*', "'", ',', '!', '/', '\\', ' ', ' ', '  ', '?b', '{', '}', 'dbr:A', 'dbo:x',
+        'dbr:B_(c)', 'dbr:St.', 'dbp:length', 'select', 'where', 'filter', '_oba_', '_obd_', 'var_b', '||', '=', '1']
+
+
+def check_against_baseline(query: str) -> None:
+    # the original chain raised an IndexError on a query ending with a single &, escape_query escapes it
+    try:
+        expected = baseline.escape_query(query)
+    except IndexError:
+        assert query.endswith('&')
+        escape_query(query)
+        return
+    except Exception as error:
+        with pytest.raises(type(error)):
+            escape_query(query)
+        return
+
+    assert escape_query(query) == expected, query
+    assert escape_query_sequential(query) == expected, query
+
+
+@pytest.mark.parametrize('sparql_path', SPARQL_SAMPLES)
+def test_escape_matches_original_chain_on_samples(sparql_path):
+    with open(os.path.join(DATA_DIR, sparql_path), 'r', encoding='utf-8') as f:
+        queries = f.read().splitlines()
+
+    for query in PURE_SPARQL_DECODER.convert_many(queries):
+        check_against_baseline(query)
+
+
+def test_escape_matches_original_chain_on_random_queries():
+    rng = random.Random(0)
+    for _ in range(30000):
+        query = ''.join(rng.choice(SOUP) + rng.choice(['', '', ' ']) for _ in range(rng.randint(1, 15)))
+        check_against_baseline(query)
+
+
+@pytest.mark.parametrize('query', ['a+b+c', '+a+b', 'a*b*', '*a', 'a & b && c', '&a & b', 'a&&&b', 'a & b &c', '', 'abc'])
+def test_escape_helpers_match_original_loops(query):
+    assert escape_plus(query) == baseline.escape_plus(query)
+    assert escape_star(query) == baseline.escape_star(query)
+    assert escape_ampersands(query) == baseline.escape_ampersands(query)
+
+
+def test_trailing_ampersand_is_escaped():
+    with pytest.raises(IndexError):
+        baseline.escape_ampersands('a &')
+    assert escape_ampersands('a &') == 'a \\&'
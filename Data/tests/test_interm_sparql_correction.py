@@ -0,0 +1,51 @@
+import os
+import random
+
+import pytest
+
+import baseline
+from common.interm_sparql_correction import correct_interm_sparql
+from conftest import DATA_DIR
+
+SPARQL_SAMPLES = ['raw_data/Monument/base/data.sparql', 'raw_data/Monument/50/data.sparql', 'raw_data/Monument/80/data.sparql',
+                  'raw_data/LC-QuAD/tntspa/train.sparql', 'raw_data/LC-QuAD/tntspa/test.sparql']
+
+QUERIES = [
+    'ask where brack_open dbr_Carew_Cross rdf_type dbo_Place brack_close',
+    'select var_a where brack_open var_a dbp_height var_b sep_dot FILTER par_open var_a = dbr_Tomb_of_Payava || var_a = dbr_Ranevskaya_Monument par_close  brack_close order by var_b limit 1',
+    'SELECT DISTINCT COUNT par_open var_uri par_close WHERE brack_open var_uri <dbo_director> <dbr_Stanley_Kubrick> sep_dot brack_close',
+    'select var_x where brack_open dbr_Saint_Louis_Cathedral_attr_open_New_Orleans_attr_close dbp_location var_x brack_close',
+    'select var_uri where brack_open var_uri dbo_author dbr_Washington_Irving. var_uri dbo_genre dbr_Horror_fiction. brack_close',
+    'select var_uri where brack_open dbr_Hop. var_uri. dbr_Dept. dbr_Co_Ltd. dbr_Lorem_Ipsum. brack_close',
+    'select var_a where brack_open var_a dbo_height var_b filter par_open regex par_open var_b, \'^1\', \'i\' par_close par_close brack_close',
+    'select var_a where brack_open var_a dbo_height var_b FILTER par_open var_bmath_gt10 par_close brack_close',
+    'select var_a where brack_openvar_a dbp_lengthvar_b brack_close ORDER BY DESC par_open var_b par_close',
+    'select var_a where brack_open var_a dbo_x dbr_The_%3F_Mark UNION brack_open var_a dbo_y dbr_Who%3F brack_close brack_close',
+    'select var_a where brack_open var_a\tdbo_x\n dbr_A-B_c-d_attr_open_x_attr_close',
+    'select var_a where brack_open var_a dbo_x dbr_Ends_Here.',
+    '',
+]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_correct_interm_sparql_matches_regex_chain(query):
+    assert correct_interm_sparql(query) == baseline.correct_interm_sparql(query)
+
+
+@pytest.mark.parametrize('sparql_path', SPARQL_SAMPLES)
+def test_correct_interm_sparql_matches_regex_chain_on_samples(sparql_path):
+    with open(os.path.join(DATA_DIR, sparql_path), 'r', encoding='utf-8') as f:
+        queries = f.read().splitlines()
+
+    assert [correct_interm_sparql(q) for q in queries] == [baseline.correct_interm_sparql(q) for q in queries]
+
+
+def test_correct_interm_sparql_matches_regex_chain_on_random_queries():
+    # few pieces per query, the regex chain backtracks exponentially on long unterminated resources
+    pieces = ['select', 'var_a', 'var_uri.', 'where', 'brack_open', 'brack_close', 'dbp_length', 'dbr_A_b', 'dbr_Co.', 'dbo_x_y.',
+              'attr_open', 'attr_close', 'par_open', 'par_close', 'FILTER', 'COUNT', 'UNION', 'regex', "'", ',', 'math_gt',
+              '%3F', 'sep_dot', '.', '_', '-', '1.', ' ', '  ', '\n']
+    rng = random.Random(0)
+    for _ in range(5000):
+        query = ''.join(rng.choice(pieces) + rng.choice(['', ' ']) for _ in range(rng.randint(1, 10)))
+        assert correct_interm_sparql(query) == baseline.correct_interm_sparql(query), query
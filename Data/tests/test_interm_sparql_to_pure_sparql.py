@@ -0,0 +1,44 @@
+import os
+import random
+
+import pytest
+
+import baseline
+from common.interm_sparql_correction import correct_interm_sparql
+from common.interm_sparql_to_pure_sparql import PURE_SPARQL_DECODER, interm_sparql_to_pure_sparql, interm_sparql_to_pure_sparql_sequential
+from conftest import DATA_DIR
+from test_interm_sparql_correction import QUERIES, SPARQL_SAMPLES
+
+
+@pytest.mark.parametrize('query', QUERIES + [
+    'select var_a where brack_open var_a dbo_height var_b brack_close _obd_ var_b limit 1',
+    'select var_a where brack_open var_a dbo_height var_b brack_close _oba_ var_b',
+    'select var_a where brack_open dbr_Who_is_var_x dbo_author var_a sep_dot brack_close',
+    'select var_a where brack_open var_a geo_lat var_b sep_dot FILTER par_open var_b math_geq 10 par_close brack_close',
+    'select wildcard where brack_open dbr_A_attr_open_b_attr_close  dbp_x  dbr_C attr_dot D brack_close',
+    'ask where brack_open <dbr_Stanley_Kubrick> <rdf_type> <dbo_Person> brack_close %3F',
+    'select var_a where brack_open  var_a   dbo_x\tdbr_Y\nsep_dot brack_close',
+])
+def test_decoder_matches_sequential_replacements(query):
+    expected = baseline.interm_sparql_to_pure_sparql(query)
+    assert interm_sparql_to_pure_sparql(query) == expected
+    assert interm_sparql_to_pure_sparql_sequential(query) == expected
+
+
+@pytest.mark.parametrize('sparql_path', SPARQL_SAMPLES)
+def test_decoder_matches_sequential_replacements_on_samples(sparql_path):
+    with open(os.path.join(DATA_DIR, sparql_path), 'r', encoding='utf-8') as f:
+        queries = f.read().splitlines()
+    queries += [correct_interm_sparql(q) for q in queries]
+
+    assert PURE_SPARQL_DECODER.convert_many(queries) == [baseline.interm_sparql_to_pure_sparql(q) for q in queries]
+
+
+def test_decoder_matches_sequential_replacements_on_random_queries():
+    pieces = ['select', 'var_a', 'where', 'brack_open', 'brack_close', 'dbr_A_b', 'dbo_x', 'dbp_length', 'geo_', 'rdf_type',
+              'attr_open', 'attr_close', 'par_open', 'par_close', 'sparql_open', 'sep_dot', 'attr_dot', 'wildcard', 'math_lt',
+              '_oba_', '_obd_', '%3F', 'FILTER', 'COUNT', 'UNION', '?', '.', '\\', '|', '}', ' ', '  ', '\n']
+    rng = random.Random(0)
+    for _ in range(20000):
+        query = ''.join(rng.choice(pieces) + rng.choice(['', ' ']) for _ in range(rng.randint(1, 12)))
+        assert interm_sparql_to_pure_sparql(query) == baseline.interm_sparql_to_pure_sparql(query), query
@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from common.kb_edit_distance import KBInterner, edit_distance, edit_distances, entry_edit_distances
+
+
+def random_pairs(seed, n_pairs, max_len, n_ids):
+    rng = random.Random(seed)
+    return [([rng.randrange(n_ids) for _ in range(rng.randint(0, max_len))], [rng.randrange(n_ids) for _ in range(rng.randint(0, max_len))])
+            for _ in range(n_pairs)]
+
+
+# empty sequences, only one side empty, identical and disjoint sequences, a single element
+EDGE_PAIRS = [([], []), ([], [1, 2, 3]), ([4, 5], []), ([1, 2, 3], [1, 2, 3]), ([1, 2], [3, 4, 5]), ([7], [7]), ([7], [8]),
+              ([1, 2, 3, 4], [2, 3, 4, 1]), ([1, 1, 1, 1, 1], [1])]
+
+
+def test_edge_pairs_match_edit_distance():
+    assert list(edit_distances(EDGE_PAIRS)) == [edit_distance(a, b) for a, b in EDGE_PAIRS]
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 3, 7, 64, 4096])
+def test_batched_distances_match_edit_distance(batch_size):
+    # small alphabets so that the sequences share elements and the insertions, deletions and substitutions all count
+    pairs = EDGE_PAIRS + random_pairs(batch_size, 300, 15, 4) + random_pairs(batch_size + 1, 100, 40, 30)
+    random.Random(0).shuffle(pairs)
+    assert list(edit_distances(pairs, batch_size)) == [edit_distance(a, b) for a, b in pairs]
+
+
+def test_only_empty_sequences():
+    assert list(edit_distances([([], [])] * 5, 3)) == [0] * 5
+
+
+def test_entry_edit_distances():
+    entries = [{'trg': 'select var_x where brack_open var_x dbo_a dbr_B brack_close', 'predicted': 'select dbo_a dbr_C'},
+               {'trg': 'ask where brack_open dbr_A dbo_b dbr_C brack_close', 'predicted': 'ask'}]
+    assert entry_edit_distances(entries, KBInterner(), batch_size=1) == [(1, 4), (3, 3)]
+    assert entry_edit_distances([], KBInterner()) == []
@@ -0,0 +1,96 @@
+import re
+import time
+
+import pytest
+
+from common import query_cache
+from common.query_batcher import run_batched
+from common.query_cache import QueryCache, open_cache
+
+QUERIES = [f'select ?x where {{ ?x dbo:country dbr:Country_{i} }}' for i in range(3)]
+
+
+def answer_batches(calls):
+    # each member of a batch gets one binding with its slot value
+    def run(queries):
+        calls.append(queries)
+        return [{'head': {'vars': ['x', '__batch']},
+                 'results': {'bindings': [{'__batch': {'type': 'literal', 'value': i}, 'x': {'type': 'uri', 'value': value}}
+                                          for i, value in re.findall(r'\( (\d+) (\S+) \)', query)]}}
+                for query in queries]
+    return run
+
+
+def answer_alone(calls):
+    def run(queries):
+        calls.append(queries)
+        return [{'head': {'vars': ['x']}, 'results': {'bindings': [{'x': {'type': 'uri', 'value': query.split()[-2]}}]}}
+                for query in queries]
+    return run
+
+
+def test_batched_results_are_cached_per_member_query(tmp_path):
+    cache = QueryCache(str(tmp_path / 'cache.sqlite'))
+    batch_calls, single_calls = [], []
+
+    results = run_batched(QUERIES, answer_alone(single_calls), cache=cache, endpoint='e', run_batches=answer_batches(batch_calls))
+    assert len(batch_calls) == 1 and len(batch_calls[0]) == 1 and single_calls == []
+    assert [r['results']['bindings'][0]['x']['value'] for r in results] == [f'dbr:Country_{i}' for i in range(3)]
+    assert [cache.get(q, 'e') for q in QUERIES] == results
+    assert len(cache) == 3
+
+    # the cached queries are sent alone, for the executor to find them in the cache
+    batch_calls.clear()
+    run_batched(QUERIES, answer_alone(single_calls), cache=cache, endpoint='e', run_batches=answer_batches(batch_calls))
+    assert batch_calls == [] and single_calls == [QUERIES]
+
+    # unless the cache is refreshed
+    single_calls.clear()
+    run_batched(QUERIES, answer_alone(single_calls), cache=cache, endpoint='e', refresh=True, run_batches=answer_batches(batch_calls))
+    assert len(batch_calls) == 1 and single_calls == []
+
+
+def test_expired_entries_are_missing(tmp_path, monkeypatch):
+    cache = QueryCache(str(tmp_path / 'cache.sqlite'), ttl=10)
+    cache.put(QUERIES[0], 'e', {'boolean': True})
+    assert cache.contains(QUERIES[0], 'e')
+
+    now = time.time()
+    monkeypatch.setattr(query_cache.time, 'time', lambda: now + 11)
+    assert not cache.contains(QUERIES[0], 'e')
+    assert cache.get(QUERIES[0], 'e') is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = QueryCache(str(tmp_path / 'cache.sqlite'), max_entries=2)
+    for query in QUERIES[:2]:
+        cache.put(query, 'e', {'boolean': True})
+        time.sleep(0.01)
+    cache.get(QUERIES[0], 'e')
+    time.sleep(0.01)
+    cache.put(QUERIES[2], 'e', {'boolean': False})
+
+    assert len(cache) == 2
+    assert cache.contains(QUERIES[0], 'e') and not cache.contains(QUERIES[1], 'e')
+
+
+def test_open_cache_passes_ttl_and_max_entries(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = open_cache(path, ttl=60, max_entries=100)
+    assert (cache.ttl, cache.max_entries) == (60, 100)
+
+    # the cache opened again by a report keeps them
+    assert open_cache(path) is cache
+    assert (cache.ttl, cache.max_entries) == (60, 100)
+    cache.close()
+    del query_cache._OPEN_CACHES[path]
+
+
+def test_missing_result_is_an_error():
+    # a run giving fewer results than queries must not shift the results of the other queries
+    def run_some(queries):
+        return answer_alone([])(queries[1:])
+
+    with pytest.raises(ValueError, match='No result for 1 of 3 queries'):
+        run_batched(QUERIES, run_some, max_batch=1)
@@ -0,0 +1,124 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from common.query_cache import QueryCache
+from common.query_executor import USER_AGENT, ConnectionPool, PooledRequest, QueryExecutor
+from common.query_retry import HTTPError
+from common.sparql_mock_server import MockSparqlServer
+
+
+def test_aborted_query_gives_its_connection_back():
+    server = MockSparqlServer(latency=0.0, timeout_rate=1.0, hang=5.0).start()
+    pool = ConnectionPool(server.endpoint, size=1, timeout=30.0)
+    request = PooledRequest()
+    errors = []
+
+    def send():
+        try:
+            pool.query('select ?x where { ?x ?p ?o }', request)
+        except Exception as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=send)
+    thread.start()
+    time.sleep(0.2)
+    start = time.perf_counter()
+    request.abort()
+    thread.join(2.0)
+
+    # the thread is not blocked until the server or the socket times out, and a new connection is in the pool
+    assert not thread.is_alive() and time.perf_counter() - start < 1.0
+    assert len(errors) == 1
+    assert pool.connections.qsize() == 1
+    pool.close()
+    server.stop()
+
+
+def test_timed_out_queries_do_not_starve_the_pool():
+    # the server hangs longer than the timeout and the socket timeout is longer than the hang, the threads of the timed
+    # out queries are only freed (and the executor closed) before the server gives up if the queries were aborted
+    server = MockSparqlServer(latency=0.0, timeout_rate=1.0, hang=3.0).start()
+    executor = QueryExecutor(server.endpoint, concurrency=2, timeout=0.3)
+    executor.pool.timeout = 30.0
+    executor.pool.connections.queue.clear()
+    for _ in range(2):
+        executor.pool.connections.put(executor.pool._connect())
+
+    start = time.perf_counter()
+    results = executor.run([f'select ?x where {{ ?x ?p {i} }}' for i in range(6)])
+    executor.close()
+    elapsed = time.perf_counter() - start
+    server.stop()
+
+    assert all(isinstance(result, TimeoutError) for result in results)
+    assert elapsed < 2.0
+
+
+def test_cache_is_used_outside_of_the_event_loop_thread(tmp_path):
+    server = MockSparqlServer(latency=0.0).start()
+    cache = QueryCache(str(tmp_path / 'cache.sqlite'))
+    threads = set()
+    get, put = cache.get, cache.put
+    cache.get = lambda *args: threads.add(threading.current_thread()) or get(*args)
+    cache.put = lambda *args: threads.add(threading.current_thread()) or put(*args)
+
+    executor = QueryExecutor(server.endpoint, concurrency=2, cache=cache)
+    queries = [f'select ?x where {{ ?x ?p {i} }}' for i in range(4)]
+    first = executor.run(queries)
+    assert executor.run(queries) == first
+    executor.close()
+    server.stop()
+
+    assert cache.hits == 4
+    assert threads and threading.main_thread() not in threads
+
+
+def redirect_server(location):
+    # answers every request with a 301 to location, keeping the path and parameters, and records the user agents
+    agents = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            agents.append(self.headers.get('User-Agent'))
+            self.send_response(301)
+            self.send_header('Location', location + self.path[len('/sparql'):])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/sparql', agents
+
+
+def test_redirects_are_followed_by_the_pool():
+    target = MockSparqlServer(latency=0.0).start()
+    server, endpoint, agents = redirect_server(target.endpoint)
+    pool = ConnectionPool(endpoint, size=2, timeout=5.0)
+
+    for i in range(3):
+        assert 'results' in pool.query(f'select ?x where {{ ?x ?p {i} }}')
+    # only the first query went through the redirect, the next ones were sent to its location
+    assert agents == [USER_AGENT]
+    assert pool.endpoint == target.endpoint and target.counts['ok'] == 3
+
+    pool.close()
+    server.shutdown()
+    target.stop()
+
+
+def test_redirect_loop_fails_with_a_clear_error():
+    # a relative location to the same path, the server redirects to itself
+    server, endpoint, agents = redirect_server('')
+    pool = ConnectionPool(endpoint, size=1, timeout=5.0)
+
+    with pytest.raises(HTTPError, match='cannot follow the redirect'):
+        pool.query('select ?x where { ?x ?p ?o }')
+    assert len(agents) == 6
+    pool.close()
+    server.shutdown()
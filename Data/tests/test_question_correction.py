@@ -0,0 +1,63 @@
+import os
+import random
+
+import pytest
+
+from common.consts import QUESTION_REPLACEMENTS
+from common.question_correction import QUESTION_TYPOS, ReplacementTable, SymSpellCorrector, resource_words
+from conftest import DATA_DIR
+
+NL_SAMPLES = ['raw_data/Monument/base/data.en', 'raw_data/LC-QuAD/tntspa/train.en', 'raw_data/LC-QuAD/tntspa/test.en']
+
+
+@pytest.mark.parametrize('question', [
+    'what is the place of birth of joesph ?',
+    'who is the author od form the sandman ?',
+    'who was the architect od from the palace od form ?',
+    'is the castillo od the wasthe the same ?',
+    'which palce palce is whihc ?',
+    'where is < http://dbpedia.org/resource/werner_heisenberg buried ?',
+    'what is the \\"name\\" od the aldo aldo firt ?',
+    'placemplyer wasthewasthe od od od form form ',
+])
+def test_apply_matches_sequential_replacements(question):
+    assert QUESTION_TYPOS.apply(question) == QUESTION_TYPOS.apply_sequential(question)
+
+
+@pytest.mark.parametrize('nl_path', NL_SAMPLES)
+def test_apply_matches_sequential_replacements_on_samples(nl_path):
+    with open(os.path.join(DATA_DIR, nl_path), 'r', encoding='utf-8') as f:
+        questions = [q.lower().strip() for q in f.read().splitlines()]
+
+    assert [QUESTION_TYPOS.apply(q) for q in questions] == [QUESTION_TYPOS.apply_sequential(q) for q in questions]
+
+
+def test_apply_matches_sequential_replacements_on_typo_soup():
+    # questions glued from the typos, their replacements and pieces of them, where the order of the replacements matters
+    pieces = sorted({piece for r in QUESTION_REPLACEMENTS for text in r for piece in (text, text[:3], text[-3:])} | {' ', 'e', 'o'})
+    rng = random.Random(0)
+    for _ in range(20000):
+        question = ''.join(rng.choice(pieces) for _ in range(rng.randint(1, 8)))
+        assert QUESTION_TYPOS.apply(question) == QUESTION_TYPOS.apply_sequential(question), question
+
+
+def test_order_dependent_typos_are_chained():
+    table = ReplacementTable([['ab', 'x'], ['cd', 'y'], ['xc', 'z'], ['bc', 'w']])
+    assert table.lookup == {'ab': 'x', 'cd': 'y'}
+    assert table.chained == [('xc', 'z'), ('bc', 'w')]
+    for text in ['abcd', 'abxcd', 'xcd', 'abc', 'bcd']:
+        assert table.apply(text) == table.apply_sequential(text), text
+
+
+def test_resource_words_are_not_corrected():
+    corrector = SymSpellCorrector()
+    for word, count in [('carew', 1), ('cross', 5), ('crew', 40), ('place', 30), ('is', 50), ('a', 50)]:
+        corrector.add_word(word, count)
+
+    question = 'is carow cross a plase'
+    assert corrector.correct(question) == 'is carew cross a place'
+    assert corrector.correct('is crow cross a place') == 'is crew cross a place'
+
+    query = 'ask where brack_open dbr_Crow_Cross rdf_type dbo_Place brack_close'
+    assert resource_words(query) == {'crow', 'cross', 'place'}
+    assert corrector.correct('is crow cross a plase', resource_words(query)) == 'is crow cross a place'
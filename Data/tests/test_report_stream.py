@@ -0,0 +1,43 @@
+import io
+import json
+import random
+
+import pytest
+
+import common.report_stream as report_stream
+from common.report_stream import iter_chunks, iter_json_array
+
+
+ARRAYS = ['[12345, 678]', '[true, 1e10]', '[-0.5e-3,1.25E+2 ,null,false]', '["abc\\"def", "", "\\u00e9t\\u00e9"]',
+          '[{"a": [1, 2, {"b": "]"}], "c": 3.5}, [], {}, [[123456789]]]', '[]', ' \n[ 1 ]\n', '[0]',
+          '[{"question": "who?", "sparql": "select ?x where { ?x a dbo:City }"}, 42, "x"]']
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 3, 5, 1 << 16])
+@pytest.mark.parametrize('text', ARRAYS)
+def test_elements_split_by_the_buffer(monkeypatch, read_size, text):
+    monkeypatch.setattr(report_stream, 'READ_SIZE', read_size)
+    assert list(iter_json_array(io.StringIO(text))) == json.loads(text)
+
+
+def test_random_arrays(monkeypatch):
+    rng = random.Random(0)
+    scalars = [0, 7, -12, 123456, 3.25, -1e-07, 6.02e+23, True, False, None, '', 'a b', 'x, y]', 'é']
+    for _ in range(200):
+        elements = [rng.choice(scalars) if rng.random() < 0.7 else {'k': rng.choice(scalars), 'l': [rng.choice(scalars)]}
+                    for _ in range(rng.randint(0, 8))]
+        text = json.dumps(elements, indent=rng.choice([None, 2]))
+        monkeypatch.setattr(report_stream, 'READ_SIZE', rng.randint(1, 7))
+        assert list(iter_json_array(io.StringIO(text))) == elements
+
+
+@pytest.mark.parametrize('text', ['[1, 2', '[12', '[true', '["abc', '{"a": 1}', '[1x]'])
+def test_invalid_arrays(monkeypatch, text):
+    monkeypatch.setattr(report_stream, 'READ_SIZE', 2)
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text)))
+
+
+def test_iter_chunks():
+    assert list(iter_chunks(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(iter_chunks([], 3)) == []
@@ -0,0 +1,63 @@
+import os
+import random
+import time
+
+import pytest
+
+import baseline
+from common.consts import GET_RESOURCES_INTERM_SPARQL_RE
+from common.interm_sparql_correction import correct_interm_sparql
+from common.re_callbacks import abstract_resources
+from common.resource_lexer import adversarial_queries, findall_interm_sparql_resources, sub_interm_sparql_resources
+from conftest import DATA_DIR
+from test_interm_sparql_correction import QUERIES, SPARQL_SAMPLES
+
+
+def regex_findall(interm_sparql):
+    return [parts[0] for parts in GET_RESOURCES_INTERM_SPARQL_RE.findall(interm_sparql)]
+
+
+def assert_same_as_regex(query):
+    assert findall_interm_sparql_resources(query) == regex_findall(query), query
+    for repl in (baseline.correct_sep_dots, abstract_resources):
+        assert sub_interm_sparql_resources(repl, query) == GET_RESOURCES_INTERM_SPARQL_RE.sub(repl, query), query
+
+
+@pytest.mark.parametrize('query', QUERIES + [
+    'select var_a where brack_open var_a dbo_x dbr_A_attr_open_B_attr_close_C. brack_close',
+    'dbr_A,_b-c_d attr_open e attr_close ',
+    'dbr_a attr_open dbo_b attr_close dbr_c?',
+    'brack_open dbr_A brack_closedbr_B brack_close',
+])
+def test_lexer_matches_regex(query):
+    assert_same_as_regex(query)
+
+
+@pytest.mark.parametrize('sparql_path', SPARQL_SAMPLES)
+def test_lexer_matches_regex_on_samples(sparql_path):
+    # the callers get raw queries (extract_templates) and corrected ones (DBNQA, correct_interm_sparql)
+    with open(os.path.join(DATA_DIR, sparql_path), 'r', encoding='utf-8') as f:
+        queries = f.read().splitlines()
+
+    for query in queries + [correct_interm_sparql(q) for q in queries]:
+        assert_same_as_regex(query)
+
+
+def test_lexer_matches_regex_on_random_queries():
+    # few pieces per query, the regex backtracks exponentially on unterminated resources
+    pieces = ['dbr_', 'dbo_', 'a', 'B.', '_', '-', ',', '?', '.', ' ', '  ', '\n', 'attr_open', 'attr_close', 'par_open',
+              'par_close', 'brack_close', 'db', '^', '[']
+    rng = random.Random(0)
+    for _ in range(20000):
+        assert_same_as_regex(''.join(rng.choice(pieces) for _ in range(rng.randint(1, 8))))
+
+
+def test_lexer_is_linear_on_adversarial_queries():
+    for query in adversarial_queries(2).values():
+        assert_same_as_regex(query)
+
+    # the regex takes seconds past a few segments, the lexer goes through 10000 of them
+    start = time.perf_counter()
+    for query in adversarial_queries(10000).values():
+        findall_interm_sparql_resources(query)
+    assert time.perf_counter() - start < 5
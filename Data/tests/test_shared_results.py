@@ -0,0 +1,55 @@
+import threading
+
+from common.shared_results import SharedResults
+
+
+def test_result_is_dropped_after_the_last_report_needing_it():
+    shared = SharedResults()
+    shared.register('a', ['q1', 'q2'])
+    shared.register('b', ['q1'])
+    shared.register('c', ['q1'])
+
+    claimed, waited = shared.claim('a', ['q1', 'q2'])
+    assert claimed == ['q1', 'q2'] and waited == []
+    shared.publish('a', 'q1', {'r': 1})
+    shared.publish('a', 'q2', {'r': 2})
+    # only a needs q2, it is not kept
+    assert set(shared.results) == {'q1'}
+
+    assert shared.claim('b', ['q1']) == ([], ['q1'])
+    assert shared.wait('b', 'q1') == {'r': 1}
+    assert 'q1' in shared.results
+
+    assert shared.claim('c', ['q1']) == ([], ['q1'])
+    assert shared.wait('c', 'q1') == {'r': 1}
+    assert shared.results == {} and shared.readers == {}
+
+
+def test_reading_twice_does_not_count_for_another_report():
+    shared = SharedResults()
+    shared.register('a', ['q1'])
+    shared.register('b', ['q1'])
+
+    shared.claim('a', ['q1'])
+    shared.publish('a', 'q1', {'r': 1})
+    shared.claim('a', ['q1'])
+    shared.wait('a', 'q1')
+    assert 'q1' in shared.results
+
+    shared.release('b', ['q1'])
+    assert shared.results == {}
+
+
+def test_waiting_report_gets_the_result_published_later():
+    shared = SharedResults()
+    shared.register('a', ['q1'])
+    shared.register('b', ['q1'])
+    shared.claim('a', ['q1'])
+    assert shared.claim('b', ['q1']) == ([], ['q1'])
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(shared.wait('b', 'q1')))
+    waiter.start()
+    shared.publish('a', 'q1', {'r': 1})
+    waiter.join(5)
+    assert results == [{'r': 1}] and shared.results == {}
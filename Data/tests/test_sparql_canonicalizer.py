@@ -0,0 +1,18 @@
+from common.sparql_canonicalizer import canonicalize_sparql, tokenize_sparql
+
+
+def test_single_quoted_literal_is_one_token():
+    assert tokenize_sparql("select ?x where { ?x rdfs:label 'a  b: c'@en }") == \
+        ['select', '?x', 'where', '{', '?x', 'rdfs:label', '"a  b: c"@en', '}']
+
+
+def test_single_quoted_literal_keeps_its_whitespace():
+    assert canonicalize_sparql("SELECT ?x WHERE { ?x rdfs:label 'a  b' }") != \
+        canonicalize_sparql("SELECT ?x WHERE { ?x rdfs:label 'a b' }")
+
+
+def test_quote_character_does_not_change_the_literal():
+    assert canonicalize_sparql("SELECT ?x WHERE { ?x rdfs:label 'a b'@en }") == \
+        canonicalize_sparql('SELECT ?x WHERE { ?x rdfs:label "a b"@en }')
+    assert canonicalize_sparql("SELECT ?x WHERE { ?x rdfs:label 'it\\'s \"a\"' }") == \
+        canonicalize_sparql('SELECT ?x WHERE { ?x rdfs:label "it\'s \\"a\\"" }')
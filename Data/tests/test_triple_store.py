@@ -0,0 +1,101 @@
+import pytest
+
+from common.triple_store import TripleStore
+
+DBR = 'http://dbpedia.org/resource/'
+DBO = 'http://dbpedia.org/ontology/'
+
+
+def make_store() -> TripleStore:
+    store = TripleStore()
+    for s, p, o in (('A', 'author', 'B'), ('A', 'spouse', 'C'), ('D', 'author', 'E')):
+        store.add(('uri', DBR + s), ('uri', DBO + p), ('uri', DBR + o))
+    return store
+
+
+def subjects(result) -> list:
+    return sorted(binding['x']['value'][len(DBR):] for binding in result['results']['bindings'])
+
+
+def test_optional_before_a_triple_pattern_binds_first():
+    # the optional is matched against the empty solution, the triple pattern then only keeps its ?x
+    store = make_store()
+    assert subjects(store.query('SELECT ?x WHERE { OPTIONAL { ?x dbo:spouse ?y } ?x dbo:author ?z }')) == ['A']
+    assert subjects(store.query('SELECT ?x WHERE { ?x dbo:author ?z OPTIONAL { ?x dbo:spouse ?y } }')) == ['A', 'D']
+
+
+def test_minus_only_removes_what_was_matched_before_it():
+    store = make_store()
+    assert subjects(store.query('SELECT ?x WHERE { ?x dbo:author ?z MINUS { ?x dbo:spouse ?y } }')) == ['D']
+    assert subjects(store.query('SELECT ?x WHERE { MINUS { ?x dbo:spouse ?y } ?x dbo:author ?z }')) == ['A', 'D']
+
+
+TURTLE = """@prefix dbo: <http://dbpedia.org/ontology/> .
+@prefix dbr: <http://dbpedia.org/resource/> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+dbr:Eiffel_Tower a dbo:Building ; dbo:height 300 ; dbo:location dbr:Paris ;
+    rdfs:label "Eiffel Tower"@en , "Tour Eiffel"@fr , "Eiffelturm"@de .
+dbr:Big_Ben a dbo:Building ; dbo:height 96 ; dbo:location dbr:London ; rdfs:label "Big Ben"@en-GB .
+dbr:Tower_Bridge a dbo:Bridge ; dbo:height 65 ; dbo:location dbr:London ; rdfs:label "Tower Bridge"@eng .
+dbr:Louvre a dbo:Museum ; dbo:location dbr:Paris .
+"""
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory):
+    path = tmp_path_factory.mktemp('dump') / 'monuments.ttl'
+    path.write_text(TURTLE, encoding='utf-8')
+    return TripleStore.from_files([str(path)])
+
+
+def values(result, var):
+    return [binding[var]['value'].rsplit('/', 1)[-1] for binding in result['results']['bindings']]
+
+
+def test_select(store):
+    result = store.query('SELECT ?x WHERE { ?x dbo:location dbr:London }')
+    assert result['head']['vars'] == ['x']
+    assert sorted(values(result, 'x')) == ['Big_Ben', 'Tower_Bridge']
+
+
+def test_ask(store):
+    assert store.query('ASK WHERE { dbr:Louvre a dbo:Museum }')['boolean'] is True
+    assert store.query('ASK WHERE { dbr:Louvre a dbo:Bridge }')['boolean'] is False
+
+
+def test_count(store):
+    result = store.query('SELECT (COUNT(DISTINCT ?x) AS ?n) WHERE { ?x a dbo:Building }')
+    assert result['results']['bindings'] == [
+        {'n': {'type': 'typed-literal', 'datatype': 'http://www.w3.org/2001/XMLSchema#integer', 'value': '2'}}]
+    assert values(store.query('SELECT COUNT(?x) WHERE { ?x a dbo:Castle }'), 'callret-0') == ['0']
+
+
+def test_filter(store):
+    # a space before the ) as in the queries of the datasets, a prefixed name can hold unescaped parentheses
+    result = store.query('SELECT ?x WHERE { ?x dbo:height ?h . FILTER (?h > 90 && ?x != dbr:Eiffel_Tower ) }')
+    assert values(result, 'x') == ['Big_Ben']
+    result = store.query('SELECT ?x WHERE { ?x dbo:location dbr:Paris OPTIONAL { ?x dbo:height ?h } FILTER (!bound(?h)) }')
+    assert values(result, 'x') == ['Louvre']
+
+
+@pytest.mark.parametrize('language_range, expected', [('en', ['Big_Ben', 'Eiffel_Tower']), ('en-gb', ['Big_Ben']),
+                                                      ('*', ['Big_Ben', 'Eiffel_Tower', 'Eiffel_Tower', 'Eiffel_Tower', 'Tower_Bridge']),
+                                                      ('de', ['Eiffel_Tower'])])
+def test_lang_matches(store, language_range, expected):
+    # "eng" is not an "en" tag, "en-GB" is
+    result = store.query(f'SELECT ?x WHERE {{ ?x rdfs:label ?l . FILTER (langMatches(lang(?l), "{language_range}")) }}')
+    assert sorted(values(result, 'x')) == expected
+
+
+def test_order_by_and_limit(store):
+    result = store.query('SELECT ?x WHERE { ?x dbo:height ?h } ORDER BY DESC(?h) LIMIT 2')
+    assert values(result, 'x') == ['Eiffel_Tower', 'Big_Ben']
+    result = store.query('SELECT ?x ?h WHERE { ?x dbo:height ?h } ORDER BY ?h LIMIT 1 OFFSET 1')
+    assert values(result, 'x') == ['Big_Ben']
+
+
+def test_group_by(store):
+    result = store.query('SELECT ?c (COUNT(?x) AS ?n) WHERE { ?x dbo:location ?c } GROUP BY ?c ORDER BY ?c')
+    assert [(b['c']['value'].rsplit('/', 1)[-1], b['n']['value']) for b in result['results']['bindings']] == \
+        [('London', '2'), ('Paris', '2')]